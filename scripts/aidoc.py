@@ -0,0 +1,181 @@
+"""Unified command line for the AIDOC-AP alignment, coverage and curation toolchain.
+
+Every command runs one script of this directory exactly as
+`python scripts/<script>.py [args...]` would. The script, and with it
+pandas, rdflib or openai, is only loaded when its command runs, so
+`aidoc.py --help` and the dispatch itself cost no more than the interpreter
+start. `<command> --help` prints the script's own help; for scripts without
+command-line options it prints their description instead of running them.
+
+`startup` measures the cold-start latency of every command (a fresh
+interpreter running `<command> --help`, and importing the script where that
+is side-effect free) and writes it to reports/aidoc_startup.csv.
+
+Usage:
+    python scripts/aidoc.py --help
+    python scripts/aidoc.py structural --threshold 0.6 --jobs 4
+    python scripts/aidoc.py fn-band --dry-run
+    python scripts/aidoc.py startup [--repeat 5]
+"""
+
+import argparse
+import ast
+import csv
+import os
+import runpy
+import statistics
+import subprocess
+import sys
+import time
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+STARTUP_REPORT = "reports/aidoc_startup.csv"
+# calls a top-level assignment may make and still only define a constant
+PURE_CALLS = {"os.getenv", "int", "float", "str", "len", "Path", "re.compile", "Namespace",
+              "URIRef", "os.path.join", "os.path.dirname", "os.path.abspath"}
+PURE_METHODS = {"strip", "split", "lower"}
+
+# command -> (script, has its own argparse options, summary)
+COMMANDS = {
+    "extract": ("extract_entities", False, "AIDOC entity catalogue (reports/aidoc-entities.csv)"),
+    "structural": ("alignment_structural", True, "lexical alignment candidates"),
+    "semantic": ("alignment_semantic", True, "LLM relation classification of the candidates"),
+    "fn-band": ("alignment_fn_band", True, "false-negative sample below the candidate threshold"),
+    "score-store": ("score_store", True, "persistent similarity store, threshold sweeps"),
+    "entity-store": ("entity_store", True, "indexed entity descriptions"),
+    "llm-cache": ("llm_cache", True, "LLM reply cache statistics"),
+    "llm-pool": ("llm_pool", True, "Ollama hosts, loaded models, model warm-up"),
+    "coverage": ("semantic_mapping", False, "LLM Annex IV coverage evaluation (one run)"),
+    "multirun": ("run_coverage_multirun", False, "coverage experiment matrix"),
+    "cq-validate": ("run_cq_validation", False, "SPARQL competency questions over examples/"),
+    "expert-agreement": ("coverage_expert_agreement", True, "coverage expert-agreement study"),
+    "curate-export": ("export_curation_ui_data", False, "curation UI batches"),
+    "curate-merge": ("merge_curation", False, "3-curator merge, majority vote"),
+    "curate-analyze": ("analyze_curation", False, "curation agreement/precision"),
+    "curate-apply": ("apply_curation_to_ttl", False, "curated alignment TTLs"),
+    "manifest": ("generate_alignment_manifest", False, "alignment manifest for the Pages site"),
+    "export-pages": ("export_pages_data", False, "Pages site data"),
+    "bench-scaling": ("benchmark_scaling", True, "scaling benchmark on synthetic vocabularies"),
+    "llm-standin": ("llm_standin", True, "OpenAI-compatible stand-in LLM server"),
+    "bench-llm": ("benchmark_llm_pipeline", True, "LLM pipeline throughput against the stand-in"),
+    "bench-schema": ("benchmark_llm_schema", True, "free-form vs schema-constrained LLM replies"),
+}
+
+
+def script_path(script):
+    return os.path.join(SCRIPT_DIR, f"{script}.py")
+
+
+def script_docstring(script):
+    with open(script_path(script), encoding="utf-8") as f:
+        return ast.get_docstring(ast.parse(f.read())) or "(no description)"
+
+
+def definition_only(node):
+    """True if a top-level statement only binds names: imports, definitions,
+    the `if __name__ == "__main__"` block, constants (from the environment)."""
+    if isinstance(node, (ast.Import, ast.ImportFrom, ast.FunctionDef, ast.AsyncFunctionDef,
+                         ast.ClassDef)):
+        return True
+    if isinstance(node, ast.If):
+        return "__main__" in ast.unparse(node.test)
+    if isinstance(node, ast.Expr):
+        value = node.value
+        return isinstance(value, ast.Constant) or (
+            isinstance(value, ast.Call) and ast.unparse(value.func) == "load_dotenv")
+    if isinstance(node, (ast.Assign, ast.AnnAssign)):
+        return all(ast.unparse(call.func) in PURE_CALLS
+                   or (isinstance(call.func, ast.Attribute) and call.func.attr in PURE_METHODS)
+                   for call in ast.walk(node) if isinstance(call, ast.Call))
+    return False
+
+
+def import_safe(script):
+    """True if importing the script does none of its work (every top-level
+    statement is definition_only), decided from its source without importing it."""
+    with open(script_path(script), encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    return all(definition_only(node) for node in tree.body)
+
+
+def run_command(command, args):
+    script, has_cli, _ = COMMANDS[command]
+    if not has_cli and ("-h" in args or "--help" in args):
+        print(script_docstring(script))
+        return
+    path = script_path(script)
+    sys.argv = [path] + args
+    sys.path.insert(0, SCRIPT_DIR)
+    runpy.run_path(path, run_name="__main__")
+
+
+def _timed(cmd, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        proc = subprocess.run(cmd, capture_output=True)
+        times.append(time.perf_counter() - t0)
+        if proc.returncode != 0:
+            return None
+    return times
+
+
+def startup_benchmark(repeat, output):
+    python = [sys.executable]
+    baseline = _timed(python + ["-c", "pass"], repeat)
+    rows = [{"command": "(python)", "script": "", "help_median_s": statistics.median(baseline),
+             "help_min_s": min(baseline), "import_median_s": ""}]
+    for command in [None] + list(COMMANDS):
+        script = COMMANDS[command][0] if command else ""
+        help_times = _timed(python + [os.path.abspath(__file__)]
+                            + ([command] if command else []) + ["--help"], repeat)
+        import_times = None
+        if command and import_safe(script):
+            code = f"import sys; sys.path.insert(0, {SCRIPT_DIR!r}); import {script}"
+            import_times = _timed(python + ["-c", code], repeat)
+        rows.append({
+            "command": command or "(aidoc --help)", "script": script,
+            "help_median_s": statistics.median(help_times) if help_times else "",
+            "help_min_s": min(help_times) if help_times else "",
+            "import_median_s": statistics.median(import_times) if import_times else "",
+        })
+
+    for row in rows:
+        for key in ("help_median_s", "help_min_s", "import_median_s"):
+            if row[key] != "":
+                row[key] = round(row[key], 3)
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=rows[0].keys())
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"{'command':18s} {'--help':>8s} {'min':>7s} {'import':>8s}")
+    for row in rows:
+        print(f"{row['command']:18s} {row['help_median_s']:>8} {row['help_min_s']:>7} "
+              f"{row['import_median_s']:>8}")
+    print(f"✅ Startup latency of {len(COMMANDS)} commands (median of {repeat}) → {output}")
+
+
+def main():
+    ap = argparse.ArgumentParser(
+        prog="aidoc", description=__doc__.splitlines()[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="commands:\n" + "\n".join(f"  {name:18s} {summary} ({script}.py)"
+                                          for name, (script, _, summary) in COMMANDS.items())
+        + "\n  startup            cold-start latency per command")
+    ap.add_argument("command", choices=list(COMMANDS) + ["startup"], metavar="command")
+    ap.add_argument("args", nargs=argparse.REMAINDER, help="arguments of the command")
+    args = ap.parse_args()
+
+    if args.command == "startup":
+        sp = argparse.ArgumentParser(prog="aidoc startup")
+        sp.add_argument("--repeat", "-n", type=int, default=5)
+        sp.add_argument("--output", "-o", default=STARTUP_REPORT)
+        opts = sp.parse_args(args.args)
+        startup_benchmark(opts.repeat, opts.output)
+    else:
+        run_command(args.command, args.args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,54 +1,125 @@
-import os
+"""LLM relation classification of the lexical alignment candidates.
+
+Reads the candidate CSVs of alignment_structural.py, asks the LLM for the
+SKOS mapping relation of every AIDOC x reference pair and writes per
+reference ontology a PROV-annotated alignment TTL (mappings at or above
+CONF_THRESHOLD) and a curation sheet with all judgments. Each judgment is
+journaled as it completes (OUTPUT_DIR/journal.jsonl) and the outputs are
+rebuilt from the journal, so an interrupted run can be resumed. Request
+handling (reply cache, streaming, telemetry, retries, adaptive concurrency)
+lives in llm_client.py, llm_pool.py and llm_control.py; the options are
+described in --help.
+
+The module is import-safe: importing it only defines the prompt, the
+parser and classify_pairs(), so other tools (e.g. alignment_fn_band.py)
+reuse the classifier in-process.
+
+Usage:
+    python scripts/alignment_semantic.py [--no-cache] [--concurrency 4] [--batch-size 8]
+    python scripts/alignment_semantic.py --schema compact
+    python scripts/alignment_semantic.py --models gemma3:27b llama3.3:70b gpt-oss:120b -c 4
+    python scripts/alignment_semantic.py --budget-s 3600 --order expected -c 4
+    python scripts/alignment_semantic.py --resume   # continue an interrupted run
+"""
+
+import argparse
+import asyncio
+import datetime
 import json
+import os
 import re
-import datetime
-import time
-import pandas as pd
-from rdflib import Graph, RDFS, Namespace, URIRef, Literal
-from rdflib.namespace import PROV, XSD, OWL, RDF
 import uuid
-from openai import OpenAI
+from collections import Counter
+from typing import NamedTuple
 
 from dotenv import load_dotenv
+
+from llm_client import (LLM_SCHEMA, SCHEMA_MODES, Budget, BudgetExhausted, call_fields,
+                        complete, complete_async, estimate_tokens, expand_reply,
+                        response_format, write_run_metrics)
+from llm_control import CircuitOpen
+
 load_dotenv()
 
 
 AIDOC_FILE = "aidoc-ap.ttl"
+AIDOC_NS = "https://w3id.org/aidoc-ap#"
 REFERENCE_DIR = "reference_ontologies/"
 INPUT_DIR = "reports/alignment_structural"
-os.makedirs("reports/alignment_semantic", exist_ok=True)
 OUTPUT_DIR = "reports/alignment_semantic"
+JOURNAL_FILE = "journal.jsonl"   # in OUTPUT_DIR
+METRICS_FILE = "run_metrics.json"   # in OUTPUT_DIR
 
 OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "gemma3:27b")
-OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434") + "/v1/"
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434")   # comma-separated hosts
 CONF_THRESHOLD = float(os.getenv("CONF_THRESHOLD", "0.75"))
 TEMPERATURE = float(os.getenv("LLM_TEMPERATURE", "0.0"))
 SEED = int(os.getenv("LLM_SEED", "42"))
-print(f"Using Ollama URL: {OLLAMA_URL}, Model: {OLLAMA_MODEL}, "
-      f"Threshold: {CONF_THRESHOLD}, Temperature: {TEMPERATURE}, Seed: {SEED}")
+# requests in flight across all reference files (match OLLAMA_NUM_PARALLEL)
+CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "1"))
+# candidate pairs per prompt; the SKOS instructions are sent once per batch
+BATCH_SIZE = int(os.getenv("LLM_BATCH_SIZE", "1"))
+# off | full | compact: constrain replies to RELATION_SCHEMA (see llm_client.py)
+SCHEMA = LLM_SCHEMA
+# --models / LLM_ENSEMBLE: ask several models per pair and keep the majority
+ENSEMBLE_MODELS = [m.strip() for m in os.getenv("LLM_ENSEMBLE", "").split(",") if m.strip()]
+ENSEMBLE_DIR = "reports/alignment_ensemble"
+ENSEMBLE_MAJORITY = 0.5   # share of the answers a published mapping needs more than
+# anytime runs: stop sending requests after LLM_BUDGET_S seconds / LLM_BUDGET_CALLS
+# requests, judging the candidates in ALIGN_ORDER (default: similarity with a
+# budget, else files = the listing order of INPUT_DIR)
+BUDGET_S = float(os.getenv("LLM_BUDGET_S", "0")) or None
+BUDGET_CALLS = int(os.getenv("LLM_BUDGET_CALLS", "0")) or None
+ORDER = os.getenv("ALIGN_ORDER", "").strip().lower()
+ORDERS = ("files", "similarity", "expected")
+UNJUDGED_FILE = "unjudged.csv"   # in OUTPUT_DIR, after a run stopped by its budget
+PRIOR_WEIGHT = 2   # judgments the similarity prior of a hit rate counts as
 
-client = OpenAI(
-    base_url=OLLAMA_URL,
-    api_key=os.getenv("OLLAMA_API_KEY")
-)
+ALIGN_NS = "https://w3id.org/aidoc-ap/alignment#"
+SKOS_NS = "http://www.w3.org/2004/02/skos/core#"
+
+_pool = None
+_entities = None
+_cache = None
+
+
+def get_pool():
+    """The pool of the OLLAMA_URL endpoints (see llm_pool.py), created on
+    first use."""
+    global _pool
+    if _pool is None:
+        from llm_pool import EndpointPool, endpoint_urls
+        _pool = EndpointPool(endpoint_urls(OLLAMA_URL))
+    return _pool
+
+
+def get_cache():
+    """The LLM reply cache (see llm_cache.py), opened on first use."""
+    global _cache
+    if _cache is None:
+        from llm_cache import LLMCache
+        _cache = LLMCache()
+    return _cache
+
+
+def get_entities():
+    """Labels and comments/definitions of aidoc-ap.ttl and the reference
+    ontologies (see entity_store.py), opened on first use."""
+    global _entities
+    if _entities is None:
+        from entity_store import EntityStore
+        _entities = EntityStore.open()
+    return _entities
+
+
+class Pair(NamedTuple):
+    """A lexical candidate: AIDOC entity x entity of reference ontology
+    `ref_name` (reference_ontologies/<ref_name>.ttl)."""
+    ref_name: str
+    aidoc_iri: str
+    ref_iri: str
+    similarity: float
 
-# ==========================
-# LOAD GRAPHS
-# ==========================
-AIDOC = Graph().parse(AIDOC_FILE, format="turtle")
-SKOS = Namespace("http://www.w3.org/2004/02/skos/core#")
-ALIGN = Namespace("https://w3id.org/aidoc-ap/alignment#")
-agent_uri = URIRef("https://w3id.org/aidoc-ap/alignment#LLMAlignmentBot")
-
-# Helper: fetch label + comment/definition
-def describe_entity(g, iri):
-    label = g.value(iri, RDFS.label)
-    comment = g.value(iri, RDFS.comment)
-    definition = g.value(iri, SKOS.definition)
-    return {
-        "label": str(label) if label else iri.split("#")[-1],
-        "comment": str(comment or definition or "")
-    }
 
 # ==========================
 # PREFIXES
@@ -61,12 +132,7 @@ prefixes = """@prefix aidoc: <https://w3id.org/aidoc-ap#> .
 # ==========================
 # LLM PROMPT TEMPLATE
 # ==========================
-prompt_template = """
-You are an expert in ontology alignment and semantic interoperability.
-
-Compare these two ontology concepts.
-
-**AIDOC concept:**
+concepts_template = """**AIDOC concept:**
 Label: {aidoc_label}
 Description: {aidoc_comment}
 
@@ -76,8 +142,9 @@ URI: {ref_uri}
 Description: {ref_comment}
 
 Lexical similarity score (0–1): {similarity}
+"""
 
-Decide which single SKOS mapping relation holds between the AIDOC concept and the
+relation_instructions = """Decide which single SKOS mapping relation holds between the AIDOC concept and the
 {REF} concept. These are interoperability mappings at the concept level; do not
 assert class-level (extensional) equivalence. Use exactly one relation, applying
 these definitions:
@@ -98,7 +165,14 @@ Also return a score between 0.0 and 1.0 expressing how strongly the given labels
 and descriptions support the chosen relation. This score is used only as a
 heuristic to rank and filter candidate mappings for subsequent human review;
 it is not treated as a calibrated probability.
+"""
+
+prompt_template = """
+You are an expert in ontology alignment and semantic interoperability.
+
+Compare these two ontology concepts.
 
+""" + concepts_template + "\n" + relation_instructions + """
 Return JSON in this format only:
 {{
   "relation": "skos:closeMatch",
@@ -107,7 +181,61 @@ Return JSON in this format only:
 }}
 """
 
-def parse_relation_json(text):
+RELATIONS = ["skos:exactMatch", "skos:closeMatch", "skos:broadMatch", "skos:narrowMatch",
+             "skos:relatedMatch", "unrelated"]
+
+# the reply formats of the prompts as JSON schemas, for --schema; "compact"
+# sends them with the short keys of COMPACT_KEYS
+RELATION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "relation": {"type": "string", "enum": RELATIONS},
+        "confidence": {"type": "number", "minimum": 0, "maximum": 1},
+        "comment": {"type": "string"},
+    },
+    "required": ["relation", "confidence", "comment"],
+    "additionalProperties": False,
+}
+# a top-level object, as structured-output endpoints require; parse_relation_array
+# finds the array inside
+BATCH_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "pairs": {"type": "array", "items": {
+            **RELATION_SCHEMA,
+            "properties": {"pair": {"type": "integer"}, **RELATION_SCHEMA["properties"]},
+            "required": ["pair"] + RELATION_SCHEMA["required"],
+        }},
+    },
+    "required": ["pairs"],
+    "additionalProperties": False,
+}
+COMPACT_KEYS = {"relation": "r", "confidence": "c", "comment": "m", "pair": "p", "pairs": "ps"}
+
+# several pairs of one reference vocabulary in one request (--batch-size);
+# the instructions are the single-pair ones, stated once
+batch_prompt_template = """
+You are an expert in ontology alignment and semantic interoperability.
+
+Compare each of the following {n} pairs of ontology concepts on its own.
+
+{pairs}
+For each pair:
+""" + relation_instructions + """
+Return a JSON array with exactly one object per pair, in the order of the pairs,
+in this format only:
+[
+  {{
+    "pair": 1,
+    "relation": "skos:closeMatch",
+    "confidence": 0.9,
+    "comment": "They both describe risk assessment processes but differ in scope."
+  }}
+]
+"""
+
+
+def parse_relation_json(text, call=None):
     """Robustly extract {relation, confidence, comment} from an LLM reply.
 
     LLMs occasionally emit JSON that is invalid (unescaped quotes or newlines
@@ -115,19 +243,24 @@ def parse_relation_json(text):
     temperature 0 because the reply is deterministic, so we repair/extract
     instead: (1) strict JSON on the outermost object, (2) drop trailing commas,
     (3) regex-extract the fixed schema fields (relation and confidence are
-    simple values not affected by comment-quoting issues)."""
+    simple values not affected by comment-quoting issues). The step that
+    succeeded is recorded as call["parse"] (see llm_client.py)."""
+    call = {} if call is None else call
     text = text.replace("```json", "").replace("```", "")
     i, j = text.find("{"), text.rfind("}")
     core = text[i:j + 1] if (i != -1 and j > i) else text
-    for candidate in (core, re.sub(r",(\s*[}\]])", r"\1", core)):
+    for path, candidate in (("json", core), ("trailing_commas", re.sub(r",(\s*[}\]])", r"\1", core))):
         try:
-            return json.loads(candidate)
+            result = json.loads(candidate)
+            call["parse"] = path
+            return result
         except Exception:
             pass
     rel = re.search(r'"relation"\s*:\s*"([^"]+)"', text)
     conf = re.search(r'"confidence"\s*:\s*([0-9]*\.?[0-9]+)', text)
     com = re.search(r'"(?:comment|explanation|rationale)"\s*:\s*"(.*?)"\s*[},]', text, re.S)
     if rel or conf:
+        call["parse"] = "regex"
         return {
             "relation": rel.group(1) if rel else "skos:relatedMatch",
             "confidence": float(conf.group(1)) if conf else 0.0,
@@ -136,153 +269,792 @@ def parse_relation_json(text):
     raise ValueError(f"could not parse relation/confidence from reply: {text[:160]!r}")
 
 
-def query_ollama(prompt, max_attempts=4):
+def json_objects(text):
+    """The top-level {...} spans of `text`, by brace depth."""
+    depth, start = 0, None
+    for i, ch in enumerate(text):
+        if ch == "{":
+            if depth == 0:
+                start = i
+            depth += 1
+        elif ch == "}" and depth:
+            depth -= 1
+            if depth == 0:
+                yield text[start:i + 1]
+
+
+def parse_relation_array(text, n, call=None):
+    """Per-pair results of a batched reply: a list of `n` {relation,
+    confidence, comment} dicts, None for elements that are missing or
+    unusable (those pairs are re-asked one by one).
+
+    The whole array is tried as strict JSON (and without trailing commas)
+    first; otherwise each object is extracted on its own with
+    parse_relation_json, so one broken comment costs one element, not the
+    batch. Elements are placed by their "pair" number, else by position.
+    Compact keys (COMPACT_KEYS) are expanded on every path, so a compact
+    reply that needed a repair keeps its elements too."""
+    call = {} if call is None else call
+    text = text.replace("```json", "").replace("```", "")
+    elements = None
+    i, j = text.find("["), text.rfind("]")
+    if i != -1 and j > i:
+        core = text[i:j + 1]
+        for path, candidate in (("array", core),
+                                ("array_trailing_commas", re.sub(r",(\s*[}\]])", r"\1", core))):
+            try:
+                parsed = json.loads(expand_reply(candidate, COMPACT_KEYS))
+            except ValueError:
+                continue
+            if isinstance(parsed, list):
+                elements = parsed
+                call["parse"] = path
+                break
+    if elements is None:
+        call["parse"] = "per_element"
+        elements = []
+        for chunk in json_objects(text):
+            try:
+                elements.append(parse_relation_json(expand_reply(chunk, COMPACT_KEYS)))
+            except ValueError:
+                elements.append(None)
+
+    results = [None] * n
+    for position, element in enumerate(elements):
+        try:
+            usable = isinstance(element["relation"], str) and float(element["confidence"]) >= 0
+        except (TypeError, KeyError, ValueError):
+            continue
+        k = element.get("pair")
+        index = k - 1 if isinstance(k, int) and 1 <= k <= n else position
+        if usable and index < n and results[index] is None:
+            results[index] = element
+    return results
+
+
+def query_ollama(prompt, max_attempts=4, pool=None, cache=None, parse=parse_relation_json,
+                 stop_at="{", schema=SCHEMA, json_schema=RELATION_SCHEMA, model=OLLAMA_MODEL,
+                 budget=None):
+    """(parsed reply, call record) of `prompt` to `model` (see
+    llm_client.complete()); the reply stream ends with the JSON value opened
+    by `stop_at`. With `schema` "full" or "compact", the reply is constrained
+    to `json_schema`. Raises BudgetExhausted once `budget` is spent."""
     # Retry with backoff ONLY on API/transport errors (the shared server
     # serialises requests, so transient timeouts are expected). JSON parsing is
     # handled separately by parse_relation_json and is not retried.
-    last_err = None
-    for attempt in range(1, max_attempts + 1):
+    fmt = response_format("relation", json_schema, schema, COMPACT_KEYS)
+    stop_at = "{" if fmt else stop_at   # a schema reply is one top-level object
+    reply, call = complete(prompt, model, TEMPERATURE, SEED,
+                           lambda: pool or get_pool(), cache or get_cache(), max_attempts,
+                           stop_at, fmt, budget)
+    return parse(expand_reply(reply, COMPACT_KEYS) if schema == "compact" else reply, call), call
+
+
+async def query_ollama_async(prompt, limit, max_attempts=4, pool=None, cache=None,
+                             parse=parse_relation_json, stop_at="{", schema=SCHEMA,
+                             json_schema=RELATION_SCHEMA, model=OLLAMA_MODEL, budget=None):
+    """query_ollama() on the async clients, with at most `limit` (an
+    asyncio.Semaphore) requests in flight, fewer while a host's adaptive
+    limit is lower; a request waiting for its retry backoff does not hold
+    a slot."""
+    fmt = response_format("relation", json_schema, schema, COMPACT_KEYS)
+    stop_at = "{" if fmt else stop_at   # a schema reply is one top-level object
+    reply, call = await complete_async(prompt, model, TEMPERATURE, SEED,
+                                       lambda: pool or get_pool(),
+                                       cache or get_cache(), limit, max_attempts, stop_at, fmt,
+                                       budget)
+    return parse(expand_reply(reply, COMPACT_KEYS) if schema == "compact" else reply, call), call
+
+
+def describe_pair(pair, entities):
+    return (entities.describe(AIDOC_FILE, pair.aidoc_iri),
+            entities.describe(REFERENCE_DIR + pair.ref_name + ".ttl", pair.ref_iri))
+
+
+def concepts_text(template, pair, aidoc_desc, ref_desc, **extra):
+    return template.format(
+        aidoc_label=aidoc_desc["label"],
+        aidoc_comment=aidoc_desc["comment"],
+        REF=pair.ref_name,
+        ref_label=ref_desc["label"],
+        ref_uri=pair.ref_iri,
+        ref_comment=ref_desc["comment"],
+        similarity=pair.similarity,
+        **extra
+    )
+
+
+def pair_prompt(pair, entities):
+    """(prompt, AIDOC description, reference description) of a Pair."""
+    aidoc_desc, ref_desc = describe_pair(pair, entities)
+    return concepts_text(prompt_template, pair, aidoc_desc, ref_desc), aidoc_desc, ref_desc
+
+
+def batch_prompt(batch, entities):
+    """One prompt for the Pairs of `batch` (all of one reference vocabulary)."""
+    pairs = "\n".join(f"### Pair {k}\n" + concepts_text(concepts_template, pair,
+                                                         *describe_pair(pair, entities))
+                      for k, pair in enumerate(batch, 1))
+    return batch_prompt_template.format(n=len(batch), pairs=pairs, REF=batch[0].ref_name)
+
+
+def pair_batches(pairs, batch_size):
+    """`pairs` in batches of up to `batch_size` of the same reference
+    vocabulary, pairs of the same AIDOC concept next to each other."""
+    if batch_size <= 1:
+        return [[pair] for pair in pairs]
+    groups = {}
+    for pair in pairs:
+        groups.setdefault((pair.ref_name, pair.aidoc_iri), []).append(pair)
+    per_ref = {}
+    for (ref_name, _), group in groups.items():
+        per_ref.setdefault(ref_name, []).extend(group)
+    return [ordered[i:i + batch_size] for ordered in per_ref.values()
+            for i in range(0, len(ordered), batch_size)]
+
+
+def count_request(stats, prompt, key=""):
+    stats[key + "requests"] += 1
+    stats[key + "prompt_tokens"] += estimate_tokens(prompt)
+
+
+def batch_summary(stats):
+    saved = stats["single_requests"] - stats["requests"]
+    saved_tokens = stats["single_prompt_tokens"] - stats["prompt_tokens"]
+    return (f"Batched prompts: {stats['requests']} requests instead of {stats['single_requests']} "
+            f"({saved} saved), ~{stats['prompt_tokens']} prompt tokens instead of "
+            f"~{stats['single_prompt_tokens']} ({saved_tokens} saved, "
+            f"{saved_tokens / max(stats['single_prompt_tokens'], 1):.0%}), "
+            f"{stats['fallbacks']} pairs re-asked one by one")
+
+
+def curation_row(pair, aidoc_desc, ref_desc, result, call=None, batch_size=1):
+    """Curation-sheet row of a classified Pair (`result` None: failed), with
+    the telemetry of the LLM call (`call`, shared by a batch)."""
+    if result is None:
+        relation_str, conf, rationale = "", 0.0, ""
+    else:
+        relation_str = result.get("relation", "skos:relatedMatch")
+        conf = float(result.get("confidence", 0.0))
+        rationale = result.get("comment", "")
+    return {
+        "aidoc_iri": pair.aidoc_iri,
+        "aidoc_label": aidoc_desc["label"],
+        "ref_iri": pair.ref_iri,
+        "ref_label": ref_desc["label"],
+        "lexical_similarity": pair.similarity,
+        "llm_relation": relation_str,
+        "llm_confidence": conf,
+        "llm_rationale": rationale,
+        "above_threshold": conf >= CONF_THRESHOLD,
+        **call_fields(call or {}),
+        "llm_batch_size": batch_size if call else None,
+        "curator_decision": "",   # accept | reject | modify
+        "curator_relation": "",   # filled if decision == modify
+        "curator_name": "",
+        "curator_notes": "",
+    }
+
+
+def classify_pairs(pairs, keep_failed=False, pool=None, entities=None, cache=None,
+                   batch_size=1, stats=None, schema=SCHEMA, model=OLLAMA_MODEL, budget=None):
+    """Classify each Pair with the LLM; yields (pair, curation row).
+
+    The row has the curation-sheet columns (labels, LLM relation,
+    confidence and rationale, above_threshold, empty curator fields).
+    Pairs whose classification fails are reported and skipped, or, with
+    `keep_failed`, yielded with an empty relation and confidence 0.
+
+    With `batch_size` > 1, pairs are sent in batched prompts (see
+    pair_batches(), so rows come in batch order) and every pair the batched
+    reply has no usable element for is re-asked on its own. `stats`
+    (a Counter) receives the request and prompt-token counts of the
+    requests answered (failed and budget-skipped ones are not counted). `schema`
+    selects free-form or schema-constrained replies (see query_ollama()),
+    `model` the model asked. Once `budget` (an llm_client.Budget) is spent,
+    the remaining pairs are left unjudged (cached replies are still used)."""
+    entities = entities or get_entities()
+    stats = Counter() if stats is None else stats
+    for batch in pair_batches(pairs, batch_size):
+        results, batch_call = [None] * len(batch), None
+        if len(batch) > 1:
+            prompt = batch_prompt(batch, entities)
+            try:
+                results, batch_call = query_ollama(
+                    prompt, pool=pool, cache=cache,
+                    parse=lambda reply, call: parse_relation_array(reply, len(batch), call),
+                    stop_at="[", schema=schema, json_schema=BATCH_SCHEMA, model=model,
+                    budget=budget)
+                count_request(stats, prompt)
+            except BudgetExhausted:
+                pass   # the pairs may still have cached single replies
+            except CircuitOpen:
+                raise
+            except Exception as e:
+                batch_failed(batch, e)
+        for pair, result in zip(batch, results):
+            prompt, aidoc_desc, ref_desc = pair_prompt(pair, entities)
+            call, size = batch_call, len(batch)
+            try:
+                if result is None:
+                    result, call = query_ollama(prompt, pool=pool, cache=cache, schema=schema,
+                                                model=model, budget=budget)
+                    count_request(stats, prompt)
+                    stats["fallbacks"] += len(batch) > 1
+                    size = 1
+                count_request(stats, prompt, "single_")  # what single-pair mode sends
+                row = curation_row(pair, aidoc_desc, ref_desc, result, call, size)
+            except BudgetExhausted:
+                continue
+            except CircuitOpen:
+                raise
+            except Exception as e:
+                print(f"⚠️ Error on {aidoc_desc['label']} ↔ {ref_desc['label']}: {e}")
+                if not keep_failed:
+                    continue
+                row = curation_row(pair, aidoc_desc, ref_desc, None)
+            yield pair, row
+
+
+def batch_failed(batch, err):
+    print(f"⚠️ Batch of {len(batch)} {batch[0].ref_name} pairs failed, "
+          f"asking them one by one: {err}")
+
+
+async def classify_pairs_async(pairs, concurrency, keep_failed=False, pool=None,
+                               entities=None, cache=None, on_judged=None,
+                               batch_size=1, stats=None, schema=SCHEMA, model=OLLAMA_MODEL,
+                               budget=None):
+    """classify_pairs() with up to `concurrency` requests in flight; returns
+    the (pair, curation row) list in the order of `pairs`, whatever order
+    the replies arrive in. `on_judged(pair, row)` is called as each
+    classification completes."""
+    entities = entities or get_entities()
+    stats = Counter() if stats is None else stats
+    limit = asyncio.Semaphore(concurrency)
+
+    async def classify(pair, result, batch_call, size):
+        prompt, aidoc_desc, ref_desc = pair_prompt(pair, entities)
+        call = batch_call
         try:
-            chat_completion = client.chat.completions.create(
-                messages=[{'role': 'user', 'content': prompt}],
-                model=OLLAMA_MODEL,
-                temperature=TEMPERATURE,
-                seed=SEED,
-            )
+            if result is None:
+                result, call = await query_ollama_async(prompt, limit, pool=pool, cache=cache,
+                                                        schema=schema, model=model, budget=budget)
+                count_request(stats, prompt)
+                stats["fallbacks"] += size > 1
+                size = 1
+            count_request(stats, prompt, "single_")
+            row = curation_row(pair, aidoc_desc, ref_desc, result, call, size)
+        except BudgetExhausted:
+            return pair, None
+        except CircuitOpen:
+            raise
         except Exception as e:
-            last_err = e
-            if attempt < max_attempts:
-                wait = 5 * 3 ** (attempt - 1)  # 5s, 15s, 45s
-                print(f"  retry {attempt}/{max_attempts - 1} after API error: {e} (waiting {wait}s)")
-                time.sleep(wait)
-            continue
-        return parse_relation_json(chat_completion.choices[0].message.content)
-    raise last_err
-
-for fname in os.listdir(INPUT_DIR):
-    if not fname.endswith("_alignment.csv"):
-        continue
-
-    REF = Graph().parse(REFERENCE_DIR + fname.replace('_alignment.csv','.ttl'), format="turtle")
-    STRUCTURAL_FILE = os.path.join(INPUT_DIR, fname)
-    OUTPUT_FILE = os.path.join(OUTPUT_DIR, fname.replace("_alignment.csv", "-alignments.ttl"))
-    CURATION_FILE = os.path.join(OUTPUT_DIR, fname.replace("_alignment.csv", "-curation.csv"))
-    df = pd.read_csv(STRUCTURAL_FILE)
-
-    # All LLM judgments (incl. below-threshold and unrelated) are recorded for
-    # expert curation and false-negative analysis; the TTL output only contains
-    # mappings at or above CONF_THRESHOLD.
-    curation_rows = []
-
-    # ==========================
-    # Initialize RDF graph
-    alignment_graph = Graph()
-    alignment_graph.bind("prov", PROV)
-    alignment_graph.bind("skos", SKOS)
-    alignment_graph.bind("align", ALIGN)
-    alignment_graph.bind("aidoc", "https://w3id.org/aidoc-ap#")
-
-    alignment_graph.add((agent_uri, RDF.type, PROV.SoftwareAgent))
-    alignment_graph.add((agent_uri, RDFS.label, Literal(f"LLM Alignment Step using {OLLAMA_MODEL}", datatype=XSD.string)))
+            print(f"⚠️ Error on {aidoc_desc['label']} ↔ {ref_desc['label']}: {e}")
+            if not keep_failed:
+                return pair, None
+            row = curation_row(pair, aidoc_desc, ref_desc, None)
+        if on_judged:
+            on_judged(pair, row)
+        return pair, row
+
+    async def classify_batch(batch):
+        results, batch_call = [None] * len(batch), None
+        if len(batch) > 1:
+            prompt = batch_prompt(batch, entities)
+            try:
+                results, batch_call = await query_ollama_async(
+                    prompt, limit, pool=pool, cache=cache,
+                    parse=lambda reply, call: parse_relation_array(reply, len(batch), call),
+                    stop_at="[", schema=schema, json_schema=BATCH_SCHEMA, model=model,
+                    budget=budget)
+                count_request(stats, prompt)
+            except BudgetExhausted:
+                pass
+            except CircuitOpen:
+                raise
+            except Exception as e:
+                batch_failed(batch, e)
+        return await asyncio.gather(*(classify(pair, result, batch_call, len(batch))
+                                      for pair, result in zip(batch, results)))
+
+    order = {pair: i for i, pair in reversed(list(enumerate(pairs)))}
+    batches = await asyncio.gather(*(classify_batch(batch)
+                                     for batch in pair_batches(pairs, batch_size)))
+    results = sorted((result for batch in batches for result in batch),
+                     key=lambda result: order[result[0]])
+    return [(pair, row) for pair, row in results if row is not None]
+
+
+async def classify_ensemble(pending, concurrency, on_judged, pool=None, **options):
+    """classify_pairs_async() of the pending pairs of every model
+    ({model: pairs}) at once, up to `concurrency` requests in flight per
+    model, so the run takes about as long as its slowest model. The models
+    are first placed on the hosts of the pool (a host each, as far as there
+    are hosts) and loaded there together (see llm_pool.py).
+    `on_judged(pair, row, model)` is called as each classification
+    completes."""
+    pool = pool or get_pool()
+    models = [model for model, pairs in pending.items() if pairs]
+    if not models:
+        return
+    placement = pool.place(models)
+    for model, seconds in (await asyncio.to_thread(pool.warm_up_all, placement)).items():
+        for url, s in seconds.items():
+            if s is not None:
+                print(f"[warm] {model} on {url}: {s:.1f}s")
+    await asyncio.gather(*(
+        classify_pairs_async(pending[model], concurrency, pool=pool, model=model,
+                             on_judged=lambda pair, row, model=model: on_judged(pair, row, model),
+                             **options)
+        for model in models))
+
+
+def ensemble_summary(rows, models):
+    """Agreement of the ensemble over its curation rows."""
+    answered = [row for row in rows if row["ensemble_answers"]]
+    agreement = [row["ensemble_agreement"] for row in answered]
+    return {
+        "models": models,
+        "pairs": len(rows),
+        "unanimous": sum(row["ensemble_agreement"] == 1.0
+                         and row["ensemble_answers"] == len(models) for row in answered),
+        "majority": sum(a > ENSEMBLE_MAJORITY for a in agreement),
+        "agreement_mean": round(sum(agreement) / len(agreement), 3) if agreement else None,
+        "incomplete": sum(row["ensemble_answers"] < len(models) for row in rows),
+    }
+
+
+def hit_rates(path):
+    """{similarity decile: (mappings, judgments)} of the judgments in the
+    journal at `path` (any model or seed); a mapping is a relation other
+    than unrelated at or above CONF_THRESHOLD."""
+    rates = {}
+    if not os.path.exists(path):
+        return rates
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                row = json.loads(line)["row"]
+                decile = min(int(float(row["lexical_similarity"]) * 10), 9)
+            except (ValueError, KeyError, TypeError):
+                continue
+            hit = (row["llm_confidence"] >= CONF_THRESHOLD
+                   and row["llm_relation"] not in ("", "unrelated"))
+            hits, n = rates.get(decile, (0, 0))
+            rates[decile] = (hits + hit, n + 1)
+    return rates
+
+
+def priorities(pairs, order, rates=None, entities=None):
+    """{pair: priority} of `pairs` under `order`: "similarity" is the
+    lexical similarity; "expected" the expected mappings per prompt token,
+    i.e. the hit rate of the pair's similarity decile in earlier judgments
+    (`rates`, see hit_rates(); shrunk towards the similarity itself by
+    PRIOR_WEIGHT judgments) over the estimated tokens of its prompt;
+    "files" keeps the order of `pairs`."""
+    if order == "files":
+        return {pair: -i for i, pair in enumerate(pairs)}
+    if order == "similarity":
+        return {pair: float(pair.similarity) for pair in pairs}
+    rates, entities = rates or {}, entities or get_entities()
+    scores = {}
+    for pair in pairs:
+        similarity = float(pair.similarity)
+        hits, n = rates.get(min(int(similarity * 10), 9), (0, 0))
+        p_hit = (hits + PRIOR_WEIGHT * similarity) / (n + PRIOR_WEIGHT)
+        scores[pair] = p_hit / max(estimate_tokens(pair_prompt(pair, entities)[0]), 1)
+    return scores
+
+
+def write_unjudged(path, remaining, priority):
+    """CSV of the pairs a model has not judged ({model: pairs}), highest
+    priority first, with the models missing; removes a stale one when
+    every pair is judged. Returns the number of pairs."""
+    import pandas as pd
+
+    missing = {}
+    for model, pairs in remaining.items():
+        for pair in pairs:
+            missing.setdefault(pair, []).append(model)
+    if not missing:
+        if os.path.exists(path):
+            os.remove(path)
+        return 0
+    ranked = sorted(missing, key=lambda pair: -priority[pair])
+    pd.DataFrame([{"rank": rank, "ref_name": pair.ref_name, "aidoc_iri": pair.aidoc_iri,
+                   "ref_iri": pair.ref_iri, "lexical_similarity": pair.similarity,
+                   "priority": priority[pair], "models_missing": " ".join(missing[pair])}
+                  for rank, pair in enumerate(ranked, 1)]).to_csv(path, index=False)
+    return len(ranked)
+
+
+def utc_now():
+    return datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0).isoformat().replace("+00:00", "Z")
+
+
+def judgment_key(pair, model=OLLAMA_MODEL, seed=SEED):
+    return (pair.ref_name, pair.aidoc_iri, pair.ref_iri, model, seed)
+
+
+class Journal:
+    """Append-only JSONL record of the LLM judgments of a run.
+
+    Every judgment is flushed and fsynced as it completes, so a crashed run
+    loses at most the request in flight. Lines of other models or seeds are
+    kept but ignored; a torn last line (crash mid-write) is skipped. A new
+    run (no `resume`) moves an existing journal to <path>.prev instead of
+    truncating it, so the last run's record survives one fresh start."""
+
+    def __init__(self, path, resume=False):
+        self.path = path
+        self.judged = {}   # judgment_key -> (time, curation row)
+        if not resume and os.path.exists(path) and os.path.getsize(path):
+            os.replace(path, path + ".prev")
+            print(f"⚠️ Previous journal kept as {path}.prev (use --resume to continue it)")
+        if resume and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    pair = Pair(*entry["pair"])
+                    key = judgment_key(pair, entry["model"], entry["seed"])
+                    self.judged[key] = (entry["time"], entry["row"])
+        self.f = open(path, "a" if resume else "w", encoding="utf-8")
+        if self.f.tell() and not self._ends_with_newline():
+            self.f.write("\n")
+
+    def _ends_with_newline(self):
+        with open(self.path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    def __contains__(self, pair):
+        return judgment_key(pair) in self.judged
+
+    def has(self, pair, model):
+        return judgment_key(pair, model) in self.judged
+
+    def append(self, pair, row, model=OLLAMA_MODEL):
+        entry = {"pair": list(pair), "model": model, "seed": SEED,
+                 "temperature": TEMPERATURE, "time": utc_now(), "row": row}
+        self.f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        self.judged[judgment_key(pair, model)] = (entry["time"], row)
+
+    def rows(self, pairs, models=(OLLAMA_MODEL,)):
+        """(curation rows of the judged `pairs` in their order, first and last
+        judgment time); with several `models`, one ensemble row per pair
+        judged by any of them (see ensemble_row())."""
+        judged, rows = [], []
+        for pair in pairs:
+            by_model = {m: self.judged[judgment_key(pair, m)] for m in models
+                        if self.has(pair, m)}
+            if not by_model:
+                continue
+            judged += by_model.values()
+            rows.append(ensemble_row({m: row for m, (_, row) in by_model.items()}, models)
+                        if len(models) > 1 else by_model[models[0]][1])
+        times = sorted(t for t, _ in judged) or [utc_now()]
+        return rows, times[0], times[-1]
+
+    def close(self):
+        self.f.close()
+
+
+def model_slug(model):
+    """`model` as a column-name prefix (gemma3:27b -> gemma3_27b)."""
+    return re.sub(r"[^A-Za-z0-9]+", "_", model).strip("_")
+
+
+def ensemble_row(rows, models):
+    """Curation row of a pair from the rows of the ensemble `models` that
+    judged it ({model: row}): the majority relation (ties broken by summed
+    confidence) with the mean confidence and the rationale of its most
+    confident voter, the share of the answering models that chose it
+    (ensemble_agreement), and each model's relation and confidence. The
+    row is above threshold only with the agreement of more than
+    ENSEMBLE_MAJORITY of the answers."""
+    answers = {m: row for m, row in rows.items() if row["llm_relation"]}
+    votes = Counter(row["llm_relation"] for row in answers.values())
+    weight = Counter()
+    for row in answers.values():
+        weight[row["llm_relation"]] += row["llm_confidence"]
+    row = dict(next(iter(rows.values())))
+    for key in list(row):
+        if key.startswith("llm_"):
+            row[key] = None
+    relation, agreement, conf, rationale = "", 0.0, 0.0, ""
+    if votes:
+        relation = max(votes, key=lambda r: (votes[r], weight[r]))
+        voters = [r for r in answers.values() if r["llm_relation"] == relation]
+        agreement = len(voters) / len(answers)
+        conf = sum(r["llm_confidence"] for r in voters) / len(voters)
+        rationale = max(voters, key=lambda r: r["llm_confidence"])["llm_rationale"]
+    row.update({
+        "llm_relation": relation,
+        "llm_confidence": round(conf, 3),
+        "llm_rationale": rationale,
+        "above_threshold": conf >= CONF_THRESHOLD and agreement > ENSEMBLE_MAJORITY,
+        "ensemble_agreement": round(agreement, 3),
+        "ensemble_answers": len(answers),
+    })
+    for model in models:
+        own = rows.get(model)
+        row[f"{model_slug(model)}_relation"] = own["llm_relation"] if own else ""
+        row[f"{model_slug(model)}_confidence"] = own["llm_confidence"] if own else None
+    # curator columns last, as in single-model sheets
+    for key in ("curator_decision", "curator_relation", "curator_name", "curator_notes"):
+        row[key] = row.pop(key)
+    return row
+
+
+def alignment_graph(rows, start_time, end_time, models=(OLLAMA_MODEL,)):
+    """PROV-annotated alignment graph of the curation rows at or above
+    CONF_THRESHOLD (unrelated judgments excluded); ensemble rows also need
+    the agreement of more than ENSEMBLE_MAJORITY of the `models`."""
+    from rdflib import Graph, Literal, Namespace, RDFS, URIRef
+    from rdflib.namespace import OWL, PROV, RDF, XSD
+
+    SKOS = Namespace(SKOS_NS)
+    ALIGN = Namespace(ALIGN_NS)
+    agent_uri = URIRef(ALIGN_NS + "LLMAlignmentBot")
+
+    g = Graph()
+    g.bind("prov", PROV)
+    g.bind("skos", SKOS)
+    g.bind("align", ALIGN)
+    g.bind("aidoc", AIDOC_NS)
+
+    g.add((agent_uri, RDF.type, PROV.SoftwareAgent))
+    g.add((agent_uri, RDFS.label, Literal(f"LLM Alignment Step using {', '.join(models)}", datatype=XSD.string)))
 
     # Create activity node
-    activity_uri = URIRef(f"https://w3id.org/aidoc-ap/alignment#{uuid.uuid4()}")
-    alignment_graph.add((activity_uri, RDF.type, PROV.Activity))
-    start_time = datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0).isoformat().replace("+00:00", "Z")
-    alignment_graph.add((activity_uri, PROV.startedAtTime, Literal(start_time, datatype=XSD.dateTime)))
-    alignment_graph.add((activity_uri, PROV.wasAssociatedWith, agent_uri))
-    alignment_graph.add((activity_uri, PROV.used, URIRef(f"https://ollama.com/library/{OLLAMA_MODEL}")))
-    # ==========================
-
-    for _, row in df.iterrows():
-        aidoc_iri = row["aidoc_iri"]
-        ref_iri = row[f"{fname.replace('_alignment.csv','')}_iri"]
-        aidoc_uri = URIRef(aidoc_iri)
-        ref_uri = URIRef(ref_iri)
-        similarity = row.get("similarity", 0.0)
+    activity_uri = URIRef(f"{ALIGN_NS}{uuid.uuid4()}")
+    g.add((activity_uri, RDF.type, PROV.Activity))
+    g.add((activity_uri, PROV.startedAtTime, Literal(start_time, datatype=XSD.dateTime)))
+    g.add((activity_uri, PROV.wasAssociatedWith, agent_uri))
+    for model in models:
+        g.add((activity_uri, PROV.used, URIRef(f"https://ollama.com/library/{model}")))
 
-        # Only keep alignments where the source term is from the AIDOC namespace
-        if not str(aidoc_uri).startswith("https://w3id.org/aidoc-ap#"):
+    for row in rows:
+        relation_str, conf = row["llm_relation"], row["llm_confidence"]
+        if not (isinstance(relation_str, str) and conf >= CONF_THRESHOLD
+                and relation_str.strip().lower() != "unrelated"
+                and row.get("ensemble_agreement", 1.0) > ENSEMBLE_MAJORITY):
             continue
+        aidoc_uri, ref_uri = URIRef(row["aidoc_iri"]), URIRef(row["ref_iri"])
 
-        aidoc_desc = describe_entity(AIDOC, aidoc_uri)
-        ref_desc = describe_entity(REF, ref_uri)
+        # --- Determine appropriate namespace for relation ---
+        if relation_str.startswith("skos:"):
+            rel_uri = SKOS[relation_str.split(":")[-1]]
+        elif relation_str.startswith("owl:"):
+            rel_uri = OWL[relation_str.split(":")[-1]]
+        else:
+            # Default fallback to skos:relatedMatch
+            rel_uri = SKOS.relatedMatch
 
-        prompt = prompt_template.format(
-            aidoc_label=aidoc_desc["label"],
-            aidoc_comment=aidoc_desc["comment"],
-            REF=fname.replace('_alignment.csv',''),
-            ref_label=ref_desc["label"],
-            ref_uri=ref_iri,
-            ref_comment=ref_desc["comment"],
-            similarity=similarity
-        )
+        # --- Add triples ---
+        # add the semantic triple
+        g.add((aidoc_uri, rel_uri, ref_uri))
 
-        try:
-            result = query_ollama(prompt)
-            relation_str = result.get("relation", "skos:relatedMatch")
-            conf = float(result.get("confidence", 0.0))
-            rationale = result.get("comment", "")
-
-            curation_rows.append({
-                "aidoc_iri": str(aidoc_uri),
-                "aidoc_label": aidoc_desc["label"],
-                "ref_iri": str(ref_uri),
-                "ref_label": ref_desc["label"],
-                "lexical_similarity": similarity,
-                "llm_relation": relation_str,
-                "llm_confidence": conf,
-                "llm_rationale": rationale,
-                "above_threshold": conf >= CONF_THRESHOLD,
-                "curator_decision": "",   # accept | reject | modify
-                "curator_relation": "",   # filled if decision == modify
-                "curator_name": "",
-                "curator_notes": "",
-            })
-
-            if conf >= CONF_THRESHOLD and relation_str.strip().lower() != "unrelated":
-
-                # --- Determine appropriate namespace for relation ---
-                if relation_str.startswith("skos:"):
-                    rel_uri = SKOS[relation_str.split(":")[-1]]
-                elif relation_str.startswith("owl:"):
-                    rel_uri = OWL[relation_str.split(":")[-1]]
-                else:
-                    # Default fallback to skos:relatedMatch
-                    rel_uri = SKOS.relatedMatch
-
-                # --- Add triples ---
-                # add the semantic triple
-                alignment_graph.add((aidoc_uri, rel_uri, ref_uri))
-
-                # Create mapping node
-                mapping_uri = URIRef(f"https://w3id.org/aidoc-ap/alignment#{uuid.uuid4()}")
-
-                alignment_graph.add((mapping_uri, RDF.type, ALIGN.Mapping))
-                alignment_graph.add((mapping_uri, RDF.type, PROV.Entity))
-                alignment_graph.add((mapping_uri, ALIGN.source, aidoc_uri))
-                alignment_graph.add((mapping_uri, ALIGN.target, ref_uri))
-                alignment_graph.add((mapping_uri, ALIGN.relation, rel_uri))
-                alignment_graph.add((mapping_uri, ALIGN.confidence, Literal(conf, datatype=XSD.float)))
-                alignment_graph.add((mapping_uri, ALIGN.rationale, Literal(rationale, datatype=XSD.string)))
-
-                # Link mapping to activity
-                alignment_graph.add((mapping_uri, PROV.wasGeneratedBy, activity_uri))
-                alignment_graph.add((mapping_uri, PROV.wasAttributedTo, agent_uri))
+        # Create mapping node
+        mapping_uri = URIRef(f"{ALIGN_NS}{uuid.uuid4()}")
 
-        except Exception as e:
-            print(f"⚠️ Error on {aidoc_desc['label']} ↔ {ref_desc['label']}: {e}")
+        g.add((mapping_uri, RDF.type, ALIGN.Mapping))
+        g.add((mapping_uri, RDF.type, PROV.Entity))
+        g.add((mapping_uri, ALIGN.source, aidoc_uri))
+        g.add((mapping_uri, ALIGN.target, ref_uri))
+        g.add((mapping_uri, ALIGN.relation, rel_uri))
+        g.add((mapping_uri, ALIGN.confidence, Literal(conf, datatype=XSD.float)))
+        g.add((mapping_uri, ALIGN.rationale, Literal(row["llm_rationale"], datatype=XSD.string)))
+        if "ensemble_agreement" in row:
+            g.add((mapping_uri, ALIGN.agreement,
+                   Literal(row["ensemble_agreement"], datatype=XSD.float)))
+
+        # Link mapping to activity
+        g.add((mapping_uri, PROV.wasGeneratedBy, activity_uri))
+        g.add((mapping_uri, PROV.wasAttributedTo, agent_uri))
+
+    g.add((activity_uri, PROV.endedAtTime, Literal(end_time, datatype=XSD.dateTime)))
+    return g
+
+
+def main(no_cache=False, concurrency=CONCURRENCY, resume=False, batch_size=BATCH_SIZE,
+         schema=SCHEMA, models=None, budget_s=BUDGET_S, budget_calls=BUDGET_CALLS, order=ORDER):
+    import pandas as pd
+    from llm_cache import LLMCache
+
+    cache = LLMCache(mode="off") if no_cache else get_cache()
+    models = models or [OLLAMA_MODEL]
+    ensemble = len(models) > 1
+    output_dir = ENSEMBLE_DIR if ensemble else OUTPUT_DIR
+
+    print(f"Using Ollama URL: {OLLAMA_URL}, Model{'s' if ensemble else ''}: {', '.join(models)}, "
+          f"Threshold: {CONF_THRESHOLD}, Temperature: {TEMPERATURE}, Seed: {SEED}, "
+          f"Concurrency: {concurrency}{' per model' if ensemble else ''}, Batch size: {batch_size}")
+    os.makedirs(output_dir, exist_ok=True)
+
+    files = []
+    for fname in os.listdir(INPUT_DIR):
+        if not fname.endswith("_alignment.csv"):
+            continue
+
+        ref_name = fname.replace("_alignment.csv", "")
+        STRUCTURAL_FILE = os.path.join(INPUT_DIR, fname)
+        OUTPUT_FILE = os.path.join(output_dir, fname.replace("_alignment.csv", "-alignments.ttl"))
+        CURATION_FILE = os.path.join(output_dir, fname.replace("_alignment.csv", "-curation.csv"))
+        df = pd.read_csv(STRUCTURAL_FILE)
+
+        # Only keep alignments where the source term is from the AIDOC namespace
+        pairs = [Pair(ref_name, row["aidoc_iri"], row[f"{ref_name}_iri"],
+                      row.get("similarity", 0.0))
+                 for _, row in df.iterrows() if str(row["aidoc_iri"]).startswith(AIDOC_NS)]
+        files.append((OUTPUT_FILE, CURATION_FILE, pairs))
+
+    # All candidates of all files form one queue, highest priority first
+    # (the hit rates of "expected" come from the journal of earlier runs).
+    budgeted = bool(budget_s or budget_calls)
+    order = order or ("similarity" if budgeted else "files")
+    candidates = [pair for *_, pairs in files for pair in pairs]
+    journal_path = os.path.join(output_dir, JOURNAL_FILE)
+    priority = priorities(candidates, order,
+                          hit_rates(journal_path) if order == "expected" else None)
+    candidates.sort(key=lambda pair: -priority[pair])
+
+    # Every judgment goes to the journal as it completes; the outputs are
+    # rebuilt from it, so --resume only asks for the pairs not judged yet.
+    journal = Journal(journal_path, resume)
+    pending = {model: [pair for pair in candidates if not journal.has(pair, model)]
+               for model in models}
+    n_pending = sum(len(pairs) for pairs in pending.values())
+    if resume:
+        print(f"Resuming from {journal.path}: {len(journal.judged)} judgments recorded, "
+              f"{n_pending} {'judgments' if ensemble else 'pairs'} pending")
+    stats = Counter()
+    run_start = utc_now()
+    run = dict(temperature=TEMPERATURE, seed=SEED, concurrency=concurrency,
+               batch_size=batch_size, schema=schema, pairs=n_pending, order=order)
+    if ensemble:
+        run["models"] = models
+    model = models[0]
+    budget = Budget(budget_s, budget_calls) if budgeted else None
+    if budget:
+        print(f"Budget: {budget_s or '∞'}s, {budget_calls or '∞'} requests, "
+              f"{len(candidates)} candidates by {order}")
+    try:
+        if ensemble:
+            # every model at once, each with its own `concurrency` in flight
+            asyncio.run(classify_ensemble(pending, concurrency, journal.append, cache=cache,
+                                          batch_size=batch_size, stats=stats, schema=schema,
+                                          budget=budget))
+        elif concurrency > 1:
+            # one pool of in-flight requests across all reference files
+            asyncio.run(classify_pairs_async(pending[model], concurrency, cache=cache,
+                                             on_judged=lambda pair, row: journal.append(pair, row, model),
+                                             batch_size=batch_size, stats=stats, schema=schema,
+                                             model=model, budget=budget))
+        else:
+            for pair, row in classify_pairs(pending[model], cache=cache, batch_size=batch_size,
+                                            stats=stats, schema=schema, model=model,
+                                            budget=budget):
+                journal.append(pair, row, model)
+    except KeyboardInterrupt:
+        # an anytime run: write what has been judged so far
+        print("⚠️ Interrupted; writing the outputs of the judgments so far")
+        run["interrupted"] = True
+    except CircuitOpen as e:
+        write_run_metrics(os.path.join(output_dir, METRICS_FILE), started=run_start,
+                          ended=utc_now(), aborted=str(e), **run)
+        raise SystemExit(f"❌ Stopped: {e}. The judgments so far are in {journal.path}; "
+                         f"continue with --resume.")
+    finally:
+        journal.close()
+
+    all_rows = []
+    for OUTPUT_FILE, CURATION_FILE, pairs in files:
+        # All LLM judgments (incl. below-threshold and unrelated) are recorded for
+        # expert curation and false-negative analysis; the TTL output only contains
+        # mappings at or above CONF_THRESHOLD.
+        curation_rows, start_time, end_time = journal.rows(pairs, models)
+        graph = alignment_graph(curation_rows, start_time, end_time, models)
+        all_rows += curation_rows
+
+        # ==========================
+        # SAVE OUTPUT
+        # ==========================
+        graph.serialize(destination=OUTPUT_FILE, format="turtle")
+        pd.DataFrame(curation_rows).to_csv(CURATION_FILE, index=False)
 
-    # ==========================
-    # SAVE OUTPUT
-    # ==========================
-    end_time = datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0).isoformat().replace("+00:00", "Z")
-    alignment_graph.add((activity_uri, PROV.endedAtTime, Literal(end_time, datatype=XSD.dateTime)))
+        print(f"Semantic alignment with descriptions saved as Turtle → {OUTPUT_FILE}")
+        print(f"Curation sheet (all {len(curation_rows)} LLM judgments) → {CURATION_FILE}")
 
-    alignment_graph.serialize(destination=OUTPUT_FILE, format="turtle")
-    pd.DataFrame(curation_rows).to_csv(CURATION_FILE, index=False)
+    remaining = {m: [pair for pair in pending[m] if not journal.has(pair, m)] for m in models}
+    unjudged = write_unjudged(os.path.join(output_dir, UNJUDGED_FILE), remaining, priority)
+    if budget:
+        run["budget"] = budget.summary()
+    if unjudged:
+        left = [pair for pairs in remaining.values() for pair in pairs]
+        per_ref = Counter(pair.ref_name for pair in left)
+        run["unjudged"] = {"pairs": unjudged, "judgments": len(left), "per_reference": dict(per_ref),
+                           "similarity_max": max(float(pair.similarity) for pair in left)}
+        reason = (f"{budget.exhausted} spent" if budget and budget.exhausted
+                  else "interrupted" if run.get("interrupted") else "failed requests")
+        print(f"⚠️ {unjudged} of {len(candidates)} pairs unjudged ({reason}; "
+              f"similarity ≤ {run['unjudged']['similarity_max']:.2f}; "
+              + ", ".join(f"{ref} {n}" for ref, n in per_ref.most_common())
+              + f") → {os.path.join(output_dir, UNJUDGED_FILE)}; continue with --resume")
+    if batch_size > 1:
+        print(batch_summary(stats))
+    if ensemble:
+        run["ensemble"] = ensemble_summary(all_rows, models)
+        print(f"Ensemble of {len(models)} models: {run['ensemble']['unanimous']} of "
+              f"{run['ensemble']['pairs']} pairs unanimous, {run['ensemble']['majority']} with a "
+              f"majority, mean agreement {run['ensemble']['agreement_mean']}")
+    write_run_metrics(os.path.join(output_dir, METRICS_FILE), started=run_start, ended=utc_now(),
+                      **run)
+    print(cache.summary())
+    print("✅ Semantic alignment completed.")
 
-    print(f"Semantic alignment with descriptions saved as Turtle → {OUTPUT_FILE}")
-    print(f"Curation sheet (all {len(curation_rows)} LLM judgments) → {CURATION_FILE}")
 
-print("✅ Semantic alignment completed.")
\ No newline at end of file
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--no-cache", action="store_true",
+                    help="always ask the model; neither read nor write the LLM cache")
+    ap.add_argument("--concurrency", "-c", type=int, default=CONCURRENCY,
+                    help="at most this many LLM requests in flight across all reference "
+                         "files; each host admits fewer under its adaptive limit, and the "
+                         "run stops when the model's hosts are down (default: "
+                         "LLM_CONCURRENCY or 1 = sequential; outputs as in a sequential run)")
+    ap.add_argument("--resume", action="store_true",
+                    help="keep the judgments of the journal (same model and seed) "
+                         "and only classify the remaining pairs; without it a new journal "
+                         "is started and the previous one kept as journal.jsonl.prev")
+    ap.add_argument("--batch-size", "-b", type=int, default=BATCH_SIZE,
+                    help="candidate pairs of one reference vocabulary per prompt, answered "
+                         "as a JSON array; pairs without a usable element are re-asked "
+                         "one by one (default: LLM_BATCH_SIZE or 1 = one pair per request)")
+    ap.add_argument("--schema", choices=SCHEMA_MODES, default=SCHEMA,
+                    help="constrain replies to the JSON schema of the reply format, with "
+                         "full or compact keys (default: LLM_SCHEMA or off = free-form)")
+    ap.add_argument("--models", "-m", nargs="+", default=ENSEMBLE_MODELS,
+                    help="ask each of these models (at once, across the hosts of OLLAMA_URL) "
+                         "and keep the relation more than half of them agree on; outputs go "
+                         "to " + ENSEMBLE_DIR + " (default: LLM_ENSEMBLE or OLLAMA_MODEL alone)")
+    ap.add_argument("--budget-s", type=float, default=BUDGET_S,
+                    help="stop sending requests after this many seconds, write the "
+                         "judgments so far and list the pairs left in unjudged.csv; "
+                         "--resume continues (default: LLM_BUDGET_S or none)")
+    ap.add_argument("--budget-calls", type=int, default=BUDGET_CALLS,
+                    help="stop after this many LLM requests (default: LLM_BUDGET_CALLS or none)")
+    ap.add_argument("--order", choices=ORDERS, default=ORDER or None,
+                    help="order of the candidate queue: by file, by lexical similarity, or "
+                         "by expected mappings per prompt token from the journal's hit "
+                         "rates (default: ALIGN_ORDER, else similarity with a budget and "
+                         "files without)")
+    args = ap.parse_args()
+    main(args.no_cache, args.concurrency, args.resume, args.batch_size, args.schema, args.models,
+         args.budget_s, args.budget_calls, args.order)
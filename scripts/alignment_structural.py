@@ -1,7 +1,12 @@
 import argparse
-import rdflib
-from rdflib import RDFS, OWL
-from rdflib.namespace import SKOS
+import hashlib
+import heapq
+import itertools
+import pickle
+import sys
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from difflib import SequenceMatcher
 import csv
 import os
@@ -12,6 +17,10 @@ import unicodedata
 LEFT_FILE = "aidoc-ap.ttl"
 RIGHT_FILE = "reference_ontologies/"
 OUTPUT_DIR = "reports/alignment_structural/"
+PROFILE_CACHE = "reports/cache/label_profiles.pkl"
+ENGINE_REPORT = "reports/alignment_engines.csv"
+# reference entities per process-pool task when scoring with --jobs > 1
+CHUNK_SIZE = 200
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 Path("reports").mkdir(exist_ok=True)
 
@@ -41,6 +50,11 @@ def token_jaccard(a, b):
     return len(inter) / len(union)
 
 
+# weights of the character-level and token-level parts of similarity()
+SEQ_WEIGHT, TOKEN_WEIGHT = 0.4, 0.6
+NGRAM_SIZE = 3
+
+
 def similarity(a, b):
     # combine SequenceMatcher (character-level) with token Jaccard (token-level)
     a_n = normalize_label(a)
@@ -48,10 +62,391 @@ def similarity(a, b):
     seq = SequenceMatcher(None, a_n, b_n).ratio()
     jacc = token_jaccard(a_n, b_n)
     # weighted average — tokens get slightly more weight because they handle reorderings
-    return 0.4 * seq + 0.6 * jacc
+    return SEQ_WEIGHT * seq + TOKEN_WEIGHT * jacc
+
+
+def char_ngrams(s, n=NGRAM_SIZE):
+    s = f" {s} "
+    return {s[i:i + n] for i in range(max(len(s) - n + 1, 1))}
+
+
+# bump whenever normalize_label() or char_ngrams() change, so that persisted
+# label profiles are recomputed
+PROFILE_VERSION = 1
+
+
+class LabelProfile:
+    """Normalized form of one label: the string SequenceMatcher compares, the
+    token set token_jaccard() builds and the character n-grams for blocking."""
+
+    __slots__ = ("norm", "tokens", "ngrams")
+
+    def __init__(self, norm, tokens, ngrams):
+        self.norm = norm
+        self.tokens = tokens
+        self.ngrams = ngrams
+
+    @classmethod
+    def of(cls, label):
+        norm = normalize_label(label)
+        # token_jaccard() normalizes the already normalized label once more
+        return cls(norm, frozenset(normalize_label(norm).split()),
+                   frozenset(char_ngrams(norm)))
+
+
+class ProfileCatalogue:
+    """LabelProfiles keyed by a hash of the raw label, persisted to `path` so
+    that re-runs skip normalization entirely (path=None keeps it in memory)."""
+
+    def __init__(self, path=PROFILE_CACHE):
+        self.path = path
+        self.profiles = {}
+        self.added = 0
+        if path and os.path.exists(path):
+            with open(path, "rb") as f:
+                version, profiles = pickle.load(f)
+            if version == PROFILE_VERSION:
+                self.profiles = {k: LabelProfile(*v) for k, v in profiles.items()}
+
+    @staticmethod
+    def key(label):
+        return hashlib.blake2b(label.encode("utf-8"), digest_size=16).digest()
+
+    def get(self, label):
+        k = self.key(label)
+        profile = self.profiles.get(k)
+        if profile is None:
+            profile = self.profiles[k] = LabelProfile.of(label)
+            self.added += 1
+        return profile
+
+    def save(self):
+        if not (self.path and self.added):
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = self.path + ".tmp"
+        # stored as plain tuples: pickled LabelProfile instances would be bound
+        # to __main__ when this file runs as a script
+        profiles = {k: (p.norm, p.tokens, p.ngrams) for k, p in self.profiles.items()}
+        with open(tmp, "wb") as f:
+            pickle.dump((PROFILE_VERSION, profiles), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.path)
+        self.added = 0
+
+
+def profile_similarity(a, b):
+    """similarity() on two LabelProfiles (same value, no normalization)."""
+    seq = SequenceMatcher(None, a.norm, b.norm).ratio()
+    if not a.tokens or not b.tokens:
+        jacc = 0.0
+    else:
+        jacc = len(a.tokens & b.tokens) / len(a.tokens | b.tokens)
+    return SEQ_WEIGHT * seq + TOKEN_WEIGHT * jacc
+
+
+class BlockingIndex:
+    """Inverted index from normalized tokens and character n-grams to the
+    entities of one reference file.
+
+    similarity() is at most SEQ_WEIGHT * 1.0 + TOKEN_WEIGHT * jaccard, and the
+    Jaccard part is known exactly from the number of shared tokens, so for any
+    threshold above SEQ_WEIGHT the token postings alone yield every pair that
+    can still reach it (pairs without a shared token score <= SEQ_WEIGHT).
+    For thresholds <= SEQ_WEIGHT the character part alone may suffice; pairs
+    sharing at least one character n-gram are then admitted as well, which is
+    a heuristic (check it with --parity)."""
+
+    def __init__(self, profiles):
+        self.token_sizes = []
+        self.by_token = defaultdict(list)
+        self.by_ngram = defaultdict(list)
+        for j, p in enumerate(profiles):
+            self.token_sizes.append(len(p.tokens))
+            for t in p.tokens:
+                self.by_token[t].append(j)
+            for g in p.ngrams:
+                self.by_ngram[g].append(j)
+
+    def candidates(self, profile, threshold):
+        """Sorted indices of the entities that can still reach `threshold`."""
+        keep = self.sharing(profile, threshold)
+        if SEQ_WEIGHT * 1.0 >= threshold:
+            for g in profile.ngrams:
+                keep.update(self.by_ngram.get(g, ()))
+        return sorted(keep)
+
+    def sharing(self, profile, threshold=0.0):
+        """Indices of the entities sharing a token with `profile` that can
+        still reach `threshold`; every other entity scores <= SEQ_WEIGHT."""
+        tokens = profile.tokens
+        shared = Counter()
+        for t in tokens:
+            shared.update(self.by_token.get(t, ()))
+        return {j for j, k in shared.items()
+                if SEQ_WEIGHT * 1.0 + TOKEN_WEIGHT * (
+                    k / (len(tokens) + self.token_sizes[j] - k)) >= threshold}
+
+
+# exact upper bounds tried before SequenceMatcher.ratio(), cheapest first
+PRUNING_BOUNDS = ("token_sizes", "jaccard", "real_quick_ratio", "quick_ratio")
+
+
+def pruned_similarity(a, b, low, stats):
+    """profile_similarity(a, b), or None if an upper bound proves it < low.
+
+    The bounds only replace the character part (or the Jaccard part) by a
+    value that is never smaller, and all three difflib ratios share the
+    2 * matches / (len(a) + len(b)) form, so in floating point, too, every
+    bound is >= the exact score: a pruned pair can never reach `low`. The
+    number of pairs each bound eliminated is counted in `stats`."""
+    na, nb = len(a.tokens), len(b.tokens)
+    if not na or not nb:
+        jacc = 0.0
+    else:
+        if SEQ_WEIGHT * 1.0 + TOKEN_WEIGHT * (min(na, nb) / max(na, nb)) < low:
+            stats["pruned_token_sizes"] += 1
+            return None
+        jacc = len(a.tokens & b.tokens) / len(a.tokens | b.tokens)
+    if SEQ_WEIGHT * 1.0 + TOKEN_WEIGHT * jacc < low:
+        stats["pruned_jaccard"] += 1
+        return None
+    sm = SequenceMatcher(None, a.norm, b.norm)
+    if SEQ_WEIGHT * sm.real_quick_ratio() + TOKEN_WEIGHT * jacc < low:
+        stats["pruned_real_quick_ratio"] += 1
+        return None
+    if SEQ_WEIGHT * sm.quick_ratio() + TOKEN_WEIGHT * jacc < low:
+        stats["pruned_quick_ratio"] += 1
+        return None
+    stats["ratio"] += 1
+    return SEQ_WEIGHT * sm.ratio() + TOKEN_WEIGHT * jacc
+
+
+def heap_top_k(hits, k):
+    """The k best of left-major (i, j, score) hits per left entity i, via a
+    bounded heap per entity; ties go to the lower j (the entity listed
+    first). Returned in left-major order."""
+    for i, group in itertools.groupby(hits, key=lambda h: h[0]):
+        best = heapq.nsmallest(k, group, key=lambda h: (-h[2], h[1]))
+        yield from sorted(best, key=lambda h: h[1])
+
+
+class PythonEngine:
+    """Reference scorer: profile_similarity() (difflib + token Jaccard) per
+    pair, optionally restricted to the pairs admitted by a BlockingIndex and,
+    by default, skipping the full ratio() for pairs an exact upper bound
+    already rules out (see pruned_similarity)."""
+
+    name = "python"
+    pairwise = True  # scores depend on the pair only, so blocks may be split
+
+    def __init__(self, blocking=False, prune=True):
+        self.blocking = blocking
+        self.prune = prune
+
+    def score_block(self, left, right, low, high=None, stats=None):
+        """Yield (i, j, score) for low <= score (< high) in left-major order,
+        given two lists of LabelProfiles."""
+        stats = Counter() if stats is None else stats
+        index = BlockingIndex(right) if self.blocking else None
+        for i, l_prof in enumerate(left):
+            js = index.candidates(l_prof, low) if index else range(len(right))
+            stats["pairs"] += len(right)
+            stats["scored"] += len(js)
+            for j in js:
+                if self.prune:
+                    score = pruned_similarity(l_prof, right[j], low, stats)
+                    if score is None:
+                        continue
+                else:
+                    score = profile_similarity(l_prof, right[j])
+                if score >= low and (high is None or score < high):
+                    yield i, j, score
+
+    def top_k_block(self, left, right, k, floor=0.0, skip=(), stats=None):
+        """Yield the k best (i, j, score >= floor) per left entity, left-major.
+
+        One bounded heap per entity; once it is full its weakest score is
+        the pruning threshold, so most pairs never reach ratio(). With
+        blocking and a floor <= SEQ_WEIGHT the entities sharing a token are
+        scored first, and the others only while the heap still has room for
+        a score <= SEQ_WEIGHT (blocking against the K-th best score), so the
+        result is exact for every floor."""
+        stats = Counter() if stats is None else stats
+        index = BlockingIndex(right) if self.blocking else None
+        for i, l_prof in enumerate(left):
+            if index is None:
+                js = range(len(right))
+            elif floor > SEQ_WEIGHT:
+                js = index.candidates(l_prof, floor)
+            else:
+                js = sorted(index.sharing(l_prof))
+            stats["pairs"] += len(right)
+            stats["scored"] += len(js)
+            heap = []  # (score, -j): heap[0] is the weakest match kept so far
+            self.fill_heap(heap, k, i, l_prof, right, js, floor, skip, stats)
+            if index is not None and floor <= SEQ_WEIGHT and (
+                    len(heap) < k or heap[0][0] <= SEQ_WEIGHT):
+                shared = set(js)
+                rest = [j for j in range(len(right)) if j not in shared]
+                stats["scored"] += len(rest)
+                self.fill_heap(heap, k, i, l_prof, right, rest, floor, skip, stats)
+            for score, neg_j in sorted(heap, key=lambda e: -e[1]):
+                yield i, -neg_j, score
+
+    def fill_heap(self, heap, k, i, l_prof, right, js, floor, skip, stats):
+        """Offer the pairs (i, j) for j in `js` to the bounded heap of i."""
+        for j in js:
+            if (i, j) in skip:
+                continue
+            low = max(floor, heap[0][0]) if len(heap) == k else floor
+            if self.prune:
+                score = pruned_similarity(l_prof, right[j], low, stats)
+                if score is None:
+                    continue
+            else:
+                score = profile_similarity(l_prof, right[j])
+            if score < floor:
+                continue
+            if len(heap) < k:
+                heapq.heappush(heap, (score, -j))
+            elif (score, -j) > heap[0]:
+                heapq.heapreplace(heap, (score, -j))
+
+
+class RapidfuzzEngine:
+    """Character part via rapidfuzz's fuzz.ratio over the whole block (C++,
+    multi-threaded). fuzz.ratio is the LCS-based Indel similarity, which is
+    never below difflib's ratio, so the candidate set is a (near) superset of
+    the python engine's. Token Jaccard is computed exactly, and only for
+    pairs whose character part leaves the threshold reachable."""
+
+    name = "rapidfuzz"
+    pairwise = True
+
+    def __init__(self, workers=-1):
+        self.workers = workers   # cdist threads; -1 = all CPUs
+        try:
+            import numpy  # noqa: F401
+            import rapidfuzz  # noqa: F401
+        except ImportError:
+            sys.exit("--engine rapidfuzz requires the rapidfuzz package (pip install rapidfuzz)")
+
+    def score_block(self, left, right, low, high=None, stats=None):
+        import numpy as np
+        from rapidfuzz import fuzz, process
+        if not left or not right:
+            return
+        seq = process.cdist([p.norm for p in left], [p.norm for p in right],
+                            scorer=fuzz.ratio, dtype=np.float64,
+                            workers=self.workers) / 100.0
+        if stats is not None:
+            stats["pairs"] += seq.size
+            stats["scored"] += seq.size
+        reachable = SEQ_WEIGHT * seq + TOKEN_WEIGHT * 1.0 >= low
+        for i, j in zip(*np.nonzero(reachable)):
+            a, b = left[i], right[j]
+            jacc = (len(a.tokens & b.tokens) / len(a.tokens | b.tokens)
+                    if a.tokens and b.tokens else 0.0)
+            score = SEQ_WEIGHT * float(seq[i, j]) + TOKEN_WEIGHT * jacc
+            if score >= low and (high is None or score < high):
+                yield int(i), int(j), score
+
+    def top_k_block(self, left, right, k, floor=0.0, skip=(), stats=None):
+        hits = self.score_block(left, right, floor, stats=stats)
+        return heap_top_k((h for h in hits if (h[0], h[1]) not in skip), k)
+
+
+class TfidfEngine:
+    """Character part as the cosine of TF-IDF weighted character n-gram
+    vectors; both the cosine and the token Jaccard of a whole AIDOC x
+    reference block come out of sparse matrix products (SciPy). Pairs
+    sharing neither an n-gram nor a token score 0 and are never touched."""
+
+    name = "tfidf"
+    pairwise = False  # idf is computed over the block: score whole files
+
+    def __init__(self):
+        try:
+            import numpy  # noqa: F401
+            import scipy  # noqa: F401
+        except ImportError:
+            sys.exit("--engine tfidf requires numpy and scipy (pip install scipy)")
+
+    def _incidence(self, feature_sets, vocab):
+        rows, cols = [], []
+        for i, feats in enumerate(feature_sets):
+            for f in feats:
+                rows.append(i)
+                cols.append(vocab.setdefault(f, len(vocab)))
+        return rows, cols
+
+    def _matrix(self, rows, cols, n_rows, n_cols):
+        import numpy as np
+        from scipy import sparse
+        return sparse.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(n_rows, n_cols))
+
+    def score_block(self, left, right, low, high=None, stats=None):
+        if not left or not right:
+            return
+        import numpy as np
+        from scipy import sparse
+        vocab = {}
+        l_ng = self._incidence([p.ngrams for p in left], vocab)
+        r_ng = self._incidence([p.ngrams for p in right], vocab)
+        L = self._matrix(*l_ng, len(left), len(vocab))
+        R = self._matrix(*r_ng, len(right), len(vocab))
+        # smoothed idf over the block, rows L2-normalized
+        df = np.asarray((L > 0).sum(axis=0) + (R > 0).sum(axis=0)).ravel()
+        idf = sparse.diags(np.log((1 + len(left) + len(right)) / (1 + df)) + 1.0)
+        L, R = L @ idf, R @ idf
+        for M in (L, R):
+            norms = np.sqrt(np.asarray(M.multiply(M).sum(axis=1)).ravel())
+            norms[norms == 0] = 1.0
+            M.data /= np.repeat(norms, np.diff(M.indptr))
+        cosine = (L @ R.T).tocsr()
+
+        vocab = {}
+        l_tok = self._incidence([p.tokens for p in left], vocab)
+        r_tok = self._incidence([p.tokens for p in right], vocab)
+        TL = self._matrix(*l_tok, len(left), len(vocab))
+        TR = self._matrix(*r_tok, len(right), len(vocab))
+        inter = (TL @ TR.T).tocoo()
+        l_size = np.array([len(p.tokens) for p in left], dtype=float)
+        r_size = np.array([len(p.tokens) for p in right], dtype=float)
+        jacc = sparse.csr_matrix(
+            (inter.data / (l_size[inter.row] + r_size[inter.col] - inter.data),
+             (inter.row, inter.col)), shape=inter.shape)
+
+        scores = (SEQ_WEIGHT * cosine + TOKEN_WEIGHT * jacc).tocsr()
+        scores.sort_indices()
+        if stats is not None:
+            stats["pairs"] += len(left) * len(right)
+            stats["scored"] += scores.nnz
+        for i in range(len(left)):
+            start, end = scores.indptr[i], scores.indptr[i + 1]
+            for j, score in zip(scores.indices[start:end], scores.data[start:end]):
+                if score >= low and (high is None or score < high):
+                    yield i, int(j), float(score)
+
+    def top_k_block(self, left, right, k, floor=0.0, skip=(), stats=None):
+        hits = self.score_block(left, right, floor, stats=stats)
+        return heap_top_k((h for h in hits if (h[0], h[1]) not in skip), k)
+
+
+ENGINES = {e.name: e for e in (PythonEngine, RapidfuzzEngine, TfidfEngine)}
+
+
+def make_engine(name="python", blocking=False):
+    if name == "python":
+        return PythonEngine(blocking)
+    return ENGINES[name]()
 
 
 def extract_entities(g):
+    import rdflib
+    from rdflib import RDFS, OWL
+    from rdflib.namespace import SKOS
+
     entities = {}
     # DPV (and other SKOS-based vocabularies) declare concepts as
     # rdfs:Class / skos:Concept rather than owl:Class
@@ -66,7 +461,12 @@ def extract_entities(g):
                       OWL.DatatypeProperty, OWL.AnnotationProperty)
     subjects = {s for s in subjects
                 if not any((s, rdflib.RDF.type, t) in g for t in property_types)}
-    for s in subjects:
+    # anonymous class expressions (owl:unionOf etc.) are not concepts; their
+    # blank-node ids are random per parse
+    subjects = {s for s in subjects if not isinstance(s, rdflib.BNode)}
+    # sorted, so that the entity order (and with it the order of tied rows in
+    # the CSVs) does not depend on set iteration or on the process parsing
+    for s in sorted(subjects, key=str):
         labels = []
         # common label predicates
         for lbl in g.objects(s, RDFS.label):
@@ -92,42 +492,216 @@ def namespace_of(iri):
     return iri.rsplit("#", 1)[0] + "#" if "#" in iri else iri.rsplit("/", 1)[0] + "/"
 
 
-def main(threshold, right_dir, left_file):
-    left_g = rdflib.Graph().parse(left_file, format="turtle")
-    left_classes = extract_entities(left_g)
+def dominant_namespaces(references):
+    """stem -> the namespace most of the file's entities live in."""
+    dominant_ns = {}
+    for stem, right_classes in references.items():
+        ns_count = Counter(namespace_of(r_iri) for r_iri in right_classes)
+        dominant_ns[stem] = max(ns_count, key=ns_count.get) if ns_count else ""
+    return dominant_ns
+
+
+def owned_references(references):
+    """Split the reference entities into what each file scores.
+
+    Reference TTLs redeclare terms from other vocabularies (e.g. rains.ttl
+    contains mls:Dataset and prov:Agent). Each (iri, label) declaration is
+    assigned to the file whose dominant namespace owns the IRI, otherwise to
+    the first declaring file (sorted order), and is scored only there.
+    Returns (stem -> {iri: label} owned by the file,
+             (iri, label) -> stems declaring it)."""
+    dominant_ns = dominant_namespaces(references)
+    declared_in = {}
+    for stem, right_classes in references.items():
+        for entity in right_classes.items():
+            declared_in.setdefault(entity, []).append(stem)
+    owned = {stem: {} for stem in references}
+    for (r_iri, r_label), stems in declared_in.items():
+        owners = [s for s in stems if namespace_of(r_iri) == dominant_ns[s]]
+        owned[owners[0] if owners else stems[0]][r_iri] = r_label
+    return owned, declared_in
+
+
+def self_matches(left, right):
+    """(i, j) positions where a left and a right entity share the IRI."""
+    right_pos = {iri: j for j, (iri, _) in enumerate(right)}
+    return {(i, right_pos[iri]) for i, (iri, _) in enumerate(left) if iri in right_pos}
+
+
+def score_pairs(left_classes, right_classes, low, high=None, engine=None,
+                catalogue=None, stats=None, top_k=None):
+    """Yield (l_iri, l_label, r_iri, r_label, score) for all pairs with
+    low <= score (< high, if given), in left-major order, scored by `engine`
+    (default: the brute-force python engine). With `top_k`, only the top_k
+    best pairs per left entity are kept and `low` acts as a floor."""
+    engine = engine or PythonEngine()
+    catalogue = catalogue or ProfileCatalogue(None)
+    left = list(left_classes.items())
+    right = list(right_classes.items())
+    left_profiles = [catalogue.get(l) for _, l in left]
+    right_profiles = [catalogue.get(r) for _, r in right]
+    if top_k:
+        hits = engine.top_k_block(left_profiles, right_profiles, top_k, low,
+                                  self_matches(left, right), stats)
+    else:
+        hits = engine.score_block(left_profiles, right_profiles, low, high, stats)
+    for i, j, score in hits:
+        (l_iri, l_label), (r_iri, r_label) = left[i], right[j]
+        if l_iri != r_iri:
+            yield l_iri, l_label, r_iri, r_label, score
+
+
+def load_concepts(path):
+    """extract_entities() of the TTL at `path`, read from the entity store."""
+    from entity_store import EntityStore
+    return EntityStore.open([path]).concepts(path)
+
+
+def load_references(files, jobs=1):
+    """stem -> {iri: label} for the reference TTLs (in the given order),
+    read from the entity store; files not indexed yet are parsed in a
+    process pool (of `jobs` workers if jobs > 1)."""
+    from entity_store import EntityStore
+    store = EntityStore.open(files, jobs=jobs if jobs > 1 else None)
+    return {Path(path).stem: store.concepts(path) for path in files}
+
+
+def _score_chunk(task):
+    engine, left, right, low, high, top_k, skip = task
+    stats = Counter()
+    if top_k:
+        hits = engine.top_k_block(left, right, top_k, low, skip, stats)
+    else:
+        hits = engine.score_block(left, right, low, high, stats)
+    return list(hits), stats
 
+
+def score_references(left_classes, references, low, high=None, engine=None,
+                     catalogue=None, stats=None, jobs=1, top_k=None):
+    """stem -> [(l_iri, l_label, r_iri, r_label, score)] with low <= score
+    (< high) for every reference file, each list in left-major order; with
+    `top_k`, the top_k best pairs per AIDOC entity among the entities each
+    file owns (low = floor).
+
+    Every reference declaration is scored once, in the file that owns it
+    (owned_references()); its pairs are then listed under every file that
+    declares it, so align() still sees the per-file duplicates. With jobs > 1
+    the files, and CHUNK_SIZE slices of large files for engines whose scores
+    are pairwise, are scored in a process pool. Chunks are fixed-size and
+    re-sorted into left-major order (top-k: the best of the chunks' top-k),
+    so the result is identical to the serial one regardless of the number
+    of workers."""
+    engine = engine or PythonEngine()
+    catalogue = catalogue or ProfileCatalogue(None)
+    stats = Counter() if stats is None else stats
+    owned, declared_in = owned_references(references)
+    stats["redeclared"] += sum(len(v) for v in references.values()) - len(declared_in)
+    if jobs <= 1:
+        hits = {stem: list(score_pairs(left_classes, right_classes, low, high, engine,
+                                       catalogue, stats, top_k))
+                for stem, right_classes in owned.items()}
+    else:
+        hits = _score_parallel(left_classes, owned, low, high, engine, catalogue, stats,
+                               jobs, top_k)
+
+    return list_declarations(hits, left_classes, references, declared_in)
+
+
+def list_declarations(hits, left_classes, references, declared_in):
+    """List the rows scored under the owning files (stem -> rows) under every
+    file declaring the reference entity, each file in left-major order."""
+    left_pos = {iri: i for i, iri in enumerate(left_classes)}
+    right_pos = {stem: {iri: j for j, iri in enumerate(right_classes)}
+                 for stem, right_classes in references.items()}
+    results = {stem: [] for stem in references}
+    for rows in hits.values():
+        for row in rows:
+            for stem in declared_in[row[2], row[3]]:
+                results[stem].append(row)
+    for stem, rows in results.items():
+        rows.sort(key=lambda row: (left_pos[row[0]], right_pos[stem][row[2]]))
+    return results
+
+
+def _score_parallel(left_classes, references, low, high, engine, catalogue, stats,
+                    jobs, top_k):
+    left = list(left_classes.items())
+    left_profiles = [catalogue.get(l_label) for _, l_label in left]
+    if isinstance(engine, RapidfuzzEngine):
+        engine = RapidfuzzEngine(workers=1)   # the pool's processes share the CPUs
+    rights, tasks, owners = {}, [], []
+    for stem, right_classes in references.items():
+        right = rights[stem] = list(right_classes.items())
+        size = CHUNK_SIZE if engine.pairwise else max(len(right), 1)
+        for start in range(0, len(right), size):
+            chunk = [catalogue.get(r_label) for _, r_label in right[start:start + size]]
+            skip = self_matches(left, right[start:start + size]) if top_k else ()
+            tasks.append((engine, left_profiles, chunk, low, high, top_k, skip))
+            owners.append((stem, start))
+    hits = {stem: [] for stem in references}
+    with ProcessPoolExecutor(jobs) as pool:
+        for (stem, start), (chunk_hits, chunk_stats) in zip(
+                owners, pool.map(_score_chunk, tasks)):
+            stats.update(chunk_stats)
+            hits[stem].extend((i, start + j, score) for i, j, score in chunk_hits)
+
+    results = {}
+    for stem, found in hits.items():
+        results[stem] = []
+        found = sorted(found, key=lambda h: (h[0], h[1]))
+        if top_k:
+            found = heap_top_k(found, top_k)
+        for i, j, score in found:
+            (l_iri, l_label), (r_iri, r_label) = left[i], rights[stem][j]
+            if l_iri != r_iri:
+                results[stem].append((l_iri, l_label, r_iri, r_label, score))
+    return results
+
+
+def align(left_classes, references, threshold, engine=None, catalogue=None, jobs=1,
+          scored=None, top_k=None):
+    """Score the AIDOC entities against each reference file.
+
+    `references` maps file stem -> {iri: label} (in sorted file order);
+    `scored` optionally supplies the score_references() result (e.g. read
+    from the similarity store) instead of scoring. With `top_k`, each AIDOC
+    entity keeps its top_k best matches per file, `threshold` being the floor.
+    Returns (per_file rows, number of unique pairs, cross-file duplicates)."""
     # Reference TTLs redeclare terms from other vocabularies (e.g. rains.ttl
     # contains mls:Dataset and prov:Agent), so the same (aidoc, ref) pair can
-    # surface under several files. Collect candidates globally, then assign
-    # each unique pair to the file whose dominant namespace owns the target
-    # IRI; otherwise to the first file (sorted order) that produced it.
-    files = sorted(Path(right_dir).glob("*.ttl"))
-    dominant_ns = {}
+    # surface under several files (score_references() scores each declaration
+    # once but lists it under every declaring file). Collect candidates
+    # globally, then assign each unique pair to the file whose dominant
+    # namespace owns the target IRI; otherwise to the first file (sorted
+    # order) that produced it.
+    dominant_ns = dominant_namespaces(references)
     candidates = {}  # (l_iri, r_iri) -> {stem: row}
-    for fname in files:
-        right_g = rdflib.Graph().parse(fname, format="turtle")
-        right_classes = extract_entities(right_g)
-        ns_count = {}
-        for r_iri in right_classes:
-            ns = namespace_of(r_iri)
-            ns_count[ns] = ns_count.get(ns, 0) + 1
-        dominant_ns[fname.stem] = max(ns_count, key=ns_count.get) if ns_count else ""
-
-        for l_iri, l_label in left_classes.items():
-            for r_iri, r_label in right_classes.items():
-                if l_iri == r_iri:
-                    continue
-                score = similarity(l_label, r_label)
-                if score >= threshold:
-                    candidates.setdefault((l_iri, r_iri), {})[fname.stem] = {
-                        "aidoc_iri": l_iri,
-                        "aidoc_label": l_label,
-                        f"{fname.stem}_iri": r_iri,
-                        f"{fname.stem}_label": r_label,
-                        "similarity": round(score, 3),
-                    }
-
-    per_file = {f.stem: [] for f in files}
+    stats = Counter()
+    engine = engine or PythonEngine()
+    if scored is None:
+        scored = score_references(left_classes, references, threshold, engine=engine,
+                                  catalogue=catalogue, stats=stats, jobs=jobs, top_k=top_k)
+    for stem in references:
+        for l_iri, l_label, r_iri, r_label, score in scored[stem]:
+            candidates.setdefault((l_iri, r_iri), {})[stem] = {
+                "aidoc_iri": l_iri,
+                "aidoc_label": l_label,
+                f"{stem}_iri": r_iri,
+                f"{stem}_label": r_label,
+                "similarity": round(score, 3),
+            }
+    if stats["redeclared"]:
+        print(f"Scored {stats['redeclared']} redeclared reference entities once, "
+              f"in their owning file")
+    if stats["scored"] < stats["pairs"]:
+        print(f"{engine.name}: scored {stats['scored']} of {stats['pairs']} pairs "
+              f"({stats['scored'] / max(stats['pairs'], 1):.1%})")
+    if stats["ratio"]:
+        print("Pruned before ratio(): " + ", ".join(
+            f"{b}={stats['pruned_' + b]}" for b in PRUNING_BOUNDS)
+            + f"; full ratio() on {stats['ratio']} pairs")
+
+    per_file = {stem: [] for stem in references}
     n_dedup = 0
     for (l_iri, r_iri), by_stem in candidates.items():
         owners = [s for s in by_stem if namespace_of(r_iri) == dominant_ns[s]]
@@ -135,22 +709,105 @@ def main(threshold, right_dir, left_file):
         if len(by_stem) > 1:
             n_dedup += len(by_stem) - 1
         per_file[stem].append(by_stem[stem])
+    for stem in per_file:
+        per_file[stem].sort(key=lambda x: -x['similarity'])
+    return per_file, len(candidates), n_dedup
+
+
+def compare_engines(left_classes, references, threshold, catalogue):
+    """Candidate-set overlap and wall time of every engine against the
+    reference (python, brute-force) engine; written to ENGINE_REPORT."""
+    def pairs_of(per_file):
+        return {(row["aidoc_iri"], row[f"{stem}_iri"])
+                for stem, rows in per_file.items() for row in rows}
+
+    results = []
+    for name, engine in [("python", PythonEngine(prune=False)),
+                         ("python+pruning", PythonEngine()),
+                         ("python+blocking", PythonEngine(True))] + \
+            [(n, make_engine(n)) for n in ENGINES if n != "python"]:
+        t0 = time.perf_counter()
+        per_file, _, _ = align(left_classes, references, threshold, engine, catalogue)
+        results.append((name, time.perf_counter() - t0, pairs_of(per_file)))
+
+    ref_pairs = results[0][2]
+    rows = []
+    for name, seconds, found in results:
+        common = len(found & ref_pairs)
+        rows.append({
+            "engine": name, "threshold": threshold, "seconds": round(seconds, 3),
+            "candidates": len(found), "overlap": common,
+            "recall": round(common / len(ref_pairs), 4) if ref_pairs else 1.0,
+            "precision": round(common / len(found), 4) if found else 1.0,
+        })
+    with open(ENGINE_REPORT, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=rows[0].keys())
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"{'engine':16s} {'seconds':>8s} {'cand.':>6s} {'overlap':>7s} {'recall':>7s} {'prec.':>7s}")
+    for r in rows:
+        print(f"{r['engine']:16s} {r['seconds']:8.2f} {r['candidates']:6d} {r['overlap']:7d} "
+              f"{r['recall']:7.2%} {r['precision']:7.2%}")
+    print(f"✅ Engine comparison → {ENGINE_REPORT}")
+
+
+def main(threshold, right_dir, left_file, blocking=False, parity=False,
+         engine="python", compare=False, jobs=1, use_store=False, sweep=None,
+         top_k=None):
+    files = sorted(Path(right_dir).glob("*.ttl"))
+    if use_store or sweep:
+        from score_store import ScoreStore, print_sweep
+        store = ScoreStore.load_or_build(left_file, right_dir, jobs=jobs)
+        if sweep:
+            print_sweep(store.sweep(sorted(sweep)))
+            return
+        scored = store.top_k(top_k, threshold) if top_k else store.pairs(threshold)
+        per_file, n_pairs, n_dedup = align(store.left_classes, store.references, threshold,
+                                           scored=scored)
+        write_alignments(per_file, n_pairs, n_dedup)
+        return
+
+    left_classes = load_concepts(left_file)
+    references = load_references(files, jobs)
+
+    catalogue = ProfileCatalogue()
+    if compare:
+        compare_engines(left_classes, references, threshold, catalogue)
+        catalogue.save()
+        return
+    per_file, n_pairs, n_dedup = align(left_classes, references, threshold,
+                                       make_engine(engine, blocking or parity), catalogue,
+                                       jobs, top_k=top_k)
+    catalogue.save()
+    if parity:
+        # the blocked and pruned result must reproduce the brute-force CSVs
+        # row for row
+        brute, _, _ = align(left_classes, references, threshold,
+                            PythonEngine(prune=False), catalogue, top_k=top_k)
+        diff = [stem for stem in brute if brute[stem] != per_file[stem]]
+        mode = f"top-{top_k} with floor" if top_k else "threshold"
+        if diff:
+            sys.exit(f"❌ Blocking/pruning parity failed at {mode} {threshold} for: "
+                     + ", ".join(diff))
+        print(f"✅ Blocking/pruning parity: identical output for all {len(files)} files "
+              f"at {mode} {threshold}")
+    write_alignments(per_file, n_pairs, n_dedup)
+
 
-    for fname in files:
-        stem = fname.stem
-        alignments = per_file[stem]
+def write_alignments(per_file, n_pairs, n_dedup):
+    for stem, alignments in per_file.items():
         out_path = os.path.join(OUTPUT_DIR, f"{stem}_alignment.csv")
         if alignments:
             with open(out_path, "w", newline="", encoding="utf-8") as f:
                 writer = csv.DictWriter(f, fieldnames=alignments[0].keys())
                 writer.writeheader()
-                writer.writerows(sorted(alignments, key=lambda x: -x['similarity']))
+                writer.writerows(alignments)
         elif os.path.exists(out_path):
             os.remove(out_path)
         print(f"Found {len(alignments)} potential lexical alignments → {out_path}")
 
     print(f"✅ Structural alignment completed "
-          f"({len(candidates)} unique pairs, {n_dedup} cross-file duplicates removed).")
+          f"({n_pairs} unique pairs, {n_dedup} cross-file duplicates removed).")
 
 
 if __name__ == '__main__':
@@ -160,5 +817,37 @@ if __name__ == '__main__':
                              '(0.6 is the candidate-generation threshold reported in the paper)')
     parser.add_argument('--right', '-r', default=RIGHT_FILE, help='directory with reference ontology TTL files')
     parser.add_argument('--left', '-l', default=LEFT_FILE, help='left-hand TTL file')
+    parser.add_argument('--blocking', action='store_true',
+                        help='only score pairs admitted by an inverted token/character n-gram index '
+                             '(exact for thresholds above 0.4 and for --top-k)')
+    parser.add_argument('--parity', action='store_true',
+                        help='run blocked/pruned and brute-force scoring and fail unless the CSVs are identical')
+    parser.add_argument('--engine', choices=sorted(ENGINES), default='python',
+                        help='similarity backend: python (difflib, reference), rapidfuzz, '
+                             'or tfidf (SciPy sparse char-n-gram cosine)')
+    parser.add_argument('--compare-engines', action='store_true',
+                        help='report candidate overlap and wall time of all engines against '
+                             'the python engine instead of writing alignments')
+    parser.add_argument('--jobs', '-j', type=int, default=1,
+                        help='parse and score reference files (and chunks of large ones) '
+                             'in a pool of N processes; output does not depend on N')
+    parser.add_argument('--store', action='store_true',
+                        help='read scores from the persistent similarity store (score_store.py), '
+                             'building it first if the inputs changed')
+    parser.add_argument('--sweep', type=float, nargs='+', metavar='T',
+                        help='print candidate counts for these thresholds from the similarity store')
+    parser.add_argument('--top-k', '-k', type=int, metavar='K',
+                        help='instead of a global threshold, keep the K best matches per AIDOC '
+                             'entity and reference file (at least --min-score)')
+    parser.add_argument('--min-score', type=float, default=0.0,
+                        help='floor for --top-k matches (default: 0.0)')
     args = parser.parse_args()
-    main(args.threshold, args.right, args.left)
\ No newline at end of file
+    if args.parity and args.engine != 'python':
+        parser.error('--parity checks the blocked python engine; drop --engine')
+    if args.blocking and args.engine != 'python':
+        parser.error(f'--blocking applies to the python engine only, not --engine {args.engine}')
+    # in top-k mode the floor takes the place of the threshold
+    threshold = args.min_score if args.top_k else args.threshold
+    main(threshold, args.right, args.left, args.blocking, args.parity,
+         args.engine, args.compare_engines, args.jobs, args.store, args.sweep,
+         args.top_k)
\ No newline at end of file
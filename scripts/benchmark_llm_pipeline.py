@@ -0,0 +1,265 @@
+"""End-to-end throughput benchmark of the LLM scripts against the stand-in server.
+
+Runs the LLM stages of the pipeline against llm_standin.py (started in this
+process on a free port) instead of Ollama, so their pipeline-side cost can
+be measured and tracked on a CPU-only machine:
+
+    semantic            alignment_semantic.py, one request at a time
+    semantic_c<N>       alignment_semantic.py --concurrency N
+    semantic_b<N>       alignment_semantic.py --batch-size N
+    ensemble            alignment_semantic.py --models over two stand-in
+                        models, --concurrency N each
+    fn_band             alignment_fn_band.py
+    coverage            semantic_mapping.py (one run)
+    multirun            run_coverage_multirun.py over two stand-in models,
+                        iteration "current", T 0.0/1.0, --runs runs per cell
+
+Every stage runs as its own process with the reply cache off, in a sandbox
+directory (default reports/benchmark/llm_pipeline/) holding links to the
+ontology inputs and its own reports/, so the real reports, curation sheets
+and reply cache are never touched. The sandbox's structural candidates and
+entity catalogue are built once before the measured stages. The sandbox is
+scratch space (not tracked); only the results JSON is.
+
+Per stage the benchmark records the wall time, the requests the server
+answered, requests per second, the wall time with a request in flight at
+the server (server_active_s) and the rest of the wall time (overhead_s:
+interpreter start, imports, parsing, prompt building, writing outputs),
+plus the stage's client-side latency percentiles and the decisions of
+its adaptive concurrency controller (see llm_control.py) from its run
+metrics. With
+the default zero simulated latency, throughput is bounded by the pipeline
+alone; --ttft / --token-rate simulate a model, --chatter adds text after
+the replies' JSON (cut off by the early stream stop, see llm_client.py),
+--fail-rate and --malformed-rate exercise the retry and repair paths.
+
+Usage:
+    python scripts/benchmark_llm_pipeline.py
+    python scripts/benchmark_llm_pipeline.py --ttft 0.05 --token-rate 200 --parallel 4
+    python scripts/benchmark_llm_pipeline.py --stages semantic semantic_c --concurrency 8
+"""
+
+import argparse
+import glob
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from llm_standin import serve_in_thread
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(SCRIPT_DIR)
+RESULTS_FILE = "reports/benchmark/llm_pipeline.json"
+SANDBOX_DIR = "reports/benchmark/llm_pipeline"
+INPUTS = ("aidoc-ap.ttl", "annex_4.ttl", "reference_ontologies")
+STAGES = ("semantic", "semantic_c", "semantic_b", "ensemble", "fn_band", "coverage", "multirun")
+STANDIN_MODELS = "standin-a,standin-b"
+
+
+def script(name):
+    return os.path.join(SCRIPT_DIR, f"{name}.py")
+
+
+def stage_command(stage, args):
+    """(command, extra environment, run metrics file patterns) of a stage."""
+    if stage == "semantic":
+        return [script("alignment_semantic")], {}, ["reports/alignment_semantic/run_metrics.json"]
+    if stage == "semantic_c":
+        return ([script("alignment_semantic"), "--concurrency", str(args.concurrency)], {},
+                ["reports/alignment_semantic/run_metrics.json"])
+    if stage == "semantic_b":
+        return ([script("alignment_semantic"), "--batch-size", str(args.batch_size)], {},
+                ["reports/alignment_semantic/run_metrics.json"])
+    if stage == "ensemble":
+        return ([script("alignment_semantic"), "--models", *STANDIN_MODELS.split(","),
+                 "--concurrency", str(args.concurrency)], {},
+                ["reports/alignment_ensemble/run_metrics.json"])
+    if stage == "fn_band":
+        return [script("alignment_fn_band")], {}, ["reports/alignment_fn_band/run_metrics.json"]
+    if stage == "coverage":
+        return ([script("semantic_mapping")], {"RUN_TAG": "bench"},
+                ["reports/llm_metrics/semantic_mapping_bench.json"])
+    # run_coverage_multirun skips cells whose run JSON exists
+    for path in glob.glob("reports/semantic_mapping_*_run*.json") \
+            + glob.glob("reports/llm_metrics/semantic_mapping_*_run*.json"):
+        os.remove(path)
+    return ([script("run_coverage_multirun")],
+            {"COVERAGE_MODELS": STANDIN_MODELS, "ITERATIONS": "current",
+             "TEMPERATURES": "0.0,1.0", "N_RUNS": str(args.runs)},
+            ["reports/llm_metrics/semantic_mapping_*_run*.json"])
+
+
+def stage_name(stage, args):
+    return {"semantic_c": f"semantic_c{args.concurrency}",
+            "semantic_b": f"semantic_b{args.batch_size}"}.get(stage, stage)
+
+
+def prepare_sandbox(sandbox, fresh):
+    """Link the inputs into `sandbox` and build its structural candidates and
+    entity catalogue (once)."""
+    if fresh and os.path.isdir(sandbox):
+        shutil.rmtree(sandbox)
+    os.makedirs(os.path.join(sandbox, "reports"), exist_ok=True)
+    for name in INPUTS:
+        link = os.path.join(sandbox, name)
+        if not os.path.lexists(link):
+            os.symlink(os.path.join(ROOT_DIR, name), link)
+    setup = [("alignment_structural", [], "reports/alignment_structural"),
+             ("extract_entities", [], "reports/aidoc-entities.csv")]
+    for name, extra, output in setup:
+        if os.path.exists(os.path.join(sandbox, output)):
+            continue
+        print(f"[setup] {name}")
+        proc = subprocess.run([sys.executable, script(name)] + extra, cwd=sandbox,
+                              capture_output=True, text=True)
+        if proc.returncode != 0:
+            sys.exit(f"❌ Sandbox setup ({name}) failed:\n{proc.stderr[-2000:]}")
+
+
+def client_metrics(patterns):
+    """Latency percentiles of the stage's run metrics, merged over models
+    (and over the run files of a multirun)."""
+    paths = sorted(p for pattern in patterns for p in glob.glob(pattern))
+    totals = ("calls", "retries", "stream_stopped", "saved_tokens_est", "saved_s_est")
+    merged = {**dict.fromkeys(totals, 0), "latency_p50_s": [], "latency_p95_s": [],
+              "limit_mean": [], "limit_decreases": 0, "circuit_opened": 0,
+              "suggested_num_parallel": []}
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            metrics = json.load(f)
+        for s in metrics["models"].values():
+            for key in totals:
+                merged[key] += s.get(key) or 0
+            for key in ("latency_p50_s", "latency_p95_s"):
+                if s[key] is not None:
+                    merged[key].append(s[key])
+        for c in metrics.get("control", {}).values():
+            merged["limit_decreases"] += c["decreases"]
+            merged["circuit_opened"] += c["circuit_opened"]
+            for key in ("limit_mean", "suggested_num_parallel"):
+                if c[key] is not None:
+                    merged[key].append(c[key])
+    # a multirun has one metrics file per run: report the worst run
+    for key in ("latency_p50_s", "latency_p95_s", "limit_mean", "suggested_num_parallel"):
+        merged[key] = max(merged[key]) if merged[key] else None
+    merged["saved_s_est"] = round(merged["saved_s_est"], 3)
+    return merged
+
+
+def run_stage(stage, args, server, env, sandbox):
+    cmd, extra, metrics = stage_command(stage, args)
+    name = stage_name(stage, args)
+    log = os.path.join("logs", f"{name}.log")
+    os.makedirs("logs", exist_ok=True)
+    before = server.standin.snapshot()
+    t0 = time.perf_counter()
+    with open(log, "w", encoding="utf-8") as out:
+        proc = subprocess.run([sys.executable] + cmd, env={**env, **extra}, cwd=".",
+                              stdout=out, stderr=subprocess.STDOUT)
+    wall = time.perf_counter() - t0
+    after = server.standin.snapshot()
+    if proc.returncode != 0:
+        with open(log, encoding="utf-8") as f:
+            tail = f.read()[-2000:]
+        sys.exit(f"❌ Stage {name} exited with {proc.returncode} "
+                 f"({os.path.join(sandbox, log)}):\n{tail}")
+
+    delta = {key: after[key] - before[key] for key in after}
+    requests = delta["requests"]
+    return {
+        "stage": name,
+        "wall_s": round(wall, 3),
+        "requests": requests,
+        "failed": delta["failed"],
+        "malformed": delta["malformed"],
+        "requests_per_s": round(requests / wall, 2) if wall > 0 else None,
+        "server_active_s": round(delta["active_s"], 3),
+        "server_busy_s": round(delta["busy_s"], 3),
+        "overhead_s": round(wall - delta["active_s"], 3),
+        "overhead_per_request_ms": round(1000 * (wall - delta["active_s"]) / requests, 2)
+        if requests else None,
+        "prompt_tokens": delta["prompt_tokens"],
+        "completion_tokens": delta["completion_tokens"],
+        "client": client_metrics(metrics),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True,
+                              text=True, check=True, cwd=ROOT_DIR).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def main(args):
+    output = os.path.abspath(args.output)
+    sandbox = os.path.abspath(args.sandbox)
+    prepare_sandbox(sandbox, args.fresh)
+
+    server, url = serve_in_thread(ttft=args.ttft, token_rate=args.token_rate, chatter=args.chatter,
+                                  parallel=args.parallel, fail_rate=args.fail_rate,
+                                  malformed_rate=args.malformed_rate, seed=args.seed)
+    print(f"LLM stand-in on {url} (ttft {args.ttft}s, {args.token_rate or '∞'} tokens/s, "
+          f"{args.parallel} parallel)")
+    env = {**os.environ, "PYTHONUNBUFFERED": "1", "OLLAMA_URL": url,
+           "OLLAMA_API_KEY": "stand-in", "OLLAMA_MODEL": "standin-a", "LLM_CACHE": "off"}
+
+    os.chdir(sandbox)
+    results = []
+    print(f"{'stage':14s} {'wall':>8s} {'requests':>9s} {'req/s':>8s} {'server':>8s} "
+          f"{'overhead':>9s} {'ms/req':>8s}")
+    try:
+        for stage in args.stages:
+            row = run_stage(stage, args, server, env, sandbox)
+            results.append(row)
+            print(f"{row['stage']:14s} {row['wall_s']:7.2f}s {row['requests']:9d} "
+                  f"{row['requests_per_s'] or 0:8.1f} {row['server_active_s']:7.2f}s "
+                  f"{row['overhead_s']:8.2f}s {row['overhead_per_request_ms'] or 0:8.1f}")
+    finally:
+        server.shutdown()
+
+    report = {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "standin": {"ttft_s": args.ttft, "token_rate": args.token_rate, "chatter": args.chatter,
+                    "parallel": args.parallel, "fail_rate": args.fail_rate,
+                    "malformed_rate": args.malformed_rate, "seed": args.seed},
+        "concurrency": args.concurrency, "batch_size": args.batch_size, "runs": args.runs,
+        "server": server.standin.snapshot(),
+        "results": results,
+    }
+    Path(output).parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"✅ LLM pipeline benchmark ({len(results)} stages) → {output}")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    ap.add_argument("--ttft", type=float, default=0.0, help="simulated seconds to the first token")
+    ap.add_argument("--token-rate", type=float, default=0.0,
+                    help="simulated completion tokens per second (0: reply at once)")
+    ap.add_argument("--parallel", type=int, default=4, help="requests the server serves at once")
+    ap.add_argument("--chatter", type=float, default=0.0,
+                    help="share of replies with an explanation after the JSON")
+    ap.add_argument("--fail-rate", type=float, default=0.0)
+    ap.add_argument("--malformed-rate", type=float, default=0.0)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--concurrency", "-c", type=int, default=4, help="of the semantic_c stage")
+    ap.add_argument("--batch-size", "-b", type=int, default=8, help="of the semantic_b stage")
+    ap.add_argument("--runs", type=int, default=2, help="multirun runs per cell")
+    ap.add_argument("--sandbox", default=SANDBOX_DIR)
+    ap.add_argument("--fresh", action="store_true",
+                    help="rebuild the sandbox (structural candidates, entity catalogue)")
+    ap.add_argument("--output", "-o", default=RESULTS_FILE)
+    main(ap.parse_args())
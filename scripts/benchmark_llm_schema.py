@@ -0,0 +1,200 @@
+"""Free-form vs schema-constrained LLM replies on the same inputs.
+
+Sends the same prompts once per reply format (LLM_SCHEMA / --schema, see
+llm_client.py) with the reply cache off:
+
+    off        free-form "JSON only" replies (the parsers' repair paths)
+    full       response_format JSON schema with the full keys
+    compact    the same schema with one-letter keys
+
+    alignment  a seeded sample of the candidate pairs of
+               reports/alignment_structural, classified in-process
+               (alignment_semantic.classify_pairs; nothing is written)
+    coverage   one semantic_mapping.py run per format
+               (RUN_TAG=schema_<format>)
+
+and reports per task and format the completion tokens, latency
+percentiles, how many replies needed a repair (parse path other than
+strict JSON) or failed, and the agreement with the free-form replies
+(same relation; coverage score within 0.05), plus the token and latency
+difference against free-form. Runs against OLLAMA_URL, or against the
+stand-in server (llm_standin.py) with --standin.
+
+Usage:
+    python scripts/benchmark_llm_schema.py [--sample 40] [--tasks alignment coverage]
+    python scripts/benchmark_llm_schema.py --standin --chatter 0.5 --malformed-rate 0.1
+"""
+
+import argparse
+import csv
+import glob
+import json
+import os
+import random
+import subprocess
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+from llm_client import CALLS, CALL_FIELDS, SCHEMA_MODES, new_call, percentile, run_summary
+
+load_dotenv()
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_FILE = "reports/benchmark/llm_schema.json"
+INPUT_DIR = "reports/alignment_structural"
+TASKS = ("alignment", "coverage")
+SAMPLE_SIZE = 40
+SAMPLE_SEED = 42
+
+
+def candidate_pairs(sample_size, seed):
+    from alignment_semantic import AIDOC_NS, Pair
+
+    pairs = []
+    for path in sorted(glob.glob(os.path.join(INPUT_DIR, "*_alignment.csv"))):
+        ref_name = os.path.basename(path).replace("_alignment.csv", "")
+        with open(path, newline="", encoding="utf-8") as f:
+            pairs += [Pair(ref_name, row["aidoc_iri"], row[f"{ref_name}_iri"],
+                           float(row.get("similarity") or 0.0))
+                      for row in csv.DictReader(f) if row["aidoc_iri"].startswith(AIDOC_NS)]
+    if not pairs:
+        sys.exit(f"❌ No candidate pairs in {INPUT_DIR}; run alignment_structural.py first")
+    rng = random.Random(seed)
+    return pairs if len(pairs) <= sample_size else rng.sample(pairs, sample_size)
+
+
+def run_alignment(pairs, schema):
+    """{pair: relation}, call records of classifying `pairs` in format `schema`."""
+    from alignment_semantic import classify_pairs
+    from llm_cache import LLMCache
+
+    del CALLS[:]
+    rows = classify_pairs(pairs, keep_failed=True, cache=LLMCache(mode="off"), schema=schema)
+    return {pair: row["llm_relation"] for pair, row in rows}, list(CALLS)
+
+
+def run_coverage(schema):
+    """{requirement id: coverage score}, call records of a semantic_mapping.py
+    run in format `schema` (read back from its outputs)."""
+    tag = f"schema_{schema}"
+    env = {**os.environ, "LLM_SCHEMA": schema, "LLM_CACHE": "off", "RUN_TAG": tag,
+           "PYTHONUNBUFFERED": "1"}
+    proc = subprocess.run([sys.executable, os.path.join(SCRIPT_DIR, "semantic_mapping.py")],
+                          env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        sys.exit(f"❌ semantic_mapping.py (LLM_SCHEMA={schema}) failed:\n{proc.stderr[-2000:]}")
+    with open(f"reports/semantic_mapping_{tag}.json", encoding="utf-8") as f:
+        results = json.load(f)
+    model = os.getenv("OLLAMA_MODEL", "gemma3:27b")
+    calls = [{**new_call(model), **{key: r.get(column) for column, key in CALL_FIELDS.items()}}
+             for r in results if r.get("llm_latency_s") is not None]
+    return {r["requirement_id"]: r.get("coverage_score") for r in results}, calls
+
+
+def agreement(task, answers, baseline):
+    shared = [k for k in answers if k in baseline]
+    if not shared:
+        return None
+    if task == "alignment":
+        same = sum(answers[k] == baseline[k] for k in shared)
+    else:
+        same = sum(abs(float(answers[k] or 0) - float(baseline[k] or 0)) <= 0.05 for k in shared)
+    return round(same / len(shared), 3)
+
+
+def measure(task, schema, answers, calls, baseline):
+    summary = next(iter(run_summary(calls).values()), {})
+    parse = summary.get("parse", {})
+    tokens = [c["completion_tokens"] for c in calls if c["completion_tokens"] is not None]
+    latency = [c["latency_s"] for c in calls if c["latency_s"] is not None]
+    return {
+        "task": task, "schema": schema, "requests": len(calls),
+        "completion_tokens": sum(tokens),
+        "completion_tokens_mean": round(sum(tokens) / len(tokens), 1) if tokens else None,
+        "latency_p50_s": round(percentile(latency, 50), 3) if latency else None,
+        "latency_p95_s": round(percentile(latency, 95), 3) if latency else None,
+        "latency_sum_s": round(sum(latency), 3),
+        "repaired": sum(n for path, n in parse.items()
+                        if path not in ("json", "array", "failed")),
+        "failed": parse.get("failed", 0),
+        "parse": parse,
+        "agreement_with_off": agreement(task, answers, baseline) if baseline else None,
+    }
+
+
+def change(value):
+    """A relative difference for the console (+12%), or "-" when unknown."""
+    return "-" if value is None else f"{value:+.0%}"
+
+
+def main(args):
+    server = None
+    if args.standin:
+        from llm_standin import serve_in_thread
+        server, url = serve_in_thread(ttft=args.ttft, token_rate=args.token_rate,
+                                      chatter=args.chatter, malformed_rate=args.malformed_rate)
+        os.environ.update(OLLAMA_URL=url, OLLAMA_API_KEY="stand-in")
+        os.environ.setdefault("OLLAMA_MODEL", "standin-a")
+    print(f"Reply formats on {os.getenv('OLLAMA_URL', 'http://localhost:11434')}, "
+          f"model {os.getenv('OLLAMA_MODEL', 'gemma3:27b')}")
+
+    pairs = candidate_pairs(args.sample, args.seed) if "alignment" in args.tasks else []
+    results = []
+    for task in args.tasks:
+        baseline = None
+        for schema in args.schemas:
+            answers, calls = (run_alignment(pairs, schema) if task == "alignment"
+                              else run_coverage(schema))
+            row = measure(task, schema, answers, calls, baseline)
+            if schema == "off":
+                baseline = answers
+            results.append(row)
+
+    # differences against the free-form replies of the same task
+    for row in results:
+        off = next((r for r in results if r["task"] == row["task"] and r["schema"] == "off"), None)
+        for key in ("completion_tokens", "latency_sum_s"):
+            row[f"{key}_vs_off"] = round(row[key] / off[key] - 1, 3) if off and off[key] else None
+
+    print(f"{'task':10s} {'schema':8s} {'requests':>8s} {'tokens':>8s} {'Δtokens':>8s} "
+          f"{'p50':>7s} {'p95':>7s} {'Δtime':>7s} {'repaired':>8s} {'failed':>6s} {'agree':>6s}")
+    for r in results:
+        print(f"{r['task']:10s} {r['schema']:8s} {r['requests']:8d} {r['completion_tokens']:8d} "
+              f"{change(r['completion_tokens_vs_off']):>8s} {r['latency_p50_s'] or 0:7.2f} "
+              f"{r['latency_p95_s'] or 0:7.2f} {change(r['latency_sum_s_vs_off']):>7s} "
+              f"{r['repaired']:8d} {r['failed']:6d} "
+              f"{'-' if r['agreement_with_off'] is None else r['agreement_with_off']:>6}")
+
+    report = {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "url": os.getenv("OLLAMA_URL", "http://localhost:11434"),
+        "model": os.getenv("OLLAMA_MODEL", "gemma3:27b"),
+        "standin": args.standin, "sample": len(pairs), "seed": args.seed,
+        "stream_stop": os.getenv("LLM_STREAM_STOP", "on"),
+        "results": results,
+    }
+    if server:
+        server.shutdown()
+    Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"✅ Reply format comparison → {args.output}")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--tasks", nargs="+", choices=TASKS, default=list(TASKS))
+    ap.add_argument("--schemas", nargs="+", choices=SCHEMA_MODES, default=list(SCHEMA_MODES))
+    ap.add_argument("--sample", type=int, default=SAMPLE_SIZE, help="candidate pairs")
+    ap.add_argument("--seed", type=int, default=SAMPLE_SEED)
+    ap.add_argument("--output", "-o", default=RESULTS_FILE)
+    ap.add_argument("--standin", action="store_true",
+                    help="run against a stand-in server (llm_standin.py) started here")
+    ap.add_argument("--ttft", type=float, default=0.0)
+    ap.add_argument("--token-rate", type=float, default=0.0)
+    ap.add_argument("--chatter", type=float, default=0.0)
+    ap.add_argument("--malformed-rate", type=float, default=0.0)
+    main(ap.parse_args())
@@ -0,0 +1,264 @@
+"""Scaling benchmark of the lexical alignment on synthetic large vocabularies.
+
+The bundled reference ontologies have ~2.6k entities; this benchmark shows
+how the structural pipeline scales towards much larger vocabularies. For
+every size it generates a seeded synthetic vocabulary derived from the
+reference files (label lengths, a token bigram chain over their labels,
+their label styles "AI System" / "AISystem" / "ai system", a share of
+near-copies of real labels, and owl:Class / skos:Concept typing with
+altLabels and definitions), then measures each stage against aidoc-ap.ttl:
+
+    extract      parse the vocabulary TTL + extract_entities()
+    structural   alignment_structural scoring + ownership at the threshold
+    fn_band      alignment_fn_band scoring of the band [0.5, 0.6)
+
+Each stage runs in its own child process, so the recorded peak RSS is the
+stage's own. The results (wall time, peak RSS, candidate counts per stage,
+plus git revision and library versions) are written as JSON so they can be
+tracked across versions. The synthetic vocabularies themselves are build
+outputs (reports/benchmark/synthetic_<size>.ttl, not tracked): they are
+generated when missing, or again with --regenerate.
+
+Usage:
+    python scripts/benchmark_scaling.py                      # 1k, 10k, 100k
+    python scripts/benchmark_scaling.py --sizes 1000 5000 --jobs 4
+    python scripts/benchmark_scaling.py --engine python --blocking
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+
+import rdflib
+
+from alignment_structural import (LEFT_FILE, RIGHT_FILE, ENGINES, ProfileCatalogue, align,
+                                  extract_entities, load_references, make_engine,
+                                  normalize_label, score_references)
+from alignment_fn_band import BAND_HIGH, BAND_LOW
+
+BENCH_DIR = "reports/benchmark"
+RESULTS_FILE = "reports/benchmark/scaling.json"
+SIZES = (1000, 10000, 100000)
+STAGES = ("extract", "structural", "fn_band")
+SEED = 42
+NEAR_COPY_SHARE = 0.1   # labels derived from a real label plus one token
+ALT_LABEL_SHARE = 0.2
+SYNTH_NS = "https://example.org/synthetic/"
+
+
+def label_style(label):
+    if " " in label.strip():
+        return "spaced"
+    if label[:1].islower():
+        return "lower"
+    return "camel"
+
+
+def render(tokens, style):
+    if style == "spaced":
+        return " ".join(t.capitalize() for t in tokens)
+    if style == "camel":
+        return "".join(t.capitalize() for t in tokens)
+    return "_".join(tokens)
+
+
+class LabelModel:
+    """Label statistics of the reference vocabularies: token-length
+    distribution, a token bigram chain, label styles and the real labels."""
+
+    def __init__(self, labels):
+        self.labels = labels
+        self.lengths = Counter()
+        self.styles = Counter(label_style(l) for l in labels)
+        self.starts = Counter()
+        self.next = defaultdict(Counter)
+        for label in labels:
+            tokens = normalize_label(label).split()
+            if not tokens:
+                continue
+            self.lengths[len(tokens)] += 1
+            self.starts[tokens[0]] += 1
+            for a, b in zip(tokens, tokens[1:]):
+                self.next[a][b] += 1
+        self.vocabulary = list(self.starts | Counter(t for c in self.next.values() for t in c))
+
+    @staticmethod
+    def _pick(rng, counter):
+        return rng.choices(list(counter), weights=list(counter.values()))[0]
+
+    def tokens(self, rng):
+        n = self._pick(rng, self.lengths)
+        tokens = [self._pick(rng, self.starts)]
+        while len(tokens) < n:
+            follow = self.next.get(tokens[-1])
+            tokens.append(self._pick(rng, follow) if follow else rng.choice(self.vocabulary))
+        return tokens
+
+    def label(self, rng):
+        style = self._pick(rng, self.styles)
+        if rng.random() < NEAR_COPY_SHARE:
+            tokens = normalize_label(rng.choice(self.labels)).split()
+            tokens.insert(rng.randrange(len(tokens) + 1), rng.choice(self.vocabulary))
+        else:
+            tokens = self.tokens(rng)
+        return render(tokens, style)
+
+
+def ttl_literal(s):
+    return '"' + s.replace("\\", "\\\\").replace('"', '\\"') + '"@en'
+
+
+def generate_vocabulary(model, size, path, seed=SEED):
+    """Write a synthetic vocabulary of `size` concepts to `path` (Turtle)."""
+    rng = random.Random(f"{seed}-{size}")
+    ns = f"{SYNTH_NS}{size}#"
+    lines = ["@prefix owl: <http://www.w3.org/2002/07/owl#> .",
+             "@prefix rdfs: <http://www.w3.org/2000/01/rdf-schema#> .",
+             "@prefix skos: <http://www.w3.org/2004/02/skos/core#> .",
+             f"@prefix syn: <{ns}> .", ""]
+    for n in range(size):
+        label = model.label(rng)
+        definition = " ".join(model.tokens(rng) + model.tokens(rng)).capitalize() + "."
+        if rng.random() < 0.5:
+            lines.append(f"syn:C{n:06d} a owl:Class ;\n    rdfs:label {ttl_literal(label)} ;\n"
+                         f"    rdfs:comment {ttl_literal(definition)} .")
+        else:
+            alt = (f" ;\n    skos:altLabel {ttl_literal(model.label(rng))}"
+                   if rng.random() < ALT_LABEL_SHARE else "")
+            lines.append(f"syn:C{n:06d} a skos:Concept ;\n    skos:prefLabel {ttl_literal(label)}"
+                         f"{alt} ;\n    skos:definition {ttl_literal(definition)} .")
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    Path(path).write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KiB on Linux, in bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def run_stage(stage, vocab, threshold, engine, blocking, jobs):
+    """Run one stage in this process; returns its measurements."""
+    left_classes = extract_entities(rdflib.Graph().parse(LEFT_FILE, format="turtle"))
+    rss_before = peak_rss_mb()
+    t0 = time.perf_counter()
+    counts = {}
+    if stage == "extract":
+        entities = extract_entities(rdflib.Graph().parse(vocab, format="turtle"))
+        counts["entities"] = len(entities)
+    else:
+        # parsed directly: synthetic vocabularies stay out of the caches
+        references = {Path(vocab).stem: extract_entities(
+            rdflib.Graph().parse(vocab, format="turtle"))}
+        counts["entities"] = sum(len(r) for r in references.values())
+        t0 = time.perf_counter()  # scoring only; parsing is the extract stage
+        stats = Counter()
+        engine = make_engine(engine, blocking)
+        if stage == "structural":
+            scored = score_references(left_classes, references, threshold, engine=engine,
+                                      catalogue=ProfileCatalogue(None), stats=stats, jobs=jobs)
+            _, n_pairs, _ = align(left_classes, references, threshold, scored=scored)
+            counts["candidates"] = n_pairs
+        else:
+            aidoc = {i: l for i, l in left_classes.items()
+                     if i.startswith("https://w3id.org/aidoc-ap#")}
+            scored = score_references(aidoc, references, BAND_LOW, BAND_HIGH, engine=engine,
+                                      catalogue=ProfileCatalogue(None), stats=stats, jobs=jobs)
+            counts["band_pairs"] = sum(len(rows) for rows in scored.values())
+        counts.update(pairs=stats["pairs"], scored=stats["scored"], ratio=stats["ratio"])
+    return {"stage": stage, "seconds": round(time.perf_counter() - t0, 3),
+            "peak_rss_mb": peak_rss_mb(), "rss_before_mb": rss_before, **counts}
+
+
+def measure(stage, vocab, args):
+    """Run `stage` in a child process (fresh peak RSS) and parse its result."""
+    cmd = [sys.executable, __file__, "--stage", stage, "--vocab", vocab,
+           "--threshold", str(args.threshold), "--engine", args.engine,
+           "--jobs", str(args.jobs)] + (["--blocking"] if args.blocking else [])
+    proc = subprocess.run(cmd, capture_output=True, text=True)
+    if proc.returncode != 0:
+        sys.exit(f"❌ Stage {stage} on {vocab} failed:\n{proc.stderr}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def main(args):
+    files = sorted(Path(args.right).glob("*.ttl"))
+    model = LabelModel([l for r in load_references(files, args.jobs).values()
+                        for l in r.values()])
+    print(f"Label model from {len(files)} reference files: {len(model.labels)} labels, "
+          f"{len(model.vocabulary)} tokens")
+
+    results = []
+    for size in args.sizes:
+        vocab = os.path.join(BENCH_DIR, f"synthetic_{size}.ttl")
+        if not os.path.exists(vocab) or args.regenerate:
+            generate_vocabulary(model, size, vocab, args.seed)
+        for stage in STAGES:
+            row = {"size": size, **measure(stage, vocab, args)}
+            results.append(row)
+            print(f"{size:>7d} {stage:10s} {row['seconds']:8.2f}s {row['peak_rss_mb']:8.1f} MB  "
+                  + ", ".join(f"{k}={row[k]}" for k in row
+                              if k not in ("size", "stage", "seconds", "peak_rss_mb",
+                                           "rss_before_mb")))
+
+    report = {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "rdflib": rdflib.__version__,
+        "platform": platform.platform(),
+        "engine": args.engine, "blocking": args.blocking, "jobs": args.jobs,
+        "threshold": args.threshold, "seed": args.seed,
+        "results": results,
+    }
+    Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"✅ Scaling benchmark ({len(results)} measurements) → {args.output}")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--sizes", type=int, nargs="+", default=list(SIZES))
+    ap.add_argument("--threshold", "-t", type=float, default=0.6)
+    ap.add_argument("--engine", choices=sorted(ENGINES), default="python")
+    ap.add_argument("--blocking", action="store_true")
+    ap.add_argument("--jobs", "-j", type=int, default=1)
+    ap.add_argument("--seed", type=int, default=SEED)
+    ap.add_argument("--right", "-r", default=RIGHT_FILE,
+                    help="reference files the label model is derived from")
+    ap.add_argument("--output", "-o", default=RESULTS_FILE)
+    ap.add_argument("--regenerate", action="store_true",
+                    help="regenerate synthetic vocabularies that already exist")
+    # internal: run a single stage in this process (used by measure())
+    ap.add_argument("--stage", choices=STAGES, help=argparse.SUPPRESS)
+    ap.add_argument("--vocab", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    if args.blocking and args.engine != "python":
+        ap.error(f"--blocking applies to the python engine only, not --engine {args.engine}")
+
+    if args.stage:
+        with contextlib.redirect_stdout(sys.stderr):
+            row = run_stage(args.stage, args.vocab, args.threshold, args.engine,
+                            args.blocking, args.jobs)
+        print(json.dumps(row))
+    else:
+        main(args)
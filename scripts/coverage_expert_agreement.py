@@ -33,8 +33,9 @@ import re
 import statistics
 import sys
 
-import pandas as pd
-from rdflib import Graph, Namespace, RDF, RDFS
+from rdflib import Namespace, RDF, RDFS
+
+from graph_cache import load_graph
 
 AIACT = Namespace("https://w3id.org/aidoc-ap/requirements#")
 DCT = Namespace("http://purl.org/dc/terms/")
@@ -47,7 +48,7 @@ SEED = 42
 
 
 def load_requirements():
-    g = Graph().parse("annex_4.ttl", format="turtle")
+    g = load_graph("annex_4.ttl")
     reqs = {}
     for s in g.subjects(RDF.type, AIACT.Requirement):
         rid = str(s).split("#")[-1]
@@ -70,6 +71,7 @@ def load_requirements():
 
 
 def make_sheet():
+    import pandas as pd
     reqs = load_requirements()
     sample = sorted(random.Random(SEED).sample(sorted(reqs), SAMPLE_SIZE),
                     key=lambda r: int(re.sub(r"\D", "", r)))
@@ -122,6 +124,7 @@ def spearman(a, b):
 
 
 def evaluate():
+    import pandas as pd
     if not os.path.exists(SHEET):
         sys.exit(f"{SHEET} not found — run with --make-sheet first.")
     df = pd.read_csv(SHEET)
@@ -0,0 +1,190 @@
+"""Indexed entity-description store for aidoc-ap.ttl and the reference ontologies.
+
+The alignment, fn-band and entity-extraction scripts used to load full
+rdflib graphs only to look up a handful of values per entity (label,
+comment, definition, rdf:type) or to walk them for the concepts to align.
+This module indexes every source file once into SQLite
+(reports/cache/entities.sqlite) and answers those lookups from there:
+
+    types      (source, iri, type, position)      every rdf:type of an IRI
+    literals   (source, iri, predicate, value,    rdfs:label, skos:prefLabel,
+                lang, position)                    skos:altLabel, rdfs:comment,
+                                                   skos:definition
+    concepts   (source, iri, label, position)     the class-level concepts of
+                                                   alignment_structural.
+                                                   extract_entities() with
+                                                   their representative label
+
+`position` keeps rdflib's iteration order, so the queries return rows in
+the order the graph walks did. A source is re-indexed when its content
+digest (or STORE_VERSION) changes; cold sources are parsed in parallel
+through the graph cache.
+
+Usage:
+    python scripts/entity_store.py                  # (re)index the default sources
+    python scripts/entity_store.py --describe https://w3id.org/aidoc-ap#AISystem
+"""
+
+import argparse
+import os
+import sqlite3
+from pathlib import Path
+
+from graph_cache import file_digest, load_graphs
+
+ENTITY_DB = "reports/cache/entities.sqlite"
+LEFT_FILE = "aidoc-ap.ttl"
+REFERENCE_DIR = "reference_ontologies/"
+STORE_VERSION = 1     # bump when the indexing rules (incl. extract_entities) change
+
+RDFS_NS = "http://www.w3.org/2000/01/rdf-schema#"
+SKOS_NS = "http://www.w3.org/2004/02/skos/core#"
+LITERAL_PREDICATES = {
+    RDFS_NS + "label": "label", SKOS_NS + "prefLabel": "prefLabel",
+    SKOS_NS + "altLabel": "altLabel", RDFS_NS + "comment": "comment",
+    SKOS_NS + "definition": "definition",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sources (source TEXT PRIMARY KEY, digest TEXT, version INTEGER);
+CREATE TABLE IF NOT EXISTS types (source TEXT, iri TEXT, type TEXT, position INTEGER);
+CREATE TABLE IF NOT EXISTS literals (source TEXT, iri TEXT, predicate TEXT, value TEXT,
+                                     lang TEXT, position INTEGER);
+CREATE TABLE IF NOT EXISTS concepts (source TEXT, iri TEXT, label TEXT, position INTEGER);
+CREATE INDEX IF NOT EXISTS types_by_source ON types (source, type, position);
+CREATE INDEX IF NOT EXISTS literals_by_iri ON literals (source, iri, predicate, position);
+CREATE INDEX IF NOT EXISTS concepts_by_source ON concepts (source, position);
+"""
+
+
+def default_sources():
+    return [LEFT_FILE] + [str(p) for p in sorted(Path(REFERENCE_DIR).glob("*.ttl"))]
+
+
+def source_key(path):
+    return os.path.normpath(path)
+
+
+def local_name(iri):
+    return iri.split("#")[-1].split("/")[-1]
+
+
+def index_graph(g):
+    """(types, literals, concepts) rows of `g`, without the source column."""
+    import rdflib
+    from rdflib import RDF
+    # imported here: alignment_structural itself reads its entities from the store
+    from alignment_structural import extract_entities
+
+    types = []
+    for t in dict.fromkeys(g.objects(None, RDF.type)):
+        for position, s in enumerate(g.subjects(RDF.type, t)):
+            if isinstance(s, rdflib.URIRef):
+                types.append((str(s), str(t), position))
+    literals = []
+    for predicate, name in LITERAL_PREDICATES.items():
+        for position, (s, o) in enumerate(g.subject_objects(rdflib.URIRef(predicate))):
+            if isinstance(s, rdflib.URIRef):
+                lang = getattr(o, "language", None) or ""
+                literals.append((str(s), name, str(o), lang, position))
+    concepts = [(iri, label, position)
+                for position, (iri, label) in enumerate(extract_entities(g).items())]
+    return types, literals, concepts
+
+
+class EntityStore:
+    def __init__(self, path=ENTITY_DB):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+
+    @classmethod
+    def open(cls, files=None, path=ENTITY_DB, jobs=None):
+        """The store at `path`, with `files` (default: aidoc-ap.ttl and the
+        reference ontologies) indexed and up to date."""
+        store = cls(path)
+        store.update(default_sources() if files is None else files, jobs)
+        return store
+
+    def stale(self, files):
+        current = dict(self.db.execute(
+            "SELECT source, digest FROM sources WHERE version = ?", (STORE_VERSION,)))
+        return [f for f in files if current.get(source_key(f)) != file_digest(f)]
+
+    def update(self, files, jobs=None):
+        """(Re)index the files whose content changed since they were indexed."""
+        stale = self.stale(files)
+        if not stale:
+            return
+        print(f"Indexing {len(stale)} file(s) into the entity store → {self.path}")
+        for path, g in load_graphs(stale, jobs=jobs).items():
+            source = source_key(path)
+            types, literals, concepts = index_graph(g)
+            with self.db:
+                for table in ("sources", "types", "literals", "concepts"):
+                    self.db.execute(f"DELETE FROM {table} WHERE source = ?", (source,))
+                self.db.executemany("INSERT INTO types VALUES (?, ?, ?, ?)",
+                                    [(source, *row) for row in types])
+                self.db.executemany("INSERT INTO literals VALUES (?, ?, ?, ?, ?, ?)",
+                                    [(source, *row) for row in literals])
+                self.db.executemany("INSERT INTO concepts VALUES (?, ?, ?, ?)",
+                                    [(source, *row) for row in concepts])
+                self.db.execute("INSERT INTO sources VALUES (?, ?, ?)",
+                                (source, file_digest(path), STORE_VERSION))
+
+    def concepts(self, source):
+        """{iri: label} of the class-level concepts of `source`, as
+        alignment_structural.extract_entities() returns them."""
+        return dict(self.db.execute(
+            "SELECT iri, label FROM concepts WHERE source = ? ORDER BY position",
+            (source_key(source),)))
+
+    def typed(self, source, rdf_type):
+        """IRIs of `source` declared as `rdf_type`, in graph order."""
+        return [iri for iri, in self.db.execute(
+            "SELECT iri FROM types WHERE source = ? AND type = ? ORDER BY position",
+            (source_key(source), str(rdf_type)))]
+
+    def values(self, source, iri, predicate):
+        """All values of `predicate` ('label', 'comment', ...) for `iri`."""
+        return [v for v, in self.db.execute(
+            "SELECT value FROM literals WHERE source = ? AND iri = ? AND predicate = ? "
+            "ORDER BY position", (source_key(source), str(iri), predicate))]
+
+    def first(self, source, iri, *predicates):
+        """First value of the first of `predicates` that has one, else ''."""
+        for predicate in predicates:
+            values = self.values(source, iri, predicate)
+            if values:
+                return values[0]
+        return ""
+
+    def sources_of(self, iri):
+        """Sources that type or describe `iri`."""
+        return [s for s, in self.db.execute(
+            "SELECT source FROM types WHERE iri = ? UNION "
+            "SELECT source FROM literals WHERE iri = ? ORDER BY source", (iri, iri))]
+
+    def describe(self, source, iri):
+        """Label (rdfs:label, else the IRI's local name) and comment
+        (rdfs:comment, else skos:definition) of `iri` in `source`."""
+        label = self.first(source, iri, "label")
+        comment = self.first(source, iri, "comment") or self.first(source, iri, "definition")
+        return {"label": label or local_name(str(iri)), "comment": comment}
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--jobs", "-j", type=int, default=None,
+                    help="parallel parses of cold files (default: CPU count)")
+    ap.add_argument("--describe", metavar="IRI", help="print the description of IRI")
+    args = ap.parse_args()
+
+    store = EntityStore.open(jobs=args.jobs)
+    if args.describe:
+        for source in store.sources_of(args.describe):
+            print(f"{source}: {store.describe(source, args.describe)}")
+    else:
+        n = store.db.execute("SELECT COUNT(*) FROM concepts").fetchone()[0]
+        print(f"✅ Entity store with {len(default_sources())} sources, {n} concepts → {store.path}")
@@ -25,6 +25,8 @@ from collections import defaultdict
 
 from rdflib import Graph, RDF, RDFS, Namespace
 
+from graph_cache import load_graph, load_graphs
+
 PROV = Namespace("http://www.w3.org/ns/prov#")
 ALIGN = Namespace("https://w3id.org/aidoc-ap/alignment#")
 DQV = Namespace("http://www.w3.org/ns/dqv#")
@@ -56,11 +58,10 @@ def export_alignments():
     combined.bind("skos", "http://www.w3.org/2004/02/skos/core#")
     combined.bind("align", ALIGN)
     combined.bind("aidoc", "https://w3id.org/aidoc-ap#")
-    for f in sorted(glob.glob("docs/resources/*-alignments.ttl")):
-        if os.path.abspath(f) == os.path.abspath(COMBINED_TTL):
-            continue
+    files = [f for f in sorted(glob.glob("docs/resources/*-alignments.ttl"))
+             if os.path.abspath(f) != os.path.abspath(COMBINED_TTL)]
+    for f, g in load_graphs(files).items():
         bucket = os.path.basename(f).replace("-alignments.ttl", "")
-        g = Graph().parse(f, format="turtle")
         combined += g
         started = {str(a): lit(g, a, PROV.startedAtTime)
                    for a in g.subjects(RDF.type, PROV.Activity)}
@@ -88,7 +89,7 @@ def export_alignments():
 
 
 def export_coverage():
-    g = Graph().parse("docs/resources/semantic_mapping.ttl", format="turtle")
+    g = load_graph("docs/resources/semantic_mapping.ttl")
     runs = []
     for a in g.subjects(RDF.type, PROV.Activity):
         runs.append({
@@ -114,7 +115,7 @@ def export_coverage():
             "agent": lit(g, m, PROV.wasAttributedTo),
         })
 
-    rg = Graph().parse("annex_4.ttl", format="turtle")
+    rg = load_graph("annex_4.ttl")
     requirements = {}
     for s in rg.subjects(RDF.type, AIACT.Requirement):
         rid = str(s).split("#")[-1]
@@ -0,0 +1,96 @@
+"""Content-hash cache of parsed RDF graphs.
+
+All scripts parse the same Turtle files (aidoc-ap.ttl, annex_4.ttl, the
+reference ontologies, the example KGs) on every invocation; dpv.ttl alone
+takes ~0.7 s. load_graph() keeps a pickled snapshot of each parsed graph in
+reports/cache/graphs/, keyed by the SHA-256 of the file content, the rdflib
+version and the format, so a warm load skips the parser (~6x faster) and an
+edited file, or an rdflib upgrade, is simply a cache miss. load_graphs()
+parses the cold files of a batch in a process pool first.
+
+Every call returns a fresh Graph, so callers may modify it. Snapshots are
+never evicted; delete reports/cache/graphs/ to reclaim the space.
+"""
+
+import hashlib
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+GRAPH_CACHE = "reports/cache/graphs"
+CACHE_VERSION = 1
+
+
+def file_digest(path):
+    return hashlib.sha256(Path(path).read_bytes()).hexdigest()
+
+
+def cache_path(path, format="turtle", cache_dir=GRAPH_CACHE):
+    import rdflib
+    h = hashlib.sha256(f"{CACHE_VERSION}:{rdflib.__version__}:{format}:".encode())
+    h.update(Path(path).read_bytes())
+    return os.path.join(cache_dir, f"{h.hexdigest()}.pkl")
+
+
+def _read_snapshot(snapshot):
+    try:
+        with open(snapshot, "rb") as f:
+            g, namespaces = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, ValueError):
+        return None
+    # unpickling re-binds rdflib's default prefixes over the file's own ones
+    # (e.g. dcterms/prof instead of dct/profile); restore them
+    for prefix, namespace in namespaces:
+        g.bind(prefix, namespace, override=True, replace=True)
+    return g
+
+
+def _write_snapshot(g, snapshot):
+    os.makedirs(os.path.dirname(snapshot), exist_ok=True)
+    tmp = f"{snapshot}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        pickle.dump((g, list(g.namespaces())), f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, snapshot)
+
+
+def load_graph(path, format="turtle", cache_dir=GRAPH_CACHE):
+    """rdflib.Graph of `path`, from the snapshot cache if the file content is
+    unchanged; `cache_dir=None` always parses."""
+    import rdflib
+    if cache_dir is None:
+        return rdflib.Graph().parse(path, format=format)
+    snapshot = cache_path(path, format, cache_dir)
+    g = _read_snapshot(snapshot) if os.path.exists(snapshot) else None
+    if g is None:
+        g = rdflib.Graph().parse(path, format=format)
+        _write_snapshot(g, snapshot)
+    return g
+
+
+def _warm(task):
+    path, format, cache_dir = task
+    try:
+        load_graph(path, format, cache_dir)
+    except Exception:
+        pass  # reported by the caller's own load_graph()
+
+
+def warm_cache(paths, format="turtle", cache_dir=GRAPH_CACHE, jobs=None):
+    """Parse and snapshot the files of `paths` not in the cache yet, in a
+    process pool of up to `jobs` (default: CPU count) workers. Files that
+    fail to parse are skipped; load_graph() raises for them."""
+    if cache_dir is None:
+        return
+    cold = [p for p in paths if not os.path.exists(cache_path(p, format, cache_dir))]
+    jobs = min(jobs or os.cpu_count() or 1, len(cold))
+    if jobs > 1:
+        with ProcessPoolExecutor(jobs) as pool:
+            list(pool.map(_warm, [(p, format, cache_dir) for p in cold]))
+
+
+def load_graphs(paths, format="turtle", cache_dir=GRAPH_CACHE, jobs=None):
+    """path -> rdflib.Graph for `paths` (in the given order), cold files
+    parsed in parallel."""
+    warm_cache(paths, format, cache_dir, jobs)
+    return {p: load_graph(p, format, cache_dir) for p in paths}
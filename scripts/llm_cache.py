@@ -0,0 +1,133 @@
+"""Content-addressed cache of LLM replies shared by the LLM-calling scripts.
+
+alignment_semantic.py, alignment_fn_band.py and semantic_mapping.py query
+the model at a fixed temperature and seed, so an identical prompt gets an
+identical reply. The raw reply text is kept in SQLite
+(reports/cache/llm.sqlite), keyed by the SHA-256 of (model, prompt,
+temperature, seed, and the response_format JSON schema if any); a re-run,
+or an iteration whose entity catalogue did not change, only asks the model
+for prompts that actually changed. Replies are cached before parsing, so
+parser fixes apply to cached replies too.
+
+The cache is bounded to LLM_CACHE_MAX_MB (default 256) of reply text; the
+least recently used replies are evicted first. LLM_CACHE selects the mode:
+
+    on        read and write (default)
+    refresh   ask the model again and overwrite the cached replies
+    off       bypass the cache entirely
+
+Usage:
+    python scripts/llm_cache.py              # size and lifetime hit counts
+    python scripts/llm_cache.py --clear
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from collections import Counter
+
+LLM_CACHE = "reports/cache/llm.sqlite"
+LLM_CACHE_MODE = os.getenv("LLM_CACHE", "on").strip().lower()
+LLM_CACHE_MAX_MB = float(os.getenv("LLM_CACHE_MAX_MB", "256"))
+CACHE_MODES = ("on", "refresh", "off")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS replies (key TEXT PRIMARY KEY, model TEXT, reply TEXT,
+                                    size INTEGER, created REAL, used REAL, hits INTEGER);
+CREATE INDEX IF NOT EXISTS replies_by_use ON replies (used);
+"""
+
+
+def cache_key(model, prompt, temperature, seed, response_format=None):
+    parts = [model, prompt, float(temperature), seed]
+    if response_format:
+        parts.append(response_format)
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+
+
+class LLMCache:
+    def __init__(self, path=LLM_CACHE, mode=LLM_CACHE_MODE, max_mb=LLM_CACHE_MAX_MB):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"LLM_CACHE must be one of {', '.join(CACHE_MODES)}, not {mode!r}")
+        self.path = path
+        self.mode = mode
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.stats = Counter()
+        self.db = None
+        if mode != "off":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.db = sqlite3.connect(path, timeout=60)
+            self.db.executescript(SCHEMA)
+
+    def get(self, model, prompt, temperature, seed, response_format=None):
+        """The cached reply to the prompt, else None."""
+        if self.mode != "on":
+            return None
+        key = cache_key(model, prompt, temperature, seed, response_format)
+        row = self.db.execute("SELECT reply FROM replies WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        with self.db:
+            self.db.execute("UPDATE replies SET used = ?, hits = hits + 1 WHERE key = ?",
+                            (time.time(), key))
+        return row[0]
+
+    def put(self, model, prompt, temperature, seed, reply, response_format=None):
+        if self.mode == "off":
+            return
+        now = time.time()
+        with self.db:
+            self.db.execute("INSERT OR REPLACE INTO replies VALUES (?, ?, ?, ?, ?, ?, 0)",
+                            (cache_key(model, prompt, temperature, seed, response_format), model, reply,
+                             len(reply.encode("utf-8")), now, now))
+        self.stats["stored"] += 1
+        self.evict()
+
+    def size(self):
+        return self.db.execute("SELECT COALESCE(SUM(size), 0) FROM replies").fetchone()[0]
+
+    def evict(self):
+        """Drop the least recently used replies beyond the size bound."""
+        excess = self.size() - self.max_bytes
+        if excess <= 0:
+            return
+        drop = []
+        for key, size in self.db.execute("SELECT key, size FROM replies ORDER BY used"):
+            drop.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        with self.db:
+            self.db.executemany("DELETE FROM replies WHERE key = ?", drop)
+        self.stats["evicted"] += len(drop)
+
+    def summary(self):
+        if self.mode == "off":
+            return "LLM cache: bypassed"
+        looked_up = self.stats["hits"] + self.stats["misses"]
+        rate = f" ({self.stats['hits'] / looked_up:.0%} hit rate)" if looked_up else ""
+        return (f"LLM cache ({self.mode}): {self.stats['hits']} hits, {self.stats['misses']} misses"
+                f"{rate}, {self.stats['stored']} stored, {self.stats['evicted']} evicted → {self.path}")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--clear", action="store_true", help="delete all cached replies")
+    args = ap.parse_args()
+
+    cache = LLMCache(mode="on")
+    if args.clear:
+        with cache.db:
+            cache.db.execute("DELETE FROM replies")
+        cache.db.execute("VACUUM")
+        print(f"✅ LLM cache cleared → {cache.path}")
+    else:
+        for model, n, size, hits in cache.db.execute(
+                "SELECT model, COUNT(*), SUM(size), SUM(hits) FROM replies GROUP BY model"):
+            print(f"  {model:30s} {n:6d} replies {size / 1024:9.1f} KiB {hits:7d} hits")
+        print(f"✅ LLM cache: {cache.size() / 1024 / 1024:.1f} of {LLM_CACHE_MAX_MB:g} MB → {cache.path}")
@@ -0,0 +1,542 @@
+"""Chat-completion calls with reply caching, retries and per-call telemetry.
+
+Shared by alignment_semantic.py (and through it alignment_fn_band.py) and
+semantic_mapping.py. complete() / complete_async() return the reply text
+of a prompt, from the reply cache (llm_cache.py) or from the model on an
+endpoint of the pool (llm_pool.py), and a `call` record of what it took:
+
+    latency_s          wall time including retries and backoff, from the
+                       request's slot on (not the wait for it)
+    queue_s            wait for a slot: the caller's concurrency semaphore
+                       and the host's adaptive limit (llm_control.py)
+    ttft_s             time to the first streamed token of the final attempt
+    prompt_tokens      from the API usage of the streamed reply
+    completion_tokens
+    retries            API/transport errors retried (5s, 15s, 45s backoff)
+    parse              repair path of the caller's reply parser
+                       (json | trailing_commas | regex | ..., failed)
+    cached             served from the reply cache (no request sent)
+    endpoint           host that served the final attempt
+    stopped            stream closed at the end of the reply's JSON
+    json_tokens        tokens streamed up to the end of the JSON
+    tail_tokens        tokens / seconds the model kept generating after
+    tail_s             the JSON (measured on replies read to the end)
+
+Replies are streamed so the first token can be timed. A caller that only
+parses the first JSON object or array of the reply passes stop_at="{" or
+"[": the stream is scanned for the end of that top-level value (string-
+and escape-aware nesting) and closed there, so the trailing explanation or
+markdown some models add is not generated. LLM_STREAM_STOP=off reads every
+reply to the end; with it on (default) the first LLM_STOP_CALIBRATE (3)
+replies per model are still read to the end to measure the tail, and the
+tokens and seconds saved are estimated from it. Token counts of a stopped
+stream are its content chunks (one token each on Ollama), as the usage
+only comes at the end; its prompt tokens are estimated from the prompt
+(~4 characters per token, prompt_estimated).
+
+With LLM_SCHEMA=full or compact, callers pass a JSON schema of their reply
+as the OpenAI-compatible response_format (Ollama constrains decoding to
+it); "compact" renames the schema's properties to short keys and
+expand_reply() restores the full ones before parsing. The default "off"
+leaves the reply free-form.
+
+Each attempt has LLM_TIMEOUT (600s) to complete its reply; a stream over
+it is closed (the async request cancelled) and the attempt retried. The
+endpoint pool admits requests under each host's adaptive concurrency
+limit and circuit breaker (llm_control.py): while a host's circuit is open
+a retry does not back off but waits for the circuit's probe, and once all
+hosts of the model are down the call raises CircuitOpen instead of
+retrying, so callers can stop the run rather than time out request by
+request.
+
+A Budget caps the requests a run sends and/or its wall time: once it is
+spent, complete() raises BudgetExhausted instead of sending the next
+request, and the caller writes what it has (alignment_semantic.py
+--budget-s / --budget-calls).
+
+Every call of the process is kept in CALLS; write_run_metrics() summarises
+them per model (p50/p95/p99 latency and time to first token, tokens per
+second, retries, parse paths, requests per endpoint, streams stopped early
+and the estimated savings) into a run metrics JSON.
+"""
+
+import json
+import os
+import time
+from collections import Counter
+
+from llm_control import CircuitOpen, control_summary
+
+CALLS = []   # call records of this process, in completion order
+LLM_STREAM_STOP = os.getenv("LLM_STREAM_STOP", "on").strip().lower() != "off"
+LLM_STOP_CALIBRATE = int(os.getenv("LLM_STOP_CALIBRATE", "3"))
+_calibrating = Counter()   # model -> replies read to the end to measure the tail
+LLM_SCHEMA = os.getenv("LLM_SCHEMA", "off").strip().lower()
+SCHEMA_MODES = ("off", "full", "compact")
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "600"))   # seconds per attempt
+
+# curation-sheet / run-JSON columns of a call record
+CALL_FIELDS = {
+    "llm_latency_s": "latency_s", "llm_ttft_s": "ttft_s",
+    "llm_prompt_tokens": "prompt_tokens", "llm_completion_tokens": "completion_tokens",
+    "llm_retries": "retries", "llm_parse": "parse", "llm_cached": "cached",
+    "llm_stopped": "stopped",
+}
+
+
+def new_call(model):
+    return {"model": model, "latency_s": None, "queue_s": None, "ttft_s": None,
+            "prompt_tokens": None,
+            "completion_tokens": None, "retries": 0, "parse": "failed", "cached": False,
+            "endpoint": None, "stopped": False, "json_tokens": None, "tail_tokens": None,
+            "tail_s": None, "prompt_estimated": False}
+
+
+def estimate_tokens(text):
+    # ~4 characters per token for English prompts
+    return len(text) // 4
+
+
+def metric(value):
+    """A summary value for the console: 2 decimals, or "-" when unknown."""
+    return "-" if value is None else f"{value:.2f}"
+
+
+def call_fields(call):
+    """The llm_* columns of a call record (rounded for the sheets)."""
+    fields = {}
+    for column, key in CALL_FIELDS.items():
+        value = call.get(key)
+        fields[column] = round(value, 3) if isinstance(value, float) else value
+    return fields
+
+
+def retry_wait(attempt, max_attempts, err, circuit_open=False):
+    """Backoff before retry `attempt` after API error `err` (5s, 15s, 45s),
+    or None when the attempts are used up. No backoff while the circuit is
+    open: the retry waits for the circuit's probe instead (see
+    llm_control.py)."""
+    if attempt >= max_attempts:
+        return None
+    if circuit_open:
+        print(f"  retry {attempt}/{max_attempts - 1} after API error: {err} (circuit open)")
+        return 0
+    wait = 5 * 3 ** (attempt - 1)
+    print(f"  retry {attempt}/{max_attempts - 1} after API error: {err} (waiting {wait}s)")
+    return wait
+
+
+def request_args(prompt, model, temperature, seed, response_format=None):
+    args = dict(messages=[{'role': 'user', 'content': prompt}], model=model,
+                temperature=temperature, seed=seed,
+                stream=True, stream_options={"include_usage": True})
+    if response_format:
+        args["response_format"] = response_format
+    return args
+
+
+def rename_keys(value, keys):
+    """`value` (parsed JSON or a JSON schema's properties, recursively) with
+    its object keys renamed by the mapping `keys`."""
+    if isinstance(value, dict):
+        return {keys.get(k, k): rename_keys(v, keys) for k, v in value.items()}
+    if isinstance(value, list):
+        return [rename_keys(v, keys) for v in value]
+    return value
+
+
+def compact_schema(schema, keys):
+    """`schema` with its property names (and required lists) shortened by
+    `keys` (full name -> short name)."""
+    if not isinstance(schema, dict):
+        return schema
+    schema = {k: compact_schema(v, keys) if k != "properties" else
+              {keys.get(name, name): compact_schema(sub, keys) for name, sub in v.items()}
+              for k, v in schema.items()}
+    if "required" in schema:
+        schema["required"] = [keys.get(name, name) for name in schema["required"]]
+    return schema
+
+
+def response_format(name, schema, mode=LLM_SCHEMA, keys=None):
+    """The response_format constraining a reply to `schema` for schema mode
+    `mode` (see SCHEMA_MODES), None when off."""
+    if mode not in SCHEMA_MODES:
+        raise ValueError(f"LLM_SCHEMA must be one of {', '.join(SCHEMA_MODES)}, not {mode!r}")
+    if mode == "off":
+        return None
+    if mode == "compact":
+        schema = compact_schema(schema, keys or {})
+    return {"type": "json_schema", "json_schema": {"name": name, "schema": schema, "strict": True}}
+
+
+def expand_reply(reply, keys):
+    """A compact-key JSON reply with the full keys restored (unchanged if it
+    is not strict JSON, for the caller's repair path)."""
+    try:
+        parsed = json.loads(reply)
+    except ValueError:
+        return reply
+    return json.dumps(rename_keys(parsed, {short: full for full, short in keys.items()}))
+
+
+def stop_early(model, stop_at):
+    """Whether the next reply of `model` is cut at the end of its JSON
+    (False while the tail is being calibrated)."""
+    if not stop_at or not LLM_STREAM_STOP:
+        return False
+    if _calibrating[model] < LLM_STOP_CALIBRATE:
+        _calibrating[model] += 1
+        return False
+    return True
+
+
+class JsonEnd:
+    """Incremental scan for the end of the first top-level JSON value
+    opened by `opener` ("{" or "["); text before it is skipped."""
+
+    def __init__(self, opener):
+        self.opener = opener
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+
+    def feed(self, text):
+        """Index just past the closing bracket in `text`, or None."""
+        for i, ch in enumerate(text):
+            if not self.depth:
+                if ch == self.opener:
+                    self.depth = 1
+            elif self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif ch == "\\":
+                    self.escaped = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                self.in_string = True
+            elif ch in "{[":
+                self.depth += 1
+            elif ch in "}]":
+                self.depth -= 1
+                if not self.depth:
+                    return i + 1
+        return None
+
+
+class StreamReader:
+    """Collects the reply of a stream, recording the first token and the
+    usage; with `stop_at`, also where its JSON ends (see JsonEnd)."""
+
+    def __init__(self, call, started, stop_at=None, stop=False):
+        self.call = call
+        self.started = started
+        self.scan = JsonEnd(stop_at) if stop_at else None
+        self.stop = stop
+        self.parts = []
+        self.tokens = 0
+        self.json_end_s = None
+        call.update(stopped=False, json_tokens=None, tail_tokens=None, tail_s=None)
+
+    def feed(self, chunk):
+        """Add a chunk; True once the stream should be closed."""
+        call = self.call
+        if getattr(chunk, "usage", None):
+            call["prompt_tokens"] = chunk.usage.prompt_tokens
+            call["completion_tokens"] = chunk.usage.completion_tokens
+        text = (chunk.choices[0].delta.content or "") if chunk.choices else ""
+        if not text:
+            return False
+        self.tokens += 1
+        if call["ttft_s"] is None:
+            call["ttft_s"] = time.perf_counter() - self.started
+        end = self.scan.feed(text) if self.scan and self.json_end_s is None else None
+        if end is None:
+            self.parts.append(text)
+            return False
+        self.json_end_s = time.perf_counter()
+        call["json_tokens"] = self.tokens
+        if self.stop:
+            self.parts.append(text[:end])
+            call["stopped"] = True
+            call["completion_tokens"] = self.tokens
+            return True
+        self.parts.append(text)
+        return False
+
+    def reply(self):
+        """The reply text; measures the tail of a reply read to the end."""
+        call = self.call
+        if self.json_end_s is not None and not call["stopped"]:
+            call["tail_s"] = time.perf_counter() - self.json_end_s
+            call["tail_tokens"] = max((call["completion_tokens"] or self.tokens)
+                                      - call["json_tokens"], 0)
+        return "".join(self.parts)
+
+
+class BudgetExhausted(Exception):
+    """The run's Budget allows no further request."""
+
+
+class Budget:
+    """A wall-clock (`seconds`, from creation) and/or request (`calls`)
+    budget of a run, spent by complete() / complete_async() before each
+    request they send. Requests in flight when it runs out complete."""
+
+    def __init__(self, seconds=None, calls=None):
+        self.seconds = seconds
+        self.calls = calls
+        self.started = time.perf_counter()
+        self.spent = 0
+        self.exhausted = None   # why, once it ran out
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def spend(self):
+        """Count one request, or raise BudgetExhausted."""
+        if self.exhausted is None:
+            if self.seconds is not None and self.elapsed() >= self.seconds:
+                self.exhausted = f"wall-clock budget of {self.seconds:g}s"
+            elif self.calls is not None and self.spent >= self.calls:
+                self.exhausted = f"budget of {self.calls} requests"
+        if self.exhausted:
+            raise BudgetExhausted(self.exhausted)
+        self.spent += 1
+
+    def summary(self):
+        return {"seconds": self.seconds, "calls": self.calls, "spent_calls": self.spent,
+                "elapsed_s": round(self.elapsed(), 3), "exhausted": self.exhausted}
+
+
+def _finish(call, t0, cache, prompt, temperature, seed, reply, response_format):
+    call["latency_s"] = time.perf_counter() - t0
+    if not call["cached"] and call["prompt_tokens"] is None:
+        # stream closed before the usage came
+        call["prompt_tokens"] = estimate_tokens(prompt)
+        call["prompt_estimated"] = True
+    if not call["cached"]:
+        cache.put(call["model"], prompt, temperature, seed, reply, response_format)
+    CALLS.append(call)
+    return reply, call
+
+
+def complete(prompt, model, temperature, seed, get_pool, cache, max_attempts=4, stop_at=None,
+             response_format=None, budget=None):
+    """(reply text, call record) of `prompt`; `get_pool()` (an EndpointPool)
+    is only called on a cache miss. Every attempt is routed anew, so a retry
+    may go to another host of the model. With `stop_at`, the reply ends with
+    its first top-level JSON value (see StreamReader); `response_format` is
+    passed through (see response_format()). Raises the last API error after
+    `max_attempts`, CircuitOpen when the model's hosts are down, or
+    BudgetExhausted instead of sending a request over `budget` (a Budget;
+    cached replies are still served)."""
+    t0 = time.perf_counter()
+    call = new_call(model)
+    reply = cache.get(model, prompt, temperature, seed, response_format)
+    if reply is not None:
+        call["cached"] = True
+        return _finish(call, t0, cache, prompt, temperature, seed, reply, response_format)
+    if budget:
+        budget.spend()
+    pool = get_pool()
+    stop = stop_early(model, stop_at)
+    call["queue_s"] = 0.0
+    for attempt in range(1, max_attempts + 1):
+        call["ttft_s"] = None
+        queued = time.perf_counter()
+        try:
+            with pool.acquire(model, call) as endpoint:
+                waited = time.perf_counter() - queued
+                call["queue_s"] += waited
+                t0 += waited   # the request clock starts with the slot
+                call["endpoint"] = endpoint.url
+                started = time.perf_counter()
+                stream = endpoint.client().chat.completions.create(
+                    **request_args(prompt, model, temperature, seed, response_format),
+                    timeout=LLM_TIMEOUT)
+                reader = StreamReader(call, started, stop_at, stop)
+                for chunk in stream:
+                    if reader.feed(chunk):
+                        stream.close()
+                        break
+                    if time.perf_counter() - started > LLM_TIMEOUT:
+                        stream.close()
+                        raise TimeoutError(f"no complete reply within {LLM_TIMEOUT:.0f}s")
+                reply = reader.reply()
+        except CircuitOpen:
+            call["latency_s"] = time.perf_counter() - t0
+            CALLS.append(call)
+            raise
+        except Exception as e:
+            wait = retry_wait(attempt, max_attempts, e, pool.unavailable(model))
+            if wait is None:
+                call["latency_s"] = time.perf_counter() - t0
+                CALLS.append(call)
+                raise
+            call["retries"] += 1
+            time.sleep(wait)
+            continue
+        return _finish(call, t0, cache, prompt, temperature, seed, reply, response_format)
+
+
+async def complete_async(prompt, model, temperature, seed, get_pool, cache, limit,
+                         max_attempts=4, stop_at=None, response_format=None, budget=None):
+    """complete() on the async clients, holding the semaphore `limit` while a
+    request is in flight or waits for a slot under its host's adaptive limit
+    (not while waiting for a retry). The `budget` is checked once the
+    request has its slot, so queued requests are dropped, not sent."""
+    import asyncio
+
+    t0 = time.perf_counter()
+    call = new_call(model)
+    reply = cache.get(model, prompt, temperature, seed, response_format)
+    if reply is not None:
+        call["cached"] = True
+        return _finish(call, t0, cache, prompt, temperature, seed, reply, response_format)
+    pool = get_pool()
+    stop = stop_early(model, stop_at)
+    call["queue_s"] = 0.0
+
+    async def read(endpoint, started):
+        stream = await endpoint.async_client().chat.completions.create(
+            **request_args(prompt, model, temperature, seed, response_format))
+        reader = StreamReader(call, started, stop_at, stop)
+        async for chunk in stream:
+            if reader.feed(chunk):
+                await stream.close()
+                break
+        return reader.reply()
+
+    for attempt in range(1, max_attempts + 1):
+        call["ttft_s"] = None
+        queued = time.perf_counter()
+        try:
+            async with limit:
+                if budget and attempt == 1:
+                    budget.spend()
+                async with pool.acquire_async(model, call) as endpoint:
+                    waited = time.perf_counter() - queued
+                    call["queue_s"] += waited
+                    t0 += waited   # the request clock starts with the slot
+                    call["endpoint"] = endpoint.url
+                    # cancelled (closing the connection) when over the timeout
+                    reply = await asyncio.wait_for(read(endpoint, time.perf_counter()),
+                                                   LLM_TIMEOUT)
+        except BudgetExhausted:
+            raise
+        except CircuitOpen:
+            call["latency_s"] = time.perf_counter() - t0
+            CALLS.append(call)
+            raise
+        except Exception as e:
+            wait = retry_wait(attempt, max_attempts, e, pool.unavailable(model))
+            if wait is None:
+                call["latency_s"] = time.perf_counter() - t0
+                CALLS.append(call)
+                raise
+            call["retries"] += 1
+            await asyncio.sleep(wait)
+            continue
+        return _finish(call, t0, cache, prompt, temperature, seed, reply, response_format)
+
+
+def percentile(values, q):
+    """The q-th percentile (0-100) of `values`, linearly interpolated."""
+    values = sorted(values)
+    if not values:
+        return None
+    k = (len(values) - 1) * q / 100
+    lo = int(k)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+def stream_savings(sent):
+    """Streams stopped at the JSON end and what that saved: the mean tail
+    of the replies read to the end, times the stopped streams."""
+    stopped = sum(c["stopped"] for c in sent)
+    tails = [c for c in sent if c["tail_tokens"] is not None]
+    tail_tokens = sum(c["tail_tokens"] for c in tails) / len(tails) if tails else None
+    tail_s = sum(c["tail_s"] for c in tails) / len(tails) if tails else None
+    return {
+        "stream_stopped": stopped,
+        "tail_measured": len(tails),
+        "tail_tokens_mean": tail_tokens,
+        "tail_s_mean": tail_s,
+        "saved_tokens_est": stopped * tail_tokens if tails else None,
+        "saved_s_est": stopped * tail_s if tails else None,
+    }
+
+
+def run_summary(calls):
+    """Per-model summary of call records: latency, time-to-first-token and
+    slot-wait percentiles of the requests sent (cache hits counted apart), token
+    totals, completion tokens per second of request time, requests per
+    endpoint and the savings of stopping streams at the JSON end."""
+    summary = {}
+    for model in sorted({c["model"] for c in calls}):
+        mine = [c for c in calls if c["model"] == model]
+        sent = [c for c in mine if not c["cached"]]
+        latency = [c["latency_s"] for c in sent]
+        ttft = [c["ttft_s"] for c in sent if c["ttft_s"] is not None]
+        queue = [c["queue_s"] for c in sent if c["queue_s"] is not None]
+        with_usage = [c for c in sent if c["completion_tokens"] is not None]
+        completion = sum(c["completion_tokens"] for c in with_usage)
+        busy = sum(c["latency_s"] for c in with_usage)
+        summary[model] = {
+            "calls": len(mine),
+            "cached": len(mine) - len(sent),
+            "retries": sum(c["retries"] for c in mine),
+            "request_s": sum(latency),
+            **{f"latency_p{q}_s": percentile(latency, q) for q in (50, 95, 99)},
+            **{f"ttft_p{q}_s": percentile(ttft, q) for q in (50, 95, 99)},
+            **{f"queue_p{q}_s": percentile(queue, q) for q in (50, 95)},
+            "prompt_tokens": sum(c["prompt_tokens"] or 0 for c in sent),
+            "prompt_tokens_estimated": sum(c["prompt_estimated"] for c in sent),
+            "completion_tokens": completion,
+            "completion_tokens_per_s": completion / busy if busy > 0 else None,
+            "parse": dict(Counter(c["parse"] for c in mine)),
+            "endpoints": dict(Counter(c["endpoint"] for c in sent if c["endpoint"])),
+            **stream_savings(sent),
+        }
+        for key, value in summary[model].items():
+            if isinstance(value, float):
+                summary[model][key] = round(value, 3)
+    return summary
+
+
+def write_run_metrics(path, calls=CALLS, **run):
+    """Write the per-model summary, the decisions of the endpoints'
+    concurrency controllers (see llm_control.py) and the `run` settings to
+    `path` as JSON and print them."""
+    summary = run_summary(calls)
+    control = control_summary()
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({**run, "models": summary, "control": control}, f, indent=2)
+    for model, s in summary.items():
+        print(f"LLM calls of {model}: {s['calls']} ({s['cached']} cached, "
+              f"{s['retries']} retries), latency p50/p95/p99 {metric(s['latency_p50_s'])}/"
+              f"{metric(s['latency_p95_s'])}/{metric(s['latency_p99_s'])}s, "
+              f"TTFT p50 {metric(s['ttft_p50_s'])}s, "
+              f"{metric(s['completion_tokens_per_s'])} tokens/s")
+        if s["stream_stopped"]:
+            print(f"  {s['stream_stopped']} streams stopped at the JSON end, saving ~"
+                  f"{metric(s['saved_tokens_est'])} tokens / {metric(s['saved_s_est'])}s "
+                  f"(tail of {s['tail_measured']} replies read to the end)")
+        if len(s["endpoints"]) > 1:
+            print("  requests per endpoint: "
+                  + ", ".join(f"{url} {n}" for url, n in s["endpoints"].items()))
+    for url, c in control.items():
+        levels = ", ".join(f"{n}: {v['ttft_p50_s']}s" for n, v in c["by_in_flight"].items()
+                           if v["ttft_p50_s"] is not None) or "-"
+        print(f"  {url}: concurrency limit {c['limit_min']}–{c['limit_max']} "
+              f"(mean {c['limit_mean']}, {c['decreases']} decreases), "
+              f"circuit opened {c['circuit_opened']}x; "
+              f"TTFT p50 by requests in flight {levels}"
+              + (f" → OLLAMA_NUM_PARALLEL ≈ {c['suggested_num_parallel']}"
+                 if c["suggested_num_parallel"] else ""))
+    print(f"Run metrics → {path}")
+    return summary
@@ -0,0 +1,207 @@
+"""Adaptive concurrency and circuit breaking per Ollama endpoint.
+
+Every endpoint of the pool (llm_pool.py) has a Controller that decides how
+many requests of this process it may have in flight, from what the
+requests observe:
+
+    AIMD        the limit starts at LLM_AIMD_START (2) and grows by one
+                per limit's worth of successful requests (additive
+                increase) up to LLM_AIMD_MAX (32); a failed request, or a
+                time to first token over LLM_AIMD_TOLERANCE (2.0) times
+                the baseline (the lowest recent TTFT of the same model on
+                the endpoint, as models sharing a host differ), halves it
+                (multiplicative decrease, at most once per round trip).
+                Queueing at the server shows in the TTFT first, so the
+                limit settles near the parallelism the host really serves.
+                LLM_AIMD=off keeps the limit at LLM_AIMD_MAX.
+    breaker     LLM_BREAKER_FAILURES (5) failed attempts in a row open the
+                circuit: requests wait (together, not one backoff each)
+                for LLM_BREAKER_COOLDOWN (30s), then a single probe request
+                goes through; its success closes the circuit, its failure
+                re-opens it. Requests still in flight that fail while the
+                circuit is open are not counted again. After LLM_BREAKER_TRIPS (2) openings without a
+                success in between the endpoint counts as down and requests
+                fail at once with CircuitOpen until the next probe is due.
+
+Requests that complete are tallied by the number in flight when they were
+admitted (TTFT and latency medians per level), and every change of the
+limit or of the circuit is kept as an event; llm_client.write_run_metrics()
+writes both to the run metrics with the level that still had a TTFT
+within the tolerance of the single-request TTFT, a data point for
+OLLAMA_NUM_PARALLEL on that host.
+"""
+
+import os
+import statistics
+import time
+from collections import defaultdict, deque
+
+LLM_AIMD = os.getenv("LLM_AIMD", "on").strip().lower() != "off"
+LLM_AIMD_START = int(os.getenv("LLM_AIMD_START", "2"))
+LLM_AIMD_MAX = int(os.getenv("LLM_AIMD_MAX", "32"))
+LLM_AIMD_TOLERANCE = float(os.getenv("LLM_AIMD_TOLERANCE", "2.0"))
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+LLM_BREAKER_TRIPS = int(os.getenv("LLM_BREAKER_TRIPS", "2"))
+BACKOFF = 0.5          # multiplicative decrease of the limit
+TTFT_FLOOR = 0.05      # seconds of TTFT rise ignored as noise
+BASELINE_WINDOW = 100  # recent TTFTs the baseline is the minimum of
+
+CONTROLLERS = {}   # url -> Controller of this process
+
+
+class CircuitOpen(RuntimeError):
+    """All endpoints of a model are down (their circuits are open)."""
+
+    def __init__(self, urls, retry_after):
+        super().__init__(f"{', '.join(urls)} not answering (circuit open, next probe "
+                         f"in {retry_after:.0f}s)")
+        self.urls = urls
+        self.retry_after = retry_after
+
+
+def median(values):
+    return round(statistics.median(values), 3) if values else None
+
+
+def controller(url):
+    """The Controller of endpoint `url`, shared by the pools of the process."""
+    if url not in CONTROLLERS:
+        CONTROLLERS[url] = Controller(url)
+    return CONTROLLERS[url]
+
+
+class Controller:
+    def __init__(self, url, start=LLM_AIMD_START, max_limit=LLM_AIMD_MAX):
+        self.url = url
+        self.max_limit = max_limit
+        self.limit = float(min(start, max_limit) if LLM_AIMD else max_limit)
+        self.started = time.perf_counter()
+        self.ttfts = defaultdict(lambda: deque(maxlen=BASELINE_WINDOW))   # per model
+        self.latencies = deque(maxlen=BASELINE_WINDOW)
+        self.hold_until = 0.0   # no further decrease before (one round trip)
+        self.state = "closed"   # closed | open | half_open
+        self.failures = 0       # failed attempts in a row
+        self.trips = 0          # openings without a success in between
+        self.reopen_at = 0.0
+        self.probe_sent = False
+        self.levels = defaultdict(lambda: {"ttft": [], "latency": [], "failed": 0})
+        self.limits = []        # limit at each admission
+        self.events = []
+
+    def log(self, event, in_flight, **detail):
+        self.events.append({"t_s": round(time.perf_counter() - self.started, 3), "event": event,
+                            "limit": int(self.limit), "in_flight": in_flight, **detail})
+
+    def blocked(self, now):
+        """Seconds until the next probe while the circuit is open, else 0."""
+        return max(self.reopen_at - now, 0.0) if self.state == "open" else 0.0
+
+    def down(self, now):
+        return self.trips >= LLM_BREAKER_TRIPS and self.blocked(now) > 0
+
+    def admits(self, in_flight, now):
+        """Whether one more request may go to the endpoint now."""
+        if self.state == "open":
+            if now < self.reopen_at:
+                return False
+            self.state = "half_open"
+            self.probe_sent = False
+            self.log("half_open", in_flight)
+        if self.state == "half_open":
+            return in_flight == 0   # a single probe
+        return in_flight < int(self.limit)
+
+    def admitted(self):
+        self.limits.append(int(self.limit))
+        if self.state == "half_open":
+            self.probe_sent = True
+
+    def succeeded(self, in_flight, ttft, latency, model=None):
+        """Record a completed request of `model`, admitted at `in_flight`
+        requests."""
+        now = time.perf_counter()
+        level = self.levels[in_flight]
+        level["latency"].append(latency)
+        if ttft is not None:
+            level["ttft"].append(ttft)
+        self.latencies.append(latency)
+        self.failures = self.trips = 0
+        if self.state != "closed":
+            self.state = "closed"
+            self.log("closed", in_flight)
+            print(f"✅ {self.url} answering again, circuit closed")
+        if ttft is None:
+            return
+        ttfts = self.ttfts[model]
+        ttfts.append(ttft)
+        baseline = min(ttfts)
+        if ttft > LLM_AIMD_TOLERANCE * baseline and ttft - baseline > TTFT_FLOOR:
+            self.decrease(now, in_flight, "ttft", ttft_s=round(ttft, 3),
+                          baseline_s=round(baseline, 3))
+        elif LLM_AIMD and self.limit < self.max_limit:
+            before = int(self.limit)
+            self.limit = min(self.limit + 1 / self.limit, self.max_limit)
+            if int(self.limit) > before:
+                self.log("increase", in_flight, ttft_s=round(ttft, 3))
+
+    def failed(self, in_flight, err):
+        """Record a failed attempt (API or transport error, timeout)."""
+        now = time.perf_counter()
+        self.levels[in_flight]["failed"] += 1
+        if self.state == "open" or (self.state == "half_open" and not self.probe_sent):
+            return   # sent before the circuit opened; the trip is counted
+        self.decrease(now, in_flight, "error", error=type(err).__name__)
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= LLM_BREAKER_FAILURES:
+            self.state = "open"
+            self.trips += 1
+            self.reopen_at = now + LLM_BREAKER_COOLDOWN
+            self.log("open", in_flight, failures=self.failures, error=type(err).__name__)
+            print(f"⚠️ {self.url}: {self.failures} failed requests in a row, circuit open "
+                  f"for {LLM_BREAKER_COOLDOWN:.0f}s"
+                  + (" (endpoint down)" if self.trips >= LLM_BREAKER_TRIPS else "") + f": {err}")
+            self.failures = 0
+
+    def decrease(self, now, in_flight, reason, **detail):
+        if not LLM_AIMD or now < self.hold_until or self.limit <= 1:
+            return
+        self.limit = max(self.limit * BACKOFF, 1.0)
+        self.hold_until = now + (statistics.median(self.latencies) if self.latencies else 0.0)
+        self.log("decrease", in_flight, reason=reason, **detail)
+
+    def count(self, event):
+        return sum(e["event"] == event for e in self.events)
+
+    def summary(self):
+        """Limit history, circuit openings, TTFT/latency medians per level of
+        requests in flight and the level suggested for OLLAMA_NUM_PARALLEL."""
+        levels = {n: {"requests": len(v["latency"]), "failed": v["failed"],
+                      "ttft_p50_s": median(v["ttft"]), "latency_p50_s": median(v["latency"])}
+                  for n, v in sorted(self.levels.items())}
+        suggested = None
+        measured = [(n, v["ttft_p50_s"]) for n, v in levels.items()
+                    if v["ttft_p50_s"] is not None and v["requests"] >= 3]
+        if measured:
+            base = measured[0][1]
+            suggested = max(n for n, ttft in measured
+                            if ttft <= LLM_AIMD_TOLERANCE * base or ttft - base <= TTFT_FLOOR)
+        return {
+            "aimd": LLM_AIMD,
+            "limit": int(self.limit),
+            "limit_min": min(self.limits, default=None),
+            "limit_max": max(self.limits, default=None),
+            "limit_mean": round(statistics.mean(self.limits), 2) if self.limits else None,
+            "increases": self.count("increase"),
+            "decreases": self.count("decrease"),
+            "circuit_opened": self.count("open"),
+            "circuit": self.state,
+            "by_in_flight": levels,
+            "suggested_num_parallel": suggested,
+            "events": self.events,
+        }
+
+
+def control_summary():
+    """{url: Controller.summary()} of the endpoints that served requests."""
+    return {url: c.summary() for url, c in CONTROLLERS.items() if c.limits}
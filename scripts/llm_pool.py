@@ -0,0 +1,292 @@
+"""Pool of Ollama endpoints for the LLM scripts: model pinning, warm-up and
+queue-depth balancing.
+
+OLLAMA_URL may list several hosts, comma-separated
+(OLLAMA_URL=http://gpu1:11434,http://gpu2:11434). Loading a 70B or 120B
+model takes minutes and a host switching between models thrashes its
+VRAM, so requests for a model go to the hosts that already have it loaded
+(as reported by their /api/ps when the pool is first used, plus the hosts
+this process has sent the model to). A model loaded nowhere is pinned to
+the host with the fewest loaded models. Among the hosts of a model, each
+request goes to the one with the fewest requests of this process in
+flight (its observed queue depth), so --concurrency spreads over replicas.
+With a single URL there is nothing to choose and no host is probed.
+
+A request is only admitted to a host while its in-flight requests are
+under the adaptive limit of the host's Controller and its circuit is not
+open (see llm_control.py); otherwise acquire() waits for a slot, or raises
+CircuitOpen when every host of the model is down. The caller passes its
+call record, so the outcome of each request feeds the controller.
+
+warm_up() loads a model with a keep-alive (LLM_KEEP_ALIVE, default 30m)
+through Ollama's /api/generate, so an experiment matrix does not pay the
+load time inside its first timed request; place() assigns models to hosts
+for a matrix (run_coverage_multirun.py) or an ensemble
+(alignment_semantic.py --models), and warm_up_all() loads them together.
+
+Usage:
+    python scripts/llm_pool.py                                # hosts, loaded models
+    python scripts/llm_pool.py --warm-up gemma3:27b llama3.3:70b [--keep-alive 1h]
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from llm_control import CircuitOpen, controller
+
+DEFAULT_URL = "http://localhost:11434"
+LLM_KEEP_ALIVE = os.getenv("LLM_KEEP_ALIVE", "30m")
+PROBE_TIMEOUT = 10
+LOAD_TIMEOUT = 900   # seconds a warm-up may take to load a model
+
+
+def endpoint_urls(value=None):
+    """The base URLs listed in OLLAMA_URL (comma-separated)."""
+    value = os.getenv("OLLAMA_URL", DEFAULT_URL) if value is None else value
+    return [url.strip().rstrip("/") for url in value.split(",") if url.strip()]
+
+
+def tagged(model):
+    return model if ":" in model else model + ":latest"
+
+
+def same_model(a, b):
+    """Ollama treats "gemma3" and "gemma3:latest" as the same model."""
+    return tagged(a) == tagged(b)
+
+
+class Endpoint:
+    def __init__(self, url, api_key=None):
+        self.url = url
+        self.api_key = api_key
+        self.in_flight = 0
+        self.sent = 0
+        self.models = set()   # loaded (probed) or pinned here
+        self.control = controller(url)
+        self._client = None
+        self._async_client = None
+
+    # max_retries=0: every HTTP error reaches llm_client's retries and this
+    # endpoint's controller instead of being retried inside the SDK
+    def client(self):
+        if self._client is None:
+            from openai import OpenAI
+            self._client = OpenAI(base_url=self.url + "/v1/", api_key=self.api_key,
+                                  max_retries=0)
+        return self._client
+
+    def async_client(self):
+        if self._async_client is None:
+            from openai import AsyncOpenAI
+            self._async_client = AsyncOpenAI(base_url=self.url + "/v1/", api_key=self.api_key,
+                                             max_retries=0)
+        return self._async_client
+
+    def has(self, model):
+        return any(same_model(model, m) for m in self.models)
+
+    def api(self, path, body=None, timeout=PROBE_TIMEOUT):
+        """JSON of Ollama's native API at `path` (GET, or POST of `body`)."""
+        request = urllib.request.Request(
+            self.url + path, data=None if body is None else json.dumps(body).encode(),
+            headers={"Content-Type": "application/json",
+                     **({"Authorization": f"Bearer {self.api_key}"} if self.api_key else {})})
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return json.load(response)
+
+    def loaded_models(self):
+        """Models loaded on the host (/api/ps), or None if it cannot tell."""
+        try:
+            return [m.get("name") or m.get("model") for m in self.api("/api/ps").get("models", [])]
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Could not list the loaded models of {self.url}: {e}")
+            return None
+
+
+class EndpointPool:
+    def __init__(self, urls=None, api_key=None):
+        self.endpoints = [Endpoint(url, api_key or os.getenv("OLLAMA_API_KEY"))
+                          for url in (urls or endpoint_urls())]
+        self.lock = threading.Condition()   # notified when a request leaves
+        self.probed = len(self.endpoints) == 1
+        self._released = None   # asyncio.Event of acquire_async() waiters
+
+    def probe(self):
+        """Learn which models the hosts have loaded (once)."""
+        if self.probed:
+            return
+        self.probed = True
+        for endpoint in self.endpoints:
+            endpoint.models.update(endpoint.loaded_models() or [])
+
+    def hosts(self, model):
+        """The endpoints `model` is loaded on or pinned to; pins it to the
+        endpoint with the fewest models if there is none."""
+        self.probe()
+        hosts = [e for e in self.endpoints if e.has(model)]
+        if not hosts:
+            host = min(self.endpoints, key=lambda e: (len(e.models), e.in_flight))
+            host.models.add(model)
+            hosts = [host]
+        return hosts
+
+    def admit(self, model):
+        """(endpoint, None) for the next request of `model` (counted as in
+        flight): of the model's hosts whose controllers admit a request, the
+        one with the fewest requests in flight (then the fewest sent); or
+        (None, seconds to wait at most) when none does. Raises CircuitOpen
+        when all of them are down. Called with the lock held."""
+        now = time.perf_counter()
+        hosts = self.hosts(model)
+        ready = [e for e in hosts if e.control.admits(e.in_flight, now)]
+        if not ready:
+            if all(e.control.down(now) for e in hosts):
+                raise CircuitOpen([e.url for e in hosts],
+                                  min(e.control.blocked(now) for e in hosts))
+            waits = [e.control.blocked(now) for e in hosts if e.control.blocked(now)]
+            return None, min(waits) if waits else None
+        endpoint = min(ready, key=lambda e: (e.in_flight, e.sent))
+        endpoint.in_flight += 1
+        endpoint.sent += 1
+        endpoint.control.admitted()
+        return endpoint, None
+
+    def release(self, endpoint, level, admitted, call, err):
+        """Feed the outcome of a request to the endpoint's controller."""
+        if err is None:
+            endpoint.control.succeeded(level, call and call.get("ttft_s"),
+                                       time.perf_counter() - admitted, call and call.get("model"))
+        else:
+            endpoint.control.failed(level, err)
+        endpoint.in_flight -= 1
+        self.lock.notify_all()
+        if self._released is not None:
+            self._released.set()
+            self._released = None
+
+    @contextlib.contextmanager
+    def acquire(self, model, call=None):
+        """The endpoint for a request of `model` (see admit()), waiting for
+        a slot, counted as in flight while the block runs; an exception in
+        the block counts as a failed request, otherwise `call["ttft_s"]` and
+        the time in the block are recorded."""
+        with self.lock:
+            endpoint, wait = self.admit(model)
+            while endpoint is None:
+                self.lock.wait(wait)
+                endpoint, wait = self.admit(model)
+            level = endpoint.in_flight
+        admitted, err = time.perf_counter(), None
+        try:
+            yield endpoint
+        except Exception as e:
+            err = e
+            raise
+        finally:
+            with self.lock:
+                self.release(endpoint, level, admitted, call, err)
+
+    @contextlib.asynccontextmanager
+    async def acquire_async(self, model, call=None):
+        """acquire() for coroutines of one event loop: waits without
+        blocking the loop."""
+        import asyncio
+
+        with self.lock:
+            endpoint, wait = self.admit(model)
+        while endpoint is None:
+            self._released = self._released or asyncio.Event()
+            try:
+                await asyncio.wait_for(self._released.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+            with self.lock:
+                endpoint, wait = self.admit(model)
+        level = endpoint.in_flight
+        admitted, err = time.perf_counter(), None
+        try:
+            yield endpoint
+        except BaseException as e:
+            err = e
+            raise
+        finally:
+            with self.lock:
+                self.release(endpoint, level, admitted, call, err)
+
+    def unavailable(self, model):
+        """Whether the circuits of all hosts of `model` are open."""
+        now = time.perf_counter()
+        with self.lock:
+            return all(e.control.blocked(now) for e in self.hosts(model))
+
+    def place(self, models, replicas=1):
+        """{model: [endpoint, ...]} for an experiment matrix: a model stays on
+        the hosts it is loaded on, the others go to the hosts with the fewest
+        models, `replicas` hosts each (as far as there are hosts)."""
+        self.probe()
+        placement = {}
+        for model in models:
+            hosts = [e for e in self.endpoints if e.has(model)][:replicas]
+            for host in sorted(self.endpoints, key=lambda e: len(e.models)):
+                if len(hosts) >= min(replicas, len(self.endpoints)):
+                    break
+                if host not in hosts:
+                    hosts.append(host)
+                    host.models.add(model)
+            placement[model] = hosts
+        return placement
+
+    def warm_up(self, model, hosts=None, keep_alive=LLM_KEEP_ALIVE):
+        """Load `model` on its hosts (in parallel) and keep it for
+        `keep_alive`; returns {url: seconds, or None if the load failed}."""
+        hosts = hosts or self.hosts(model)
+
+        def load(endpoint):
+            t0 = time.perf_counter()
+            try:
+                endpoint.api("/api/generate", {"model": model, "keep_alive": keep_alive},
+                             timeout=LOAD_TIMEOUT)
+            except (OSError, ValueError) as e:
+                print(f"⚠️ Warm-up of {model} on {endpoint.url} failed: {e}")
+                return None
+            endpoint.models.add(model)
+            return time.perf_counter() - t0
+
+        with ThreadPoolExecutor(len(hosts)) as pool:
+            return dict(zip((e.url for e in hosts), pool.map(load, hosts)))
+
+    def warm_up_all(self, placement, keep_alive=LLM_KEEP_ALIVE):
+        """warm_up() of every model of `placement` (see place()) at once;
+        returns {model: {url: seconds or None}}."""
+        if not placement:
+            return {}
+        with ThreadPoolExecutor(len(placement)) as pool:
+            loads = pool.map(lambda m: self.warm_up(m, placement[m], keep_alive), placement)
+            return dict(zip(placement, loads))
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--warm-up", nargs="+", metavar="MODEL", help="models to load")
+    ap.add_argument("--keep-alive", default=LLM_KEEP_ALIVE)
+    ap.add_argument("--replicas", type=int, default=1, help="hosts to load each model on")
+    args = ap.parse_args()
+
+    pool = EndpointPool()
+    if args.warm_up:
+        for model, hosts in pool.place(args.warm_up, args.replicas).items():
+            for url, seconds in pool.warm_up(model, hosts, args.keep_alive).items():
+                if seconds is not None:
+                    print(f"✅ {model} loaded on {url} in {seconds:.1f}s "
+                          f"(keep-alive {args.keep_alive})")
+    else:
+        for endpoint in pool.endpoints:
+            models = endpoint.loaded_models()
+            print(f"  {endpoint.url:40s} "
+                  + ("unreachable" if models is None else ", ".join(models) or "(no model loaded)"))
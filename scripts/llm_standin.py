@@ -0,0 +1,382 @@
+"""Stand-in for an Ollama server: an OpenAI-compatible /v1/chat/completions
+endpoint with deterministic rule-based replies, for benchmarks and
+regression runs of the LLM scripts without a GPU.
+
+Replies depend only on (model, prompt, seed):
+
+    alignment prompts   relation from the token overlap of the two labels
+                        (identical -> exactMatch, ..., none -> unrelated)
+    batched prompts     a JSON array with one such element per pair
+    coverage prompts    coverage score from the share of requirement tokens
+                        found among the ontology term labels, those terms
+                        as matched_terms
+
+--chatter appends a markdown explanation after the JSON to a share of the
+replies, as some models do (which share is seeded by the prompt). A
+response_format JSON schema is honoured as constrained decoding would: the
+reply is compact JSON under the schema's property names, never malformed
+and without chatter.
+
+Streaming (SSE, one ~4-character token per chunk, with the usage chunk of
+stream_options.include_usage) and plain responses are supported. Latency
+is simulated as time to first token plus a per-token generation rate,
+with at most --parallel requests served at once (like
+OLLAMA_NUM_PARALLEL); --fail-rate answers a share of requests with HTTP
+503 and --malformed-rate breaks the JSON of a share of the replies (both
+seeded, to exercise retries and the repair paths).
+Like Ollama, a request for a model that is not loaded first loads it
+(--load-time), evicting the least recently used model beyond --max-loaded;
+GET /api/ps lists the loaded models and POST /api/generate without a prompt
+loads one (the warm-up of llm_pool.py). GET /stats reports the requests
+served, their tokens, the streams the client closed early, the model
+loads, the summed request time (busy_s) and the wall time with any
+request in flight (active_s).
+
+Usage:
+    python scripts/llm_standin.py --port 11435 --ttft 0.2 --token-rate 50
+    OLLAMA_URL=http://127.0.0.1:11435 python scripts/alignment_semantic.py
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def tokens(text):
+    """Lower-case word tokens, camelCase split."""
+    text = re.sub(r"([a-z])([A-Z])", r"\1 \2", text)
+    return set(re.findall(r"[a-z0-9]+", text.lower()))
+
+
+def judge_pair(aidoc_label, ref_label, h):
+    a, r = tokens(aidoc_label), tokens(ref_label)
+    overlap = len(a & r) / max(len(a | r), 1)
+    if a == r:
+        relation, confidence = "skos:exactMatch", 0.9
+    elif a < r:
+        relation, confidence = "skos:narrowMatch", 0.8
+    elif r < a:
+        relation, confidence = "skos:broadMatch", 0.8
+    elif overlap >= 0.5:
+        relation, confidence = "skos:closeMatch", 0.7
+    elif overlap > 0:
+        relation, confidence = "skos:relatedMatch", 0.6
+    else:
+        relation, confidence = "unrelated", 0.5
+    confidence = round(confidence + (h % 10) / 100, 2)
+    return {"relation": relation, "confidence": confidence,
+            "comment": f"The labels \"{aidoc_label}\" and \"{ref_label}\" share "
+                       f"{len(a & r)} of {len(a | r)} tokens."}
+
+
+def concept_labels(block):
+    labels = re.findall(r"^Label: (.*)$", block, re.M)
+    return (labels + ["", ""])[:2]
+
+
+def reply_for(prompt, h):
+    """Rule-based reply text of a prompt of the LLM scripts."""
+    if "### Pair " in prompt:
+        blocks = re.split(r"^### Pair \d+$", prompt.split("\nFor each pair:")[0], flags=re.M)[1:]
+        return json.dumps([dict(pair=k, **judge_pair(*concept_labels(b), h + k))
+                           for k, b in enumerate(blocks, 1)], indent=2)
+    if '"coverage_score"' in prompt:
+        requirement = re.search(r'AI Act requirement:\n"(.*?)"\n', prompt, re.S)
+        wanted = tokens(requirement.group(1)) if requirement else set()
+        terms = re.findall(r"^- ([^:\n]+):", prompt.split("ontology elements", 1)[-1], re.M)
+        matched = [t for t in terms if tokens(t) and tokens(t) <= wanted][:8]
+        covered = set().union(*(tokens(t) for t in matched)) if matched else set()
+        score = round(min(1.0, 3 * len(covered) / max(len(wanted), 1)), 2)
+        return json.dumps({"coverage_score": score, "matched_terms": matched,
+                           "reasoning": f"{len(matched)} ontology terms match the requirement.",
+                           "missing": []}, indent=2)
+    if "SKOS mapping relation" in prompt:
+        return json.dumps(judge_pair(*concept_labels(prompt), h), indent=2)
+    return json.dumps({"reply": "stand-in"})
+
+
+CHATTER = """
+
+**Explanation:** The decision above follows from comparing the labels and the
+descriptions of both concepts. Their wording overlaps only as far as stated, and
+no further context was available, so the score should be read as a heuristic.
+"""
+
+
+def conform(value, schema):
+    """A rule-based reply value under the property names of a JSON schema
+    (matched by position; an array reply fills an object's first property)."""
+    if schema.get("type") == "object":
+        properties = list(schema.get("properties", {}).items())
+        if isinstance(value, list):
+            name, sub = properties[0]
+            return {name: conform(value, sub)}
+        return {name: conform(v, sub) for (name, sub), v in zip(properties, value.values())}
+    if schema.get("type") == "array":
+        return [conform(v, schema.get("items", {})) for v in value]
+    return value
+
+
+def count_tokens(text):
+    # one per streamed ~4-character piece, as on Ollama
+    return max(1, -(-len(text) // 4))
+
+
+class StandIn:
+    def __init__(self, ttft=0.0, token_rate=0.0, parallel=4, fail_rate=0.0,
+                 malformed_rate=0.0, seed=0, load_time=0.0, max_loaded=0, chatter=0.0):
+        self.ttft = ttft
+        self.chatter = chatter
+        self.load_time = load_time
+        self.max_loaded = max_loaded
+        self.loaded = []   # least recently used first
+        self.loading = threading.Lock()
+        self.token_rate = token_rate
+        self.slots = threading.Semaphore(parallel)
+        self.fail_rate = fail_rate
+        self.malformed_rate = malformed_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "failed": 0, "malformed": 0, "prompt_tokens": 0,
+                      "completion_tokens": 0, "busy_s": 0.0, "active_s": 0.0,
+                      "loads": 0, "closed": 0}
+        self.in_flight = 0
+        self.active_since = None
+
+    def roll(self, rate):
+        with self.lock:
+            return self.rng.random() < rate
+
+    def count(self, **deltas):
+        with self.lock:
+            for key, value in deltas.items():
+                self.stats[key] += value
+
+    def use(self, model):
+        """Load `model` unless it is loaded (one load at a time, as on one
+        GPU); marks it most recently used."""
+        with self.loading:
+            with self.lock:
+                loaded = model in self.loaded
+            if not loaded:
+                time.sleep(self.load_time)
+            with self.lock:
+                if loaded:
+                    self.loaded.remove(model)
+                else:
+                    self.stats["loads"] += 1
+                self.loaded.append(model)
+                if self.max_loaded:
+                    del self.loaded[:-self.max_loaded]
+
+    def enter(self):
+        with self.lock:
+            if not self.in_flight:
+                self.active_since = time.perf_counter()
+            self.in_flight += 1
+
+    def leave(self):
+        """active_s: wall time with at least one request in flight."""
+        with self.lock:
+            self.in_flight -= 1
+            if not self.in_flight:
+                self.stats["active_s"] += time.perf_counter() - self.active_since
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.stats)
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    standin = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/stats":
+            self.send_json(200, self.standin.snapshot())
+        elif self.path.rstrip("/") == "/api/ps":
+            with self.standin.lock:
+                models = list(reversed(self.standin.loaded))
+            self.send_json(200, {"models": [{"name": m, "model": m} for m in models]})
+        elif self.path.rstrip("/") == "/v1/models":
+            self.send_json(200, {"object": "list", "data": [{"id": "stand-in", "object": "model"}]})
+        else:
+            self.send_json(404, {"error": {"message": f"no route {self.path}"}})
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self.path.rstrip("/") == "/api/generate" and not body.get("prompt"):
+            self.standin.use(body["model"])
+            self.send_json(200, {"model": body["model"], "response": "", "done": True,
+                                 "done_reason": "load"})
+            return
+        if self.path.rstrip("/") != "/v1/chat/completions":
+            self.send_json(404, {"error": {"message": f"no route {self.path}"}})
+            return
+        self.standin.enter()
+        try:
+            self.complete(body)
+        finally:
+            self.standin.leave()
+
+    def complete(self, body):
+        standin = self.standin
+        if standin.roll(standin.fail_rate):
+            standin.count(requests=1, failed=1)
+            self.send_json(503, {"error": {"message": "stand-in: injected failure"}})
+            return
+
+        prompt = body["messages"][-1]["content"]
+        model = body.get("model", "stand-in")
+        h = int(hashlib.sha256(f"{model}\0{body.get('seed')}\0{prompt}".encode()).hexdigest(), 16)
+        text = reply_for(prompt, h)
+        schema = ((body.get("response_format") or {}).get("json_schema") or {}).get("schema")
+        if schema:
+            text = json.dumps(conform(json.loads(text), schema))
+        elif h % 1000 < standin.chatter * 1000:
+            text += CHATTER
+        malformed = not schema and standin.roll(standin.malformed_rate)
+        if malformed:
+            # the failure mode seen in practice: unescaped quotes in free text
+            text = text.replace('\\"', '"')
+        usage = {"prompt_tokens": count_tokens(prompt), "completion_tokens": count_tokens(text)}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+
+        with standin.slots:
+            started = time.perf_counter()
+            standin.use(model)
+            time.sleep(standin.ttft)
+            closed = False
+            if body.get("stream"):
+                sent = self.stream(body, model, text, usage)
+                if sent is not None:
+                    # the client closed the stream (e.g. at the end of the JSON):
+                    # generation stops there, as on Ollama
+                    closed = True
+                    usage["completion_tokens"] = sent
+                    self.close_connection = True
+            else:
+                if standin.token_rate:
+                    time.sleep(usage["completion_tokens"] / standin.token_rate)
+                self.send_json(200, {
+                    "id": f"chatcmpl-{h % 10**12}", "object": "chat.completion",
+                    "created": int(time.time()), "model": model,
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": text}}],
+                    "usage": usage})
+            busy = time.perf_counter() - started
+        standin.count(requests=1, malformed=int(malformed), closed=int(closed), busy_s=busy,
+                      prompt_tokens=usage["prompt_tokens"],
+                      completion_tokens=usage["completion_tokens"])
+
+    def stream(self, body, model, text, usage):
+        """Send the reply as SSE chunks; None, or the tokens sent before the
+        client closed the stream."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        base = {"id": "chatcmpl-standin", "object": "chat.completion.chunk",
+                "created": int(time.time()), "model": model}
+
+        def event(payload):
+            data = f"data: {payload}\n\n".encode()
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+
+        pieces = re.findall(r".{1,4}", text, re.S)
+        per_piece = usage["completion_tokens"] / len(pieces) / self.standin.token_rate \
+            if self.standin.token_rate and pieces else 0
+        sent = 0
+        try:
+            for piece in pieces:
+                if sent and per_piece:
+                    time.sleep(per_piece)
+                event(json.dumps({**base, "choices": [{"index": 0, "delta": {"content": piece},
+                                                       "finish_reason": None}]}))
+                sent += 1
+            event(json.dumps({**base, "choices": [{"index": 0, "delta": {},
+                                                   "finish_reason": "stop"}]}))
+            if (body.get("stream_options") or {}).get("include_usage"):
+                event(json.dumps({**base, "choices": [], "usage": usage}))
+            event("[DONE]")
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+        except ConnectionError:
+            return sent
+        return None
+
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # clients exiting with an idle keep-alive connection
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+def make_server(host="127.0.0.1", port=0, **options):
+    """A threading HTTP server serving a StandIn(**options); port 0 picks a
+    free port (server.server_address)."""
+    handler = type("StandInHandler", (Handler,), {"standin": StandIn(**options)})
+    server = StandInServer((host, port), handler)
+    server.standin = handler.standin
+    return server
+
+
+def serve_in_thread(**options):
+    """Start a stand-in server in a daemon thread; returns (server, base URL
+    for OLLAMA_URL)."""
+    server = make_server(**options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address
+    return server, f"http://{host}:{port}"
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=11435)
+    ap.add_argument("--ttft", type=float, default=0.0, help="seconds to the first token")
+    ap.add_argument("--token-rate", type=float, default=0.0,
+                    help="completion tokens per second (0: reply at once)")
+    ap.add_argument("--parallel", type=int, default=4, help="requests served at once")
+    ap.add_argument("--fail-rate", type=float, default=0.0, help="share of HTTP 503 replies")
+    ap.add_argument("--malformed-rate", type=float, default=0.0,
+                    help="share of replies with broken JSON")
+    ap.add_argument("--seed", type=int, default=0, help="seed of the failure injection")
+    ap.add_argument("--chatter", type=float, default=0.0,
+                    help="share of replies with an explanation after the JSON")
+    ap.add_argument("--load-time", type=float, default=0.0, help="seconds to load a model")
+    ap.add_argument("--max-loaded", type=int, default=0,
+                    help="models kept loaded at once (0: no limit)")
+    args = ap.parse_args()
+
+    server = make_server(args.host, args.port, ttft=args.ttft, token_rate=args.token_rate,
+                         parallel=args.parallel, fail_rate=args.fail_rate,
+                         malformed_rate=args.malformed_rate, seed=args.seed,
+                         load_time=args.load_time, max_loaded=args.max_loaded,
+                         chatter=args.chatter)
+    print(f"✅ LLM stand-in serving on http://{args.host}:{args.port}/v1/ (Ctrl-C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -22,7 +22,15 @@ Configuration via environment variables (or .env):
                       reports/aidoc-entities.csv
     TEMPERATURES      comma-separated temperatures (default: "0.0,1.0")
     N_RUNS            runs per cell (default: 3)
-    OLLAMA_URL        Ollama endpoint (default: http://localhost:11434)
+    OLLAMA_URL        Ollama endpoint(s), comma-separated (default:
+                      http://localhost:11434); each model is pinned to one
+                      host (a host that already has it loaded if any) for
+                      the whole matrix, see llm_pool.py
+    LLM_KEEP_ALIVE    how long a warmed-up model stays loaded (default: 30m)
+    LLM_CACHE         on | refresh | off (default: on); replies are cached
+                      per (model, prompt, temperature, seed), so cells whose
+                      entity catalogue did not change are served from
+                      reports/cache/llm.sqlite (see llm_cache.py)
 
 Outputs:
     reports/semantic_mapping_<model>_iter<k>_T<t>_run<i>.json / .ttl  (per run)
@@ -38,6 +46,9 @@ import subprocess
 import sys
 
 from dotenv import load_dotenv
+
+from llm_pool import EndpointPool
+
 load_dotenv()
 
 MODELS = [m.strip() for m in os.getenv(
@@ -45,6 +56,8 @@ MODELS = [m.strip() for m in os.getenv(
 ITERATIONS = [it.strip() for it in os.getenv("ITERATIONS", "1,2,3").split(",") if it.strip()]
 TEMPERATURES = [t.strip() for t in os.getenv("TEMPERATURES", "0.0,1.0").split(",") if t.strip()]
 N_RUNS = int(os.getenv("N_RUNS", "3"))
+# read here, after load_dotenv(): llm_pool's default is bound at its import
+KEEP_ALIVE = os.getenv("LLM_KEEP_ALIVE", "30m")
 
 SUMMARY_FILE = "reports/coverage_multirun_summary.csv"
 SCRIPT = os.path.join(os.path.dirname(__file__), "semantic_mapping.py")
@@ -61,6 +74,23 @@ def entity_file(iteration: str) -> str:
     return f"reports/experiments/entities_iter{iteration}_gemma3_27b.csv"
 
 
+def run_tag(model, iteration, temperature, run):
+    return f"{sanitize(model)}_iter{iteration}_T{sanitize(temperature)}_run{run}"
+
+
+def run_json(model, iteration, temperature, run):
+    return f"reports/semantic_mapping_{run_tag(model, iteration, temperature, run)}.json"
+
+
+def warm_up(pool, placement, models):
+    """Load `models` on their pinned hosts, all at once."""
+    loads = pool.warm_up_all({model: placement[model] for model in models}, KEEP_ALIVE)
+    for model, seconds in loads.items():
+        for url, s in seconds.items():
+            if s is not None:
+                print(f"[warm] {model} on {url}: {s:.1f}s")
+
+
 def main():
     for it in ITERATIONS:
         if not os.path.exists(entity_file(it)):
@@ -72,19 +102,38 @@ def main():
     print(f"Experiment matrix: {len(MODELS)} models x {len(ITERATIONS)} iterations "
           f"x {len(TEMPERATURES)} temperatures x {N_RUNS} runs = {len(cells)} runs")
 
+    # pin every model to a host and load the first model of each host before
+    # the matrix starts; the cells run model by model, and each model is
+    # warmed up again right before its cells (a no-op if it is still loaded)
+    pool = EndpointPool()
+    placement = pool.place(MODELS)
+    for model, hosts in placement.items():
+        print(f"[pin ] {model} -> {', '.join(e.url for e in hosts)}")
+    pending = {m for m, it, t, i in cells if not os.path.exists(run_json(m, it, t, i))}
+    first = {}
+    for model in MODELS:
+        if model in pending:
+            first.setdefault(placement[model][0].url, model)
+    warm_up(pool, placement, list(first.values()))
+
     run_files = {}  # (model, iteration, temperature, run_idx) -> json path
+    warmed = next(iter(first.values()), None)
 
     for model, it, temp, i in cells:
-        tag = f"{sanitize(model)}_iter{it}_T{sanitize(temp)}_run{i}"
-        json_out = f"reports/semantic_mapping_{tag}.json"
+        tag = run_tag(model, it, temp, i)
+        json_out = run_json(model, it, temp, i)
         if os.path.exists(json_out):
             print(f"[skip] {json_out} already exists")
             run_files[(model, it, temp, i)] = json_out
             continue
 
+        if model != warmed:
+            warm_up(pool, placement, [model])
+            warmed = model
         env = os.environ.copy()
         env.update({
             "PYTHONUNBUFFERED": "1",
+            "OLLAMA_URL": ",".join(e.url for e in placement[model]),
             "OLLAMA_MODEL": model,
             "RUN_TAG": tag,
             "ENTITY_FILE": entity_file(it),
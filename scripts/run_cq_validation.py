@@ -27,7 +27,7 @@ import glob
 import os
 import sys
 
-from rdflib import Graph
+from graph_cache import load_graph, warm_cache
 
 CQ_DIR = "sparql_competency_questions"
 EX_DIR = "examples"
@@ -58,12 +58,11 @@ def main():
         ex_files = [f for f in ex_files
                     if os.path.basename(f).replace(".ttl", "") in selected]
     kgs = {}
+    warm_cache(ex_files)
     for f in ex_files:
         name = os.path.basename(f).replace(".ttl", "")
-        g = Graph()
         try:
-            g.parse(f, format="turtle")
-            kgs[name] = g
+            kgs[name] = load_graph(f)
         except Exception as e:
             print(f"[skip] {f}: {e}")
 
@@ -31,12 +31,16 @@ STRUCTURAL_THRESHOLD="${STRUCTURAL_THRESHOLD:-0.6}"
 
 preflight() {
     echo "== Preflight =="
-    echo "-- Ollama server: $OLLAMA_URL"
-    if ! curl -sf --connect-timeout 5 -H "Authorization: Bearer ${OLLAMA_API_KEY:-}" \
-            "$OLLAMA_URL/api/tags" > /tmp/ollama_tags.json; then
-        echo "FEHLER: Ollama-Server nicht erreichbar (VPN/FH-Netz bzw. OpenWebUI-Key prüfen)"; exit 1
-    fi
-    echo "   erreichbar."
+    # OLLAMA_URL may list several hosts (comma-separated, see scripts/llm_pool.py)
+    : > /tmp/ollama_tags.json
+    for url in ${OLLAMA_URL//,/ }; do
+        echo "-- Ollama server: $url"
+        if ! curl -sf --connect-timeout 5 -H "Authorization: Bearer ${OLLAMA_API_KEY:-}" \
+                "$url/api/tags" >> /tmp/ollama_tags.json; then
+            echo "FEHLER: Ollama-Server nicht erreichbar (VPN/FH-Netz bzw. OpenWebUI-Key prüfen)"; exit 1
+        fi
+        echo "   erreichbar."
+    done
     echo "-- Modelle:"
     for m in ${MODELS//,/ } "$ALIGNMENT_MODEL"; do
         if grep -q "\"$m\"" /tmp/ollama_tags.json; then
@@ -0,0 +1,250 @@
+"""Persistent AIDOC x reference similarity store.
+
+alignment_structural.py (pairs >= threshold) and alignment_fn_band.py (pairs
+in [0.5, 0.6)) both need the similarity of every AIDOC entity against every
+reference entity. This module scores that space once and keeps it on disk:
+
+    reports/score_store/index.json   IRI/label index arrays (AIDOC side and
+                                     per reference file), input file digests
+    reports/score_store/<stem>.npy   uint16 matrix [aidoc x reference entity]
+                                     of floor(similarity * SCALE)
+
+The matrices are opened memory-mapped, so threshold changes, band queries
+and threshold sweeps read them in milliseconds instead of rescoring. The
+quantized value only selects pairs (conservatively); pairs() re-scores the
+few selected ones from the label profiles, so its result equals a fresh
+scoring run for any threshold. sweep() counts on the 1/SCALE grid, which is
+exact for thresholds on that grid (0.6, 0.55, 0.525, ...). The store is
+rebuilt automatically when aidoc-ap.ttl, a reference TTL or the label
+normalization changes.
+
+Usage:
+    python scripts/score_store.py build [--floor 0.3] [--jobs 4]
+    python scripts/score_store.py sweep 0.5 0.55 0.6 0.65 0.7
+"""
+
+import argparse
+import json
+import math
+import os
+from pathlib import Path
+
+import numpy as np
+
+from alignment_structural import (LEFT_FILE, PROFILE_VERSION, RIGHT_FILE, ProfileCatalogue,
+                                  heap_top_k, list_declarations, load_concepts,
+                                  load_references, owned_references, profile_similarity,
+                                  score_references)
+from graph_cache import file_digest
+
+STORE_DIR = "reports/score_store"
+SCALE = 10000          # quantization step 1e-4; must fit uint16
+STORE_VERSION = 2     # bump when entity extraction changes
+
+
+def quantize(threshold):
+    """Smallest stored value that satisfies score >= threshold."""
+    return math.ceil(round(threshold * SCALE, 6))
+
+
+class ScoreStore:
+    def __init__(self, path, index):
+        self.path = path
+        self.index = index
+
+    @classmethod
+    def open(cls, path=STORE_DIR):
+        """The store at `path`, or None if there is none."""
+        index_file = os.path.join(path, "index.json")
+        if not os.path.exists(index_file):
+            return None
+        with open(index_file, encoding="utf-8") as f:
+            return cls(path, json.load(f))
+
+    @staticmethod
+    def digests(left_file, files):
+        return {"left": file_digest(left_file),
+                "references": {Path(f).stem: file_digest(f) for f in files}}
+
+    def is_current(self, left_file, files, floor=0.0):
+        return (self.index.get("version") == STORE_VERSION
+                and self.index.get("profile_version") == PROFILE_VERSION
+                and self.index.get("floor", 1.0) <= floor
+                and self.index.get("inputs") == self.digests(left_file, files))
+
+    @classmethod
+    def build(cls, left_file, files, path=STORE_DIR, floor=0.0, jobs=1):
+        """Score every AIDOC x reference pair once and write the store.
+        Pairs below `floor` are stored as 0 (lets the exact pruning skip
+        them); queries below the floor are refused."""
+        left_classes = load_concepts(left_file)
+        references = load_references(files, jobs)
+        catalogue = ProfileCatalogue()
+        scored = score_references(left_classes, references, floor,
+                                  catalogue=catalogue, jobs=jobs)
+        catalogue.save()
+
+        os.makedirs(path, exist_ok=True)
+        left_pos = {iri: i for i, iri in enumerate(left_classes)}
+        index = {
+            "version": STORE_VERSION,
+            "profile_version": PROFILE_VERSION,
+            "scale": SCALE,
+            "floor": floor,
+            "inputs": cls.digests(left_file, files),
+            "left": {"iris": list(left_classes), "labels": list(left_classes.values())},
+            "references": {},
+        }
+        for stem, right_classes in references.items():
+            right_pos = {iri: j for j, iri in enumerate(right_classes)}
+            matrix = np.zeros((len(left_classes), len(right_classes)), dtype=np.uint16)
+            for l_iri, _, r_iri, _, score in scored[stem]:
+                matrix[left_pos[l_iri], right_pos[r_iri]] = int(score * SCALE)
+            np.save(os.path.join(path, f"{stem}.npy"), matrix)
+            index["references"][stem] = {"iris": list(right_classes),
+                                         "labels": list(right_classes.values())}
+        with open(os.path.join(path, "index.json"), "w", encoding="utf-8") as f:
+            json.dump(index, f)
+        return cls(path, index)
+
+    @classmethod
+    def load_or_build(cls, left_file=LEFT_FILE, right_dir=RIGHT_FILE, path=STORE_DIR,
+                      floor=0.0, jobs=1):
+        files = sorted(Path(right_dir).glob("*.ttl"))
+        store = cls.open(path)
+        if store is None or not store.is_current(left_file, files, floor):
+            print(f"Building similarity store → {path} (floor {floor})")
+            store = cls.build(left_file, files, path, floor, jobs)
+        return store
+
+    @property
+    def left_classes(self):
+        left = self.index["left"]
+        return dict(zip(left["iris"], left["labels"]))
+
+    @property
+    def references(self):
+        """stem -> {iri: label}, in sorted file order."""
+        return {stem: dict(zip(ref["iris"], ref["labels"]))
+                for stem, ref in self.index["references"].items()}
+
+    def matrix(self, stem):
+        return np.load(os.path.join(self.path, f"{stem}.npy"), mmap_mode="r")
+
+    def _check_floor(self, low):
+        if low < self.index["floor"]:
+            raise ValueError(f"threshold {low} is below the store floor {self.index['floor']}")
+
+    def pairs(self, low, high=None, left_iris=None, catalogue=None):
+        """stem -> [(l_iri, l_label, r_iri, r_label, score)] with low <= score
+        (< high), in left-major order, exactly as score_references() would
+        return them; optionally restricted to the AIDOC entities in
+        `left_iris`."""
+        self._check_floor(low)
+        catalogue = catalogue or ProfileCatalogue()
+        left = self.index["left"]
+        rows = None
+        if left_iris is not None:
+            rows = np.array([iri in left_iris for iri in left["iris"]], dtype=bool)
+        result = {}
+        for stem, ref in self.index["references"].items():
+            m = self.matrix(stem)
+            # floor quantization is monotone: score >= low implies
+            # q >= floor(low * SCALE), score < high implies q <= floor(high * SCALE)
+            mask = m >= math.floor(low * SCALE)
+            if high is not None:
+                mask &= m <= math.floor(high * SCALE)
+            if rows is not None:
+                mask &= rows[:, None]
+            result[stem] = []
+            for i, j in zip(*np.nonzero(mask)):
+                l_label, r_label = left["labels"][i], ref["labels"][j]
+                score = profile_similarity(catalogue.get(l_label), catalogue.get(r_label))
+                if score >= low and (high is None or score < high):
+                    result[stem].append((left["iris"][i], l_label, ref["iris"][j], r_label,
+                                         score))
+        catalogue.save()
+        return result
+
+    def top_k(self, k, floor=0.0, catalogue=None):
+        """Like pairs(), but the k best matches >= floor per AIDOC entity
+        among the entities each file owns (score_references(..., top_k=k)).
+        Only entries whose quantized value reaches the row's k-th largest one
+        can be among the k best; those are re-scored exactly and ranked."""
+        self._check_floor(floor)
+        catalogue = catalogue or ProfileCatalogue()
+        left = self.index["left"]
+        references = self.references
+        owned, declared_in = owned_references(references)
+        result = {}
+        for stem, ref in self.index["references"].items():
+            m = self.matrix(stem)
+            columns = np.array([ref["iris"][j] in owned[stem]
+                                and owned[stem][ref["iris"][j]] == ref["labels"][j]
+                                for j in range(m.shape[1])], dtype=bool)
+            hits = []
+            for i in range(m.shape[0]):
+                row = np.asarray(m[i])
+                cand = np.nonzero((row >= math.floor(floor * SCALE)) & columns)[0]
+                if len(cand) > k:
+                    kth = np.partition(row[cand], -k)[-k]
+                    cand = cand[row[cand] >= kth]
+                l_label = left["labels"][i]
+                for j in cand:
+                    if ref["iris"][j] == left["iris"][i]:
+                        continue
+                    score = profile_similarity(catalogue.get(l_label),
+                                               catalogue.get(ref["labels"][j]))
+                    if score >= floor:
+                        hits.append((i, int(j), score))
+            result[stem] = [(left["iris"][i], left["labels"][i],
+                             ref["iris"][j], ref["labels"][j], score)
+                            for i, j, score in heap_top_k(hits, k)]
+        catalogue.save()
+        return list_declarations(result, self.left_classes, references, declared_in)
+
+    def sweep(self, thresholds):
+        """Candidate counts per threshold: per file and unique (aidoc, ref) pairs."""
+        left_iris = self.index["left"]["iris"]
+        rows = []
+        for t in thresholds:
+            per_file, unique = {}, set()
+            self._check_floor(t)
+            for stem, ref in self.index["references"].items():
+                ii, jj = np.nonzero(self.matrix(stem) >= quantize(t))
+                per_file[stem] = len(ii)
+                unique.update((left_iris[i], ref["iris"][j]) for i, j in zip(ii, jj))
+            rows.append({"threshold": t, "pairs": sum(per_file.values()),
+                         "unique_pairs": len(unique), "per_file": per_file})
+        return rows
+
+
+def print_sweep(rows):
+    stems = list(rows[0]["per_file"]) if rows else []
+    print(f"{'threshold':>9s} {'unique':>7s} {'pairs':>7s}  " + " ".join(f"{s:>9s}" for s in stems))
+    for r in rows:
+        print(f"{r['threshold']:>9.3f} {r['unique_pairs']:>7d} {r['pairs']:>7d}  "
+              + " ".join(f"{r['per_file'][s]:>9d}" for s in stems))
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = ap.add_subparsers(dest="command", required=True)
+    b = sub.add_parser("build", help="(re)build the store")
+    b.add_argument("--floor", type=float, default=0.0,
+                   help="store only scores >= floor (faster build, no queries below it)")
+    b.add_argument("--jobs", "-j", type=int, default=1)
+    s = sub.add_parser("sweep", help="candidate counts per threshold")
+    s.add_argument("thresholds", type=float, nargs="+")
+    for p in (b, s):
+        p.add_argument("--right", "-r", default=RIGHT_FILE)
+        p.add_argument("--left", "-l", default=LEFT_FILE)
+    args = ap.parse_args()
+
+    if args.command == "build":
+        files = sorted(Path(args.right).glob("*.ttl"))
+        store = ScoreStore.build(args.left, files, floor=args.floor, jobs=args.jobs)
+        print(f"✅ Similarity store with {len(files)} reference files → {STORE_DIR}")
+    else:
+        store = ScoreStore.load_or_build(args.left, args.right, floor=min(args.thresholds))
+        print_sweep(store.sweep(sorted(args.thresholds)))
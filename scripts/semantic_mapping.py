@@ -4,13 +4,20 @@ import json
 import re
 import datetime
 import shutil
-import time
+import sys
 from rdflib import Graph, RDF, RDFS, Namespace, URIRef, Literal
 from rdflib.namespace import XSD, SKOS, PROV
-from openai import OpenAI
 
 
 from dotenv import load_dotenv
+
+from graph_cache import load_graph
+from llm_cache import LLMCache
+from llm_client import (LLM_SCHEMA, call_fields, complete, expand_reply, response_format,
+                        write_run_metrics)
+from llm_control import CircuitOpen
+from llm_pool import EndpointPool, endpoint_urls
+
 load_dotenv()
 
 # ========== CONFIGURATION ==========
@@ -22,7 +29,8 @@ OUTPUT_FILE = "reports/semantic_mapping.ttl"
 OUTPUT_JSON = "reports/semantic_mapping.json"
 
 OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "gemma3:27b")
-OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434") + "/v1/"
+# comma-separated hosts: requests go to a host with the model loaded (see llm_pool.py)
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434")
 TEMPERATURE = float(os.getenv("LLM_TEMPERATURE", "0.0"))
 SEED = int(os.getenv("LLM_SEED", "42"))
 # Optional tag to keep outputs of separate experiment runs apart
@@ -31,13 +39,17 @@ RUN_TAG = os.getenv("RUN_TAG", "").strip()
 if RUN_TAG:
     OUTPUT_FILE = f"reports/semantic_mapping_{RUN_TAG}.ttl"
     OUTPUT_JSON = f"reports/semantic_mapping_{RUN_TAG}.json"
+# per-model latency percentiles and throughput of the run's LLM calls (kept
+# apart from the run JSONs, which the multirun aggregation globs)
+METRICS_JSON = "reports/llm_metrics/" + os.path.basename(OUTPUT_JSON)
 print(f"Using Ollama URL: {OLLAMA_URL}, Model: {OLLAMA_MODEL}, "
-      f"Temperature: {TEMPERATURE}, Seed: {SEED}, Run tag: {RUN_TAG or '(none)'}")
+      f"Temperature: {TEMPERATURE}, Seed: {SEED}, Run tag: {RUN_TAG or '(none)'}, "
+      f"Schema: {LLM_SCHEMA}")
 
-client = OpenAI(
-    base_url=OLLAMA_URL,
-    api_key=os.getenv("OLLAMA_API_KEY")
-)
+pool = EndpointPool(endpoint_urls(OLLAMA_URL))
+# replies are cached by prompt across runs and iteration cells (see llm_cache.py);
+# LLM_CACHE=off bypasses the cache
+llm_cache = LLMCache()
 
 os.makedirs("reports", exist_ok=True)
 
@@ -52,8 +64,7 @@ entity_text = "\n".join(
 )
 
 # ========== LOAD ANNEX IV REQUIREMENTS ==========
-g = Graph()
-g.parse(AIACT_FILE, format="turtle")
+g = load_graph(AIACT_FILE)
 AIACT = Namespace("https://w3id.org/aidoc-ap/requirements#")
 
 requirements = []
@@ -145,21 +156,41 @@ Return the result as strict JSON with the following structure:
 }}
 """
 
+# LLM_SCHEMA=full|compact constrains the reply to this schema (with the short
+# keys of COMPACT_KEYS for "compact"); the prompt stays the same
+COVERAGE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "coverage_score": {"type": "number", "minimum": 0, "maximum": 1},
+        "matched_terms": {"type": "array", "items": {"type": "string"}},
+        "reasoning": {"type": "string"},
+        "missing": {"type": "array", "items": {"type": "string"}},
+    },
+    "required": ["coverage_score", "matched_terms", "reasoning", "missing"],
+    "additionalProperties": False,
+}
+COMPACT_KEYS = {"coverage_score": "s", "matched_terms": "t", "reasoning": "r", "missing": "m"}
+coverage_format = response_format("coverage", COVERAGE_SCHEMA, LLM_SCHEMA, COMPACT_KEYS)
+
 # ========== RUN LLM COMPARISON ==========
-def parse_coverage_json(text):
+def parse_coverage_json(text, call=None):
     """Robustly extract the coverage result from an LLM reply.
 
     As in the alignment step, malformed JSON (unescaped quotes/newlines in the
     free-text reasoning, trailing commas) is repaired rather than retried
     (deterministic at temperature 0). Falls back to regex-extracting the scalar
     coverage_score and the list fields so a single bad character in the
-    reasoning does not discard an otherwise valid evaluation."""
+    reasoning does not discard an otherwise valid evaluation. The step that
+    succeeded is recorded as call["parse"] (see llm_client.py)."""
+    call = {} if call is None else call
     text = text.replace("```json", "").replace("```", "")
     i, j = text.find("{"), text.rfind("}")
     core = text[i:j + 1] if (i != -1 and j > i) else text
-    for candidate in (core, re.sub(r",(\s*[}\]])", r"\1", core)):
+    for path, candidate in (("json", core), ("trailing_commas", re.sub(r",(\s*[}\]])", r"\1", core))):
         try:
-            return json.loads(candidate)
+            result = json.loads(candidate)
+            call["parse"] = path
+            return result
         except Exception:
             pass
     score = re.search(r'"coverage_score"\s*:\s*([0-9]*\.?[0-9]+)', text)
@@ -171,6 +202,7 @@ def parse_coverage_json(text):
         return re.findall(r'"([^"]+)"', m.group(1)) if m else []
 
     reason = re.search(r'"reasoning"\s*:\s*"(.*?)"\s*[},]', text, re.S)
+    call["parse"] = "regex"
     return {
         "coverage_score": float(score.group(1)),
         "matched_terms": _list("matched_terms"),
@@ -184,24 +216,12 @@ def query_ollama(prompt, max_attempts=4):
     # no conversation state is carried over between requirements or runs.
     # Retry with backoff ONLY on API/transport errors; JSON parsing is handled
     # separately by parse_coverage_json and is not retried.
-    last_err = None
-    for attempt in range(1, max_attempts + 1):
-        try:
-            chat_completion = client.chat.completions.create(
-                messages=[{'role': 'user', 'content': prompt}],
-                model=OLLAMA_MODEL,
-                temperature=TEMPERATURE,
-                seed=SEED,
-            )
-        except Exception as e:
-            last_err = e
-            if attempt < max_attempts:
-                wait = 5 * 3 ** (attempt - 1)  # 5s, 15s, 45s
-                print(f"  retry {attempt}/{max_attempts - 1} after API error: {e} (waiting {wait}s)")
-                time.sleep(wait)
-            continue
-        return parse_coverage_json(chat_completion.choices[0].message.content)
-    raise last_err
+    # The stream is closed once the JSON object is complete (see llm_client.py).
+    reply, call = complete(prompt, OLLAMA_MODEL, TEMPERATURE, SEED, lambda: pool, llm_cache,
+                           max_attempts, stop_at="{", response_format=coverage_format)
+    if LLM_SCHEMA == "compact":
+        reply = expand_reply(reply, COMPACT_KEYS)
+    return parse_coverage_json(reply, call), call
 
 # Create a mapping from labels to URIs for matched terms
 label_to_uri = {}
@@ -219,8 +239,15 @@ for req in requirements:
         ontology_terms=entity_text
     )
 
+    call = {}
     try:
-        result = query_ollama(prompt)
+        result, call = query_ollama(prompt)
+    except CircuitOpen as e:
+        # scoring the remaining requirements 0 would skew the run; stop it
+        write_run_metrics(METRICS_JSON, run_tag=RUN_TAG, entity_file=ENTITY_FILE,
+                          temperature=TEMPERATURE, seed=SEED, schema=LLM_SCHEMA,
+                          requirements=len(requirements), aborted=str(e))
+        sys.exit(f"❌ Stopped at {req['label']}: {e}")
     except Exception as e:
         result = {
             "coverage_score": 0,
@@ -246,7 +273,8 @@ for req in requirements:
         "coverage_score": coverage_score,
         "matched_terms": matched_terms,
         "reasoning": reasoning,
-        "missing": missing
+        "missing": missing,
+        **call_fields(call)
     })
     print(f"Processing {req['label']}: coverage={coverage_score}")
 
@@ -310,3 +338,7 @@ if not RUN_TAG:
 with open(OUTPUT_JSON, "w", encoding="utf-8") as f:
     json.dump(results, f, indent=2, ensure_ascii=False)
 print(f"✅ Semantic mapping (JSON) saved to {OUTPUT_JSON}")
+print(llm_cache.summary())
+write_run_metrics(METRICS_JSON, run_tag=RUN_TAG, entity_file=ENTITY_FILE,
+                  temperature=TEMPERATURE, seed=SEED, schema=LLM_SCHEMA,
+                  requirements=len(requirements))